@@ -0,0 +1,103 @@
+"""Benchmark of the Modelica record writers.
+
+Writes the same synthetic snapshots of the Nordic 44 base case with
+torecord.Record and with torecord.RecordWriter, in record files, in one
+package, with array parameters and as one table, and prints the records
+written per second.
+
+    python benchmarks/records.py -n 2000
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+from nordic44.rawcase import read_raw
+from nordic44.torecord import Record, RecordWriter, Snapshot
+
+BASECASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                        "nordic44", "models", "N44_BC.raw")
+
+
+def snapshots(case, count, seed=0):
+    """Base case values with random noise, one Snapshot per hour."""
+    rng = np.random.default_rng(seed)
+    base = RecordWriter.snapshot(case)
+    for hour in range(count):
+        yield Snapshot("h" + str(hour) + "_after_PF",
+                       *[np.asarray(values)*(1 + 0.01*rng.standard_normal(
+                           len(values))) for values in base[1:]])
+
+
+def as_dicts(writer, snapshot):
+    """Snapshot as the buses, machines, loads and trafos dictionaries of
+    a Reader."""
+    def elements(names, first, second, keys):
+        return dict((name, {keys[0]: a, keys[1]: b}) for name, a, b in
+                    zip(names, first.tolist(), second.tolist()))
+    return (elements(writer.buses, snapshot.voltage, snapshot.angle,
+                     ("voltage", "angle")),
+            elements(writer.machines, snapshot.machine_p,
+                     snapshot.machine_q, ("P", "Q")),
+            elements(writer.loads, snapshot.load_p, snapshot.load_q,
+                     ("P", "Q")),
+            elements(writer.trafos, snapshot.t1, snapshot.t2, ("t1", "t2")))
+
+
+def run_record(items, workdir):
+    """Write with the Record class, one file per snapshot.
+    Args:
+        items: list of (name, buses, machines, loads, trafos)
+    """
+    for name, buses, machines, loads, trafos in items:
+        record = Record(workdir, name, buses, machines, loads, trafos)
+        record.write_voltages()
+        record.write_machines()
+        record.write_loads()
+        record.write_trafos()
+        record.close_record()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-n", "--snapshots", type=int, default=1000,
+                        help="number of snapshots")
+    args = parser.parse_args()
+
+    case = read_raw(BASECASE)
+    items = list(snapshots(case, args.snapshots))
+    writer = RecordWriter.for_case(case)
+    arrays = RecordWriter.for_case(case, arrays=True)
+    dicts = [(item.name,) + as_dicts(writer, item) for item in items]
+    workdir = tempfile.mkdtemp()
+    try:
+        runs = [("Record", lambda out: run_record(dicts, out)),
+                ("RecordWriter.write",
+                 lambda out: writer.write(out, items)),
+                ("RecordWriter.write_package",
+                 lambda out: writer.write_package(
+                     os.path.join(out, "package.mo"), "Snapshots", items)),
+                ("RecordWriter arrays",
+                 lambda out: arrays.write(out, items)),
+                ("RecordWriter.write_table",
+                 lambda out: arrays.write_table(
+                     os.path.join(out, "table.mo"), items))]
+        for name, run in runs:
+            out = os.path.join(workdir, name)
+            os.mkdir(out)
+            start = time.perf_counter()
+            run(out)
+            elapsed = time.perf_counter() - start
+            print("%-28s %8.0f records/s" % (name, len(items)/elapsed))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""Benchmark suite of the data set generation.
+
+Times every stage of the generation on synthetic market data, see
+synthetic.py, so it runs offline:
+
+- sdv.parse: parsing the weekly .sdv files of a number of years
+- excel.read, excel.write: the iTesla excel sets of a week of days
+- mapping: the vectorized mapping of a number of years
+- powerflow.hour, powerflow.batch: the native power flow of a day, hour
+  by hour and as one batch
+- pipeline.day: N44.update_raw_files of a day with the native backend,
+  excel summary and raw files
+- raw.parse: the raw files of a day with rawcase.Reader, and with the
+  PSS/E based readraw.Reader when psspy can be imported
+- raw.write: the raw files of a day with rawcase.RawTemplate
+- record.write: Modelica records of the raw files of a day with
+  torecord.Record
+
+Every benchmark runs --repeat times, the median, minimum and throughput
+are printed and the run is appended to a JSON history. The medians are
+compared with the last run in the history with the same options.
+
+    python benchmarks/suite.py --years 1 --repeat 5
+    python benchmarks/suite.py --only powerflow
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import contextlib
+import subprocess
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+from synthetic import Generator, excel_set
+from nordic44.nordpool import NordPool, read_sdv
+from nordic44.marketdata import MarketData
+from nordic44.mapping import Mapping
+from nordic44.n44 import N44
+
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       "history.json")
+
+START = date(2016, 1, 1)
+
+
+class Context(object):
+    """Inputs shared by the benchmarks, generated when first needed.
+
+    Args:
+        workdir: Temporary folder of the generated files
+        years: Number of years of the year long benchmarks
+        seed: Seed of the synthetic data
+    """
+
+    def __init__(self, workdir, years, seed=0):
+        self.workdir = workdir
+        self.years = years
+        self.generator = Generator(seed)
+        self.ndays = (date(START.year + years, START.month, START.day) -
+                      START).days
+        self._cache = dict()
+
+    def get(self, key, make):
+        """Value of a key, made once."""
+        if key not in self._cache:
+            self._cache[key] = make()
+        return self._cache[key]
+
+    def path(self, *names):
+        """Folder below the working folder, created when missing."""
+        directory = os.path.join(self.workdir, *names)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return directory
+
+    def weeks(self):
+        """Weekly files of all years."""
+        end_date = START + timedelta(self.ndays - 1)
+        return self.get("weeks", lambda: self.generator.write_weeks(
+            self.path("sdv"), START, end_date))
+
+    def excel_days(self):
+        """Excel sets of the first week."""
+        end_date = START + timedelta(6)
+        return self.get("excel", lambda: self.generator.write_excel(
+            self.path("excel"), START, end_date))
+
+    def day(self):
+        """Market data of the first day."""
+        return self.get("day", lambda: self.generator.day(START).data)
+
+    def market(self):
+        """MarketData of all years."""
+        return self.get("market", lambda: MarketData.from_nordpool(
+            self.generator.days(START, self.ndays)))
+
+    def raw_files(self):
+        """Raw files of the first day solved by the native backend."""
+        def make():
+            out_dir = self.path("raw")
+            with contextlib.redirect_stdout(io.StringIO()):
+                N44(self.day()).update_raw_files(
+                    to_excel=False, out_dir=out_dir, backend="native")
+            return sorted(os.path.join(out_dir, fname)
+                          for fname in os.listdir(out_dir)
+                          if fname.endswith(".raw"))
+        return self.get("raw", make)
+
+
+def bench_sdv_parse(context):
+    weeks = context.weeks()
+
+    def run():
+        for fname in weeks:
+            read_sdv(fname)
+    return run, len(weeks), "files"
+
+
+def bench_excel_read(context):
+    days = context.excel_days()
+
+    def run():
+        for day_dir in days:
+            NordPool(START).read_data_from_excel(*excel_set(day_dir))
+    return run, len(days), "days"
+
+
+def bench_excel_write(context):
+    days = [context.generator.day(START)]*7
+    out_dir = context.path("excel_out")
+
+    def run():
+        for nord in days:
+            nord.write_data_to_excel(out_dir)
+    return run, len(days), "days"
+
+
+def bench_mapping(context):
+    market = context.market()
+    n44 = N44(context.day())
+
+    def run():
+        Mapping.for_market(n44.ex_as_load, n44.area_info,
+                           market).setpoints(market)
+    return run, market.ndays, "days"
+
+
+def _setpoints(context):
+    """Setpoints of the first day."""
+    n44 = N44(context.day())
+    market = MarketData.from_data(START, context.day())
+    return Mapping.for_market(n44.ex_as_load, n44.area_info,
+                              market).setpoints(market)
+
+
+def bench_powerflow_hour(context):
+    from nordic44.backends import NativeBackend
+    setpoints = _setpoints(context)
+    basecase = N44(context.day()).basecase
+
+    def run():
+        backend = NativeBackend()
+        backend.open_case(basecase)
+        for hour in range(24):
+            setpoints.apply(backend, 0, hour)
+            backend.solve()
+    return run, 24, "hours"
+
+
+def bench_powerflow_batch(context):
+    from nordic44.backends import NativeBackend
+    setpoints = _setpoints(context)
+    basecase = N44(context.day()).basecase
+
+    def run():
+        backend = NativeBackend()
+        backend.open_case(basecase)
+        for hour in range(24):
+            setpoints.apply(backend, 0, hour)
+            backend.queue_hour()
+        backend.solve_queued()
+    return run, 24, "hours"
+
+
+def bench_pipeline_day(context):
+    data = context.day()
+    out_dir = context.path("pipeline")
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            N44(data).update_raw_files(out_dir=out_dir, backend="native")
+    return run, 1, "days"
+
+
+def bench_raw_parse(context):
+    from nordic44.rawcase import Reader
+    raw_files = context.raw_files()
+
+    def run():
+        for fname in raw_files:
+            reader = Reader(fname)
+            reader.open_raw(fname)
+            reader.read_raw()
+    return run, len(raw_files), "files"
+
+
+def bench_raw_write(context):
+    from nordic44.rawcase import RawTemplate, read_raw
+    cases = [read_raw(fname) for fname in context.raw_files()]
+    out_dir = context.path("raw_out")
+    names = [os.path.join(out_dir, case.name + ".raw") for case in cases]
+
+    def run():
+        template = RawTemplate(cases[0])
+        for case, fname in zip(cases, names):
+            template.write(case, fname)
+    return run, len(cases), "files"
+
+
+def bench_readraw_parse(context):
+    try:
+        from nordic44.readraw import Reader
+    except ImportError:
+        return None
+    raw_files = context.raw_files()
+
+    def run():
+        for fname in raw_files:
+            reader = Reader(fname)
+            reader.open_raw(fname)
+            reader.read_raw()
+    return run, len(raw_files), "files"
+
+
+def bench_record_write(context):
+    from nordic44.rawcase import Reader
+    from nordic44.torecord import Record
+    readers = []
+    for fname in context.raw_files():
+        reader = Reader(fname)
+        reader.open_raw(fname)
+        reader.read_raw()
+        readers.append(reader)
+    out_dir = context.path("records")
+
+    def run():
+        for reader in readers:
+            record = Record(out_dir, reader.case_name, reader.buses,
+                            reader.machines, reader.loads, reader.trafos)
+            record.write_voltages()
+            record.write_machines()
+            record.write_loads()
+            record.write_trafos()
+            record.close_record()
+    return run, len(readers), "records"
+
+
+BENCHMARKS = [("sdv.parse", bench_sdv_parse),
+              ("excel.read", bench_excel_read),
+              ("excel.write", bench_excel_write),
+              ("mapping", bench_mapping),
+              ("powerflow.hour", bench_powerflow_hour),
+              ("powerflow.batch", bench_powerflow_batch),
+              ("pipeline.day", bench_pipeline_day),
+              ("raw.parse", bench_raw_parse),
+              ("raw.write", bench_raw_write),
+              ("readraw.parse", bench_readraw_parse),
+              ("record.write", bench_record_write)]
+
+
+def measure(run, repeat):
+    """Wall times of repeated runs after one warm up run."""
+    run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def median(values):
+    """Median of a list of numbers."""
+    values = sorted(values)
+    middle = len(values)//2
+    if len(values) % 2:
+        return values[middle]
+    return 0.5*(values[middle - 1] + values[middle])
+
+
+def commit():
+    """Current git commit of the repository, None outside git."""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(fname):
+    """Runs stored in a history file."""
+    if not os.path.exists(fname):
+        return []
+    with open(fname) as history:
+        return json.load(history)
+
+
+def write_history(fname, runs):
+    """Store the runs of a history file."""
+    tmp = fname + ".tmp"
+    with open(tmp, "w") as history:
+        json.dump(runs, history, indent=1)
+    os.replace(tmp, fname)
+
+
+def run_suite(years=1, repeat=3, only=None, seed=0):
+    """Run the benchmarks.
+    Args:
+        years: Number of years of the sdv and mapping benchmarks
+        repeat: Timed runs per benchmark
+        only: Substrings of the benchmark names to run, default all
+        seed: Seed of the synthetic data
+    Output:
+        the run as a dictionary, see the history
+    """
+    workdir = tempfile.mkdtemp()
+    results = dict()
+    try:
+        context = Context(workdir, years, seed)
+        for name, bench in BENCHMARKS:
+            if only and not any(part in name for part in only):
+                continue
+            prepared = bench(context)
+            if prepared is None:
+                print("%-18s skipped" % name)
+                continue
+            run, items, unit = prepared
+            times = measure(run, repeat)
+            results[name] = {"median": median(times), "min": min(times),
+                             "repeat": repeat, "items": items, "unit": unit}
+            print("%-18s %10.4f s %12.1f %s/s" % (
+                name, results[name]["median"],
+                items/results[name]["median"], unit))
+    finally:
+        shutil.rmtree(workdir)
+    return {"time": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit(), "python": platform.python_version(),
+            "machine": platform.machine(), "platform": platform.platform(),
+            "options": {"years": years, "seed": seed},
+            "results": results}
+
+
+def compare(run, runs):
+    """Print the medians of a run relative to the last comparable run."""
+    previous = [other for other in runs
+                if other["options"] == run["options"] and
+                other["machine"] == run["machine"]]
+    if not previous:
+        return
+    last = previous[-1]
+    print("Compared with %s (%s)" % (last["time"], last["commit"]))
+    for name, result in run["results"].items():
+        old = last["results"].get(name)
+        if old:
+            print("%-18s %8.2fx" % (name, result["median"]/old["median"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--years", type=int, default=1,
+                        help="years of the sdv and mapping benchmarks")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timed runs per benchmark")
+    parser.add_argument("--only", nargs="*",
+                        help="run the benchmarks containing these names")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history", default=HISTORY,
+                        help="JSON file the runs are appended to")
+    parser.add_argument("--no-save", action="store_true",
+                        help="do not append the run to the history")
+    args = parser.parse_args()
+
+    run = run_suite(args.years, args.repeat, args.only, args.seed)
+    runs = read_history(args.history)
+    compare(run, runs)
+    if not args.no_save:
+        write_history(args.history, runs + [run])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Synthetic Nord Pool market data for the benchmarks.
+
+The hourly values of the example day examples/N44_20160101 are varied
+with a yearly and a weekly cycle and random noise, so any number of years
+can be generated offline. The days are written as weekly operating data
+files (.sdv) like the ones on the Nord Pool ftp server, named by
+nordpool.week_file, and as iTesla excel sets like write_data_to_excel,
+one N44_YYYYMMDD folder per day.
+
+    python benchmarks/synthetic.py /tmp/synthetic --years 10 --excel
+"""
+import os
+import sys
+import math
+import argparse
+from datetime import date, timedelta
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+from nordic44.nordpool import NordPool, week_file
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                       "examples", "N44_20160101")
+
+# Files of an excel set in the argument order of read_data_from_excel
+EXCEL_FILES = ["Procution_NO.xlsx", "Procution_SE.xlsx", "Procution_FI.xlsx",
+               "Consumption_NO.xlsx", "Consumption_SE.xlsx",
+               "Consumption_FI.xlsx",
+               "Exchange_NO.xlsx", "Exchange_SE.xlsx", "Exchange_FI.xlsx"]
+
+COUNTRIES = [("Norway", "NO"), ("Sweden", "SE"), ("Finland", "FI")]
+
+
+def excel_set(directory):
+    """The files of an excel set in the argument order of
+    read_data_from_excel."""
+    return [os.path.join(directory, fname) for fname in EXCEL_FILES]
+
+
+def example_data():
+    """NordPool.data of the example day."""
+    nord = NordPool(date(2016, 1, 1))
+    nord.read_data_from_excel(*excel_set(EXAMPLE))
+    return nord.data
+
+
+class Generator(object):
+    """Synthetic market data.
+
+    Every day depends only on the seed and the date, so the same day is
+    generated in any order.
+
+    Args:
+        seed: Seed of the random noise
+        noise: Relative standard deviation of the hourly noise
+        base: NordPool.data of the day to vary, default the example day
+    """
+
+    def __init__(self, seed=0, noise=0.03, base=None):
+        self.seed = seed
+        self.noise = noise
+        self.base = base if base is not None else example_data()
+
+    def day(self, day):
+        """Synthetic NordPool object of a date."""
+        rng = np.random.default_rng([self.seed, day.toordinal()])
+        # More consumption and production in winter and on weekdays
+        season = 1.0 + 0.15*math.cos(
+            2*math.pi*(day.timetuple().tm_yday - 15)/365.25)
+        week = 0.92 if day.weekday() >= 5 else 1.0
+        nord = NordPool(day)
+        for country, cc in COUNTRIES:
+            for code in nord.code:
+                factor = season*week if code in ("PS", "FB") else 1.0
+                for area, values in sorted(self.base[cc][code].items()):
+                    hourly = np.asarray(values, dtype=float)[:24]*factor*(
+                        1 + self.noise*rng.standard_normal(24))
+                    hourly = np.round(hourly)
+                    nord.add_content(country, area, code,
+                                     np.append(hourly, hourly.sum()))
+        return nord
+
+    def days(self, start_date, ndays):
+        """Synthetic NordPool objects of consecutive dates."""
+        return [self.day(start_date + timedelta(i)) for i in range(ndays)]
+
+    def week_lines(self, country, monday):
+        """Lines of the weekly operating data file of a country.
+        Args:
+            country: Norway, Sweden or Finland
+            monday: Monday of the ISO week
+        """
+        cc = dict(COUNTRIES)[country]
+        week = monday.isocalendar()[1]
+        lines = ["# Synthetic operating data " + cc,
+                 "# Code;Type;Country;Date;Weekday;Week;Area;Hours;Sum"]
+        for weekday in range(7):
+            day = monday + timedelta(weekday)
+            data = self.day(day).data[cc]
+            for code in ("PS", "FB", "UT"):
+                for area, values in data[code].items():
+                    lines.append(";".join(
+                        [code, code[0], cc, day.strftime("%d.%m.%Y"),
+                         str(weekday + 1), str(week), area] +
+                        ["%g" % value for value in values] + [""]))
+        return lines
+
+    def write_weeks(self, directory, start_date, end_date):
+        """Write the weekly files of all countries covering a date range.
+        Output:
+            list of the written files
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        monday = start_date - timedelta(start_date.weekday())
+        written = []
+        while monday <= end_date:
+            for country, _ in COUNTRIES:
+                fname = os.path.join(directory,
+                                     week_file(country, monday)[0])
+                with open(fname, "w") as sdv:
+                    sdv.write("\r\n".join(self.week_lines(country, monday)) +
+                              "\r\n")
+                written.append(fname)
+            monday += timedelta(7)
+        return written
+
+    def write_excel(self, directory, start_date, end_date):
+        """Write an excel set per day of a date range.
+        Output:
+            list of the day folders
+        """
+        written = []
+        for i in range((end_date - start_date).days + 1):
+            nord = self.day(start_date + timedelta(i))
+            day_dir = os.path.join(directory,
+                                   "N44_" + nord.date.strftime("%Y%m%d"))
+            if not os.path.isdir(day_dir):
+                os.makedirs(day_dir)
+            nord.write_data_to_excel(day_dir)
+            written.append(day_dir)
+        return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("out_dir", help="folder of the generated files")
+    parser.add_argument("--start", default="2016-01-01",
+                        help="first date, YYYY-MM-DD")
+    parser.add_argument("--years", type=int, default=1,
+                        help="number of years")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--excel", action="store_true",
+                        help="also write an excel set per day")
+    args = parser.parse_args()
+
+    start_date = date(*[int(x) for x in args.start.split("-")])
+    end_date = date(start_date.year + args.years, start_date.month,
+                    start_date.day) - timedelta(1)
+    generator = Generator(args.seed)
+    weeks = generator.write_weeks(os.path.join(args.out_dir, "sdv"),
+                                  start_date, end_date)
+    print("Wrote %d weekly files" % len(weeks))
+    if args.excel:
+        days = generator.write_excel(os.path.join(args.out_dir, "excel"),
+                                     start_date, end_date)
+        print("Wrote %d excel sets" % len(days))
+
+
+if __name__ == "__main__":
+    main()
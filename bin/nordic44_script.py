@@ -31,10 +31,35 @@ if __name__ == "__main__":
                         help="If one does not want to store the data to raw")
     parser.add_argument('-R', '--records', action="store_true",
                         help="If one wants to store the data to records")
+    parser.add_argument('--record-format', default="scalar",
+                        choices=["scalar", "array", "table"],
+                        help="Records with scalar parameters, array parameters or one table of all hours per day")
+    parser.add_argument('--backend', default="psse",
+                        choices=["psse", "native"],
+                        help="Power flow backend, default is psse")
+    parser.add_argument('--batch', action="store_true",
+                        help="Solve the hours of a day together, all from the base case instead of the previous hour, needs the native backend")
+    parser.add_argument('-w', '--workers', type=int,
+                        help="Number of processes working on dates in parallel")
+    parser.add_argument('--cache-dir', nargs=1,
+                        help="Folder where downloaded Nordpool files are cached")
+    parser.add_argument('--offline', action="store_true",
+                        help="Only use files from the cache")
+    parser.add_argument('--only-failed', action="store_true",
+                        help="Rerun only the hours and days that failed in out_dir")
+    parser.add_argument('--snapshot-dir', nargs=1,
+                        help="Folder of a snapshot store receiving every solved hour")
+    parser.add_argument('--raw-archive', nargs=1,
+                        help="Folder of an archive storing the raw files as differences to the base case")
+    parser.add_argument('--trace', nargs=1,
+                        help="Append the timing of every stage to this json lines file, see python -m nordic44.trace")
     args = parser.parse_args()
     
     start_date = parse_date(args.start_date)
     
+    # No login is needed in offline mode
+    user = None
+    passwd = None
     if args.user:
         user = args.user[0]
     if args.passwd:
@@ -50,4 +75,13 @@ if __name__ == "__main__":
     
     utilities.data_from_nordpool(start_date=start_date, user=user, passwd=passwd,
                        out_dir=out_dir, psse=not args.no_psse,
-                       end_date=end_date,records=args.records)
+                       end_date=end_date,records=args.records,
+                       record_format=args.record_format,
+                       backend=args.backend, batch=args.batch,
+                       workers=args.workers,
+                       cache_dir=args.cache_dir[0] if args.cache_dir else None,
+                       offline=args.offline,
+                       snapshot_dir=args.snapshot_dir[0] if args.snapshot_dir else None,
+                       only_failed=args.only_failed,
+                       trace_file=args.trace[0] if args.trace else None,
+                       raw_archive=args.raw_archive[0] if args.raw_archive else None)
@@ -0,0 +1,211 @@
+"""Year-partitioned archive of Nordpool market data.
+
+A year of MarketData is stored in one compressed npz file holding the
+values of the days present, their dates as ordinals and the series names.
+index.json lists the years with their first and last date, so a range
+query only opens the years it covers. import_excel_set converts the nine
+iTesla format excel files of a day, as written by
+NordPool.write_data_to_excel, into the archive.
+"""
+import os
+import json
+import tempfile
+from datetime import datetime
+import numpy as np
+from nordic44.marketdata import MarketData, CODES
+
+# Excel file prefixes of the codes, Procution is the spelling used by
+# NordPool.write_data_to_excel
+EXCEL_NAMES = {"PS": ["Procution", "Production"],
+               "FB": ["Consumption"],
+               "UT": ["Exchange"]}
+
+
+class MarketArchive(object):
+    """Market data stored per year under a directory.
+
+    Args:
+        directory: Folder of the archive, created when missing
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.index_fname = os.path.join(directory, "index.json")
+
+    def read_index(self):
+        """Dictionary from year to first date, last date and day count."""
+        if not os.path.exists(self.index_fname):
+            return dict()
+        with open(self.index_fname) as index:
+            return json.load(index)
+
+    def year_fname(self, year):
+        """File of a year."""
+        return os.path.join(self.directory, "market_" + str(year) + ".npz")
+
+    def read_year(self, year):
+        """Stored days of a year.
+        Output:
+            (ordinals, names, values) with values indexed by
+            (day, hour, code, series), None if the year is not stored
+        """
+        fname = self.year_fname(year)
+        if not os.path.exists(fname):
+            return None
+        with np.load(fname) as stored:
+            return (stored["dates"], list(stored["names"]),
+                    stored["values"])
+
+    def write(self, market):
+        """Add the days of a container, replacing stored days.
+        Args:
+            market: MarketData
+        """
+        dates = market.dates()
+        index = self.read_index()
+        for year in sorted(set(date.year for date in dates)):
+            days = [day for day, date in enumerate(dates)
+                    if date.year == year]
+            ordinals = np.array([dates[day].toordinal() for day in days])
+            names = list(market.names)
+            stored = self.read_year(year)
+            if stored is not None:
+                old_ordinals, old_names, old_values = stored
+                names.extend(name for name in old_names
+                             if name not in market.index)
+                keep = ~np.isin(old_ordinals, ordinals)
+                ordinals = np.concatenate([old_ordinals[keep], ordinals])
+            columns = market.series(market.names)
+            values = np.full((len(ordinals),) + market.values.shape[1:3] +
+                             (len(names),), np.nan)
+            position = dict((name, s) for s, name in enumerate(names))
+            if stored is not None:
+                old_columns = np.array([position[name]
+                                        for name in old_names])
+                nkeep = keep.sum()
+                values[:nkeep][:, :, :, old_columns] = old_values[keep]
+            else:
+                nkeep = 0
+            values[nkeep:, :, :, columns] = market.values[days]
+            order = np.argsort(ordinals)
+            self._save(year, ordinals[order], names, values[order])
+            index[str(year)] = {
+                "first": _from_ordinal(ordinals.min()),
+                "last": _from_ordinal(ordinals.max()),
+                "days": len(ordinals)}
+        self._replace(self.index_fname,
+                      json.dumps(index, indent=1, sort_keys=True).encode())
+
+    def read(self, start_date, end_date=None):
+        """Market data of a date range.
+
+        Only the years covering the range are opened, days that are not
+        stored are missing (NaN).
+        Args:
+            start_date: First date
+            end_date: Last date, default start_date
+        Output:
+            MarketData
+        """
+        if end_date is None:
+            end_date = start_date
+        first = start_date.toordinal()
+        last = end_date.toordinal()
+        index = self.read_index()
+        parts = []
+        for year in range(start_date.year, end_date.year + 1):
+            if str(year) not in index:
+                continue
+            ordinals, names, values = self.read_year(year)
+            lo, hi = np.searchsorted(ordinals, [first, last + 1])
+            parts.append((ordinals[lo:hi], names, values[lo:hi]))
+
+        names = []
+        for _, part_names, _ in parts:
+            names.extend(name for name in part_names if name not in names)
+        market = MarketData.empty(start_date, last - first + 1, names)
+        for ordinals, part_names, values in parts:
+            columns = market.series(part_names)
+            for row, ordinal in zip(values, ordinals):
+                market.values[ordinal - first][:, :, columns] = row
+        return market
+
+    def dates(self):
+        """All stored dates."""
+        dates = []
+        for year in sorted(self.read_index(), key=int):
+            dates.extend(datetime.fromordinal(int(ordinal))
+                         for ordinal in self.read_year(int(year))[0])
+        return dates
+
+    def _save(self, year, ordinals, names, values):
+        """Write the npz file of a year."""
+        handle, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, "wb") as out:
+            np.savez_compressed(out, dates=ordinals, names=np.array(names),
+                                values=values)
+        os.replace(tmp, self.year_fname(year))
+
+    def _replace(self, fname, data):
+        """Write a file atomically."""
+        handle, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, "wb") as out:
+            out.write(data)
+        os.replace(tmp, fname)
+
+
+def _from_ordinal(ordinal):
+    """ISO date string of an ordinal."""
+    return datetime.fromordinal(int(ordinal)).strftime("%Y-%m-%d")
+
+
+def read_excel_set(directory, cache_dir=None):
+    """Read the nine iTesla format excel files of a day.
+    Args:
+        directory: Folder with the files, e.g. examples/N44_20160101
+        cache_dir: Folder memoizing the parsed files, see SheetCache
+    Output:
+        MarketData with one day
+    """
+    from nordic44.nordpool import read_sheets
+    keys = []
+    fnames = []
+    for cc in ["NO", "SE", "FI"]:
+        for code in CODES:
+            for name in EXCEL_NAMES[code]:
+                fname = os.path.join(directory, name + "_" + cc + ".xlsx")
+                if os.path.exists(fname):
+                    break
+            else:
+                raise IOError("No " + code + " file for " + cc + " in " +
+                              directory)
+            keys.append((cc, code))
+            fnames.append(fname)
+    data = dict()
+    date = None
+    for (cc, code), (date, columns) in zip(keys,
+                                           read_sheets(fnames, cache_dir)):
+        data.setdefault(cc, dict())[code] = columns
+    if not isinstance(date, datetime):
+        # Fall back to the folder name N44_YYYYMMDD
+        date = datetime.strptime(
+            os.path.basename(os.path.normpath(directory))[-8:], "%Y%m%d")
+    return MarketData.from_data(date, data)
+
+
+def import_excel_set(directory, archive, cache_dir=None):
+    """Convert an iTesla format excel set into an archive.
+    Args:
+        directory: Folder with the nine excel files of a day
+        archive: MarketArchive or its directory
+        cache_dir: Folder memoizing the parsed files, see SheetCache
+    Output:
+        The imported MarketData
+    """
+    if not isinstance(archive, MarketArchive):
+        archive = MarketArchive(archive)
+    market = read_excel_set(directory, cache_dir)
+    archive.write(market)
+    return market
@@ -0,0 +1,251 @@
+"""Concurrent download of the weekly Nordpool files with asyncio.
+
+FtpFetcher downloads the weekly file of one country after the other, so
+the latency of the server adds up over three countries and many weeks.
+fetch_weeks downloads all files of a date range at once over a bounded
+number of ftp sessions. Every session is a small ftp client on asyncio
+streams (login, cwd, passive mode and RETR), taking the next file from a
+shared queue. The lines are parsed by split_weekdays as they arrive.
+
+A session that fails with a temporary error (connection lost, timeout, 4xx
+replies) is logged in again after a backoff of backoff, 2*backoff, ...
+seconds. Files that still fail are left out of the result, FtpFetcher then
+downloads them on its own and reports the error as before.
+"""
+import ftplib
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from nordic44.nordpool import iter_sdv
+
+# Errors after which a session logs in again and retries the file
+TEMPORARY_ERRORS = (EOFError, OSError, asyncio.TimeoutError,
+                    ftplib.error_temp, ftplib.error_reply, ftplib.error_proto)
+
+
+class AsyncFtpSession(object):
+    """Ftp session on asyncio streams.
+
+    Args:
+        host: The ftp server
+        port: Port of the server
+        user: The user name for the server
+        passwd: The password for the server
+        timeout: Seconds to wait for a reply or a line of data
+        encoding: Encoding of the text files and commands
+    """
+
+    def __init__(self, host, port, user, passwd, timeout=60,
+                 encoding="utf-8"):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.passwd = passwd
+        self.timeout = timeout
+        self.encoding = encoding
+        self.reader = None
+        self.writer = None
+
+    async def readline(self, reader):
+        """Next line of a stream, empty at its end."""
+        line = await asyncio.wait_for(reader.readline(), self.timeout)
+        return line.decode(self.encoding)
+
+    async def reply(self):
+        """Read a reply of the server, multi line replies included.
+        Output:
+            the reply, raising ftplib errors like ftplib.FTP
+        """
+        line = await self.readline(self.reader)
+        if not line:
+            raise EOFError("Connection closed by " + self.host)
+        text = line.rstrip("\r\n")
+        if text[3:4] == "-":
+            code = text[:3]
+            while not (line[:3] == code and line[3:4] == " "):
+                line = await self.readline(self.reader)
+                if not line:
+                    raise EOFError("Connection closed by " + self.host)
+                text += "\n" + line.rstrip("\r\n")
+        if text[:1] == "4":
+            raise ftplib.error_temp(text)
+        if text[:1] == "5":
+            raise ftplib.error_perm(text)
+        if text[:1] not in "123":
+            raise ftplib.error_proto(text)
+        return text
+
+    async def command(self, cmd, expect="2"):
+        """Send a command and read its reply.
+        Args:
+            cmd: The command, e.g. CWD Norway
+            expect: First digit of a successful reply
+        """
+        self.writer.write((cmd + "\r\n").encode(self.encoding))
+        await self.writer.drain()
+        text = await self.reply()
+        if expect and text[:1] != expect:
+            raise ftplib.error_reply(text)
+        return text
+
+    async def connect(self, folder="Operating_data"):
+        """Log in and change to the folder of the operating data."""
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        await self.reply()
+        reply = await self.command("USER " + (self.user or "anonymous"),
+                                   expect="")
+        if reply[:1] == "3":
+            await self.command("PASS " + (self.passwd or ""))
+        await self.command("CWD " + folder)
+
+    async def passive(self):
+        """Open a passive mode data connection.
+
+        Like ftplib the address in the PASV reply is ignored and the data
+        connection goes to the host of the control connection.
+        """
+        text = await self.command("PASV")
+        numbers = text[text.index("(") + 1:text.index(")")].split(",")
+        port = int(numbers[4])*256 + int(numbers[5])
+        host = self.writer.get_extra_info("peername")[0]
+        return await asyncio.wait_for(asyncio.open_connection(host, port),
+                                      self.timeout)
+
+    async def retrieve(self, fname, folders, handle_line):
+        """Stream the lines of a text file to a callback.
+        Args:
+            fname: Name of the file
+            folders: Folders below Operating_data
+            handle_line: Called with every line without line ending
+        """
+        for folder in folders:
+            await self.command("CWD " + folder)
+        await self.command("TYPE A")
+        reader, writer = await self.passive()
+        try:
+            await self.command("RETR " + fname, expect="1")
+            while True:
+                line = await self.readline(reader)
+                if not line:
+                    break
+                handle_line(line.rstrip("\r\n"))
+        finally:
+            writer.close()
+        await self.reply()
+        if folders:
+            await self.command("CWD " + "/".join([".."]*len(folders)))
+
+    def close(self):
+        """Close the control connection."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+async def _download(session, fname, folders, codes, keep_lines):
+    """Download and parse one weekly file.
+    Output:
+        (split_weekdays of the file, list of lines or None)
+    """
+    days = dict()
+    lines = [] if keep_lines else None
+
+    def handle_line(line):
+        if keep_lines:
+            lines.append(line)
+        for weekday, code, area, values in iter_sdv([line], codes):
+            days.setdefault(weekday, []).append((code, area, values))
+
+    await session.retrieve(fname, folders, handle_line)
+    return days, lines
+
+
+async def _worker(queue, results, errors, connect, codes, keep_lines,
+                  retries, backoff):
+    """Download files from the queue over one session."""
+    session = None
+    try:
+        while True:
+            try:
+                key, fname, folders = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            for attempt in range(retries + 1):
+                try:
+                    if session is None:
+                        session = connect()
+                        await session.connect()
+                    results[key] = await _download(session, fname, folders,
+                                                   codes, keep_lines)
+                    break
+                except (ftplib.error_perm,) + TEMPORARY_ERRORS as error:
+                    errors[key] = error
+                    # The session may be left in another folder
+                    if session is not None:
+                        session.close()
+                        session = None
+                    # Missing files and refused logins are not retried
+                    if isinstance(error, ftplib.error_perm):
+                        break
+                    if attempt < retries:
+                        await asyncio.sleep(backoff*2**attempt)
+            if key in results:
+                errors.pop(key, None)
+    finally:
+        if session is not None:
+            session.close()
+
+
+async def fetch_weeks_async(files, host, user, passwd, port=21, parallel=3,
+                            retries=3, backoff=0.5, codes=("PS", "FB", "UT"),
+                            keep_lines=False, timeout=60):
+    """Coroutine of fetch_weeks."""
+    queue = asyncio.Queue()
+    for entry in files:
+        queue.put_nowait(entry)
+    results = dict()
+    errors = dict()
+
+    def connect():
+        return AsyncFtpSession(host, port, user, passwd, timeout=timeout)
+
+    workers = [_worker(queue, results, errors, connect, codes, keep_lines,
+                       retries, backoff)
+               for _ in range(max(1, min(parallel, len(files))))]
+    await asyncio.gather(*workers)
+    return results, errors
+
+
+def fetch_weeks(files, host, user, passwd, port=21, parallel=3, retries=3,
+                backoff=0.5, codes=("PS", "FB", "UT"), keep_lines=False,
+                timeout=60):
+    """Download and parse weekly files concurrently.
+    Args:
+        files: list of (key, file name, folders below Operating_data)
+        host, port: The ftp server
+        user, passwd: Login of the server
+        parallel: Number of ftp sessions at most
+        retries: Retries of a file after temporary errors
+        backoff: Seconds before the first retry, doubled for every retry
+        codes: NordPool codes to keep, see split_weekdays
+        keep_lines: Also give the lines of the files, e.g. for a cache
+        timeout: Seconds to wait for a reply or a line of data
+    Output:
+        (results, errors), results maps the key of every downloaded file to
+        (split_weekdays of the file, list of lines or None) and errors the
+        key of every failed file to its last error
+    """
+    def run():
+        return asyncio.run(fetch_weeks_async(
+            files, host, user, passwd, port=port, parallel=parallel,
+            retries=retries, backoff=backoff, codes=codes,
+            keep_lines=keep_lines, timeout=timeout))
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return run()
+    # asyncio.run fails inside a running event loop, e.g. in Jupyter, so the
+    # downloads get their own loop in a worker thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(run).result()
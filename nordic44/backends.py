@@ -0,0 +1,478 @@
+"""Power flow backends used by N44.update_raw_files.
+
+A backend holds the working case and implements the handful of operations
+the mapping needs: changing loads, area data and area totals, solving the
+power flow and exporting raw files. PsseBackend drives PSS/E through psspy,
+NativeBackend uses nordic44.rawcase and nordic44.powerflow and runs
+anywhere NumPy and SciPy are available.
+
+Raw files are written straight to their final names, nothing is written to
+fixed names in the working directory, so several runs can share it. The
+native backend can also defer them: write_raw with defer keeps an in-memory
+snapshot of the case and flush_raw writes all of them at the end of a day.
+Its raw files are patched into a template of the case, see
+rawcase.RawTemplate.
+"""
+import os
+import tempfile
+import numpy as np
+
+
+class PsseBackend(object):
+    """Backend running the power flow in PSS/E."""
+
+    # PSS/E is initialized once per process, later days only load the case
+    started = False
+
+    def __init__(self):
+        # I know there should be no imports here,
+        # but it is a simple hack to run under linux
+        import psspy
+        import redirect
+        self.psspy = psspy
+        redirect.psse2py()
+        psspy.throwPsseExceptions = True
+        self.last_raw = None
+
+    def open_case(self, basecase):
+        """Initialize PSS/E and load the base case.
+        Args:
+            basecase: PSS/E saved case
+        """
+        if not PsseBackend.started:
+            nbuses = 50000  # max no of buses
+            self.psspy.psseinit(nbuses)
+            PsseBackend.started = True
+        self.psspy.case(basecase)
+
+    def change_load(self, bus, load_id, p, q):
+        """Set the constant power of a load."""
+        self.psspy.load_chng_4(bus, load_id, realar1=p, realar2=q)
+
+    def area_data(self, number, swing_bus, interchange, name):
+        """Set the area swing bus and desired interchange."""
+        self.psspy.area_data(number, swing_bus, realar1=interchange,
+                             arname=name)
+
+    def scale_area(self, number, prod, con, qcon):
+        """Scale area load and generation to new totals with scal_2."""
+        self.psspy.bsys(sid=0, numarea=1, areas=[number])
+        self.psspy.scal_2(0, 0, 0,
+                          [0, 1, 1, 1, 0],
+                          [con, prod,
+                           0.0, 0.0, 0.0, 0.0,
+                           qcon])
+
+    def scale_areas(self, numbers, prod, con, qcon):
+        """Scale the areas one by one with scal_2.
+        Output:
+            None, PSS/E does not report the production it cannot place
+        """
+        for number, area_prod, area_con, area_qcon in zip(numbers, prod, con,
+                                                          qcon):
+            self.scale_area(number, area_prod, area_con, area_qcon)
+        return None
+
+    def write_raw(self, fname, defer=False):
+        """Export the working case to a raw file.
+        Args:
+            fname: Name of the raw file
+            defer: Ignored, the case only lives in the PSS/E session so the
+                file is always written at once
+        """
+        self.psspy.rawd_2(0, 1, [0, 0, 1, 0, 0, 0, 0], 0, fname)
+        self.last_raw = fname
+
+    def flush_raw(self):
+        """All raw files are already written.
+        Output:
+            empty list
+        """
+        return []
+
+    def solved_case(self):
+        """The solved case read back with the native reader.
+
+        The raw file of the solution is used when it was written, otherwise
+        the case is exported to a temporary file.
+        Output:
+            (RawCase, None), there is no native power flow result
+        """
+        from nordic44.rawcase import read_raw
+        if self.last_raw is not None:
+            return read_raw(self.last_raw), None
+        handle, fname = tempfile.mkstemp(suffix=".raw")
+        os.close(handle)
+        try:
+            self.psspy.rawd_2(0, 1, [0, 0, 1, 0, 0, 0, 0], 0, fname)
+            return read_raw(fname), None
+        finally:
+            os.remove(fname)
+
+    def solve(self):
+        """Solve the power flow.
+        Output:
+            PSS/E solution flag, 0 if converged
+        """
+        self.psspy.fnsl([1, 2, 0, 0, 1, 0, 0, 0])
+        self.last_raw = None
+        return self.psspy.solved()
+
+    def load_solution(self, fname):
+        """Make a solved raw file of an earlier run the working case, the
+        next hour starts from it."""
+        self.psspy.read(0, fname)
+        self.last_raw = None
+
+    def solve_info(self):
+        """Iterations and mismatch in MVA of the last solution."""
+        return {"iterations": self.psspy.iterat(),
+                "mismatch": abs(self.psspy.sysmsm())}
+
+    def store_solution(self, out_dir):
+        """The solution already is the working case of PSS/E, the next hour
+        starts from it without saving and reloading the case."""
+        pass
+
+    def area_results(self, numbers):
+        """Area generation, load and net interchange after the solution.
+        Args:
+            numbers: area numbers
+        Output:
+            (generation, load, interchange) lists in MW
+        """
+        gen = [self.psspy.ardat(number, 'GEN')[1].real for number in numbers]
+        load = [self.psspy.ardat(number, 'LOAD')[1].real
+                for number in numbers]
+        _, intch = self.psspy.aareareal(-1, 1, 'PINT')
+        return gen, load, [value.real for value in intch[0]]
+
+    def limit_data(self):
+        """Quantities needed for the limit checks.
+        Output:
+            dict of lists keyed by the PSS/E quantity names
+        """
+        data = {}
+        _, busvoltages = self.psspy.abusreal(sid=-1, string="PU")
+        data["PU"] = busvoltages[0]
+        for string in ["PGEN", "PMAX", "PMIN", "QGEN", "QMAX", "QMIN",
+                       "MVA", "MBASE"]:
+            _, values = self.psspy.amachreal(sid=-1, string=string)
+            data[string] = values[0]
+        for string in ["PCTCORPRATEA", "PCTCORPRATEB", "PCTCORPRATEC"]:
+            _, values = self.psspy.aflowreal(sid=-1, string=string)
+            data[string] = values[0]
+        return data
+
+    def element_names(self):
+        """Names of the elements of limit_data.
+        Output:
+            dict of lists for buses, machines (bus_id) and branches
+            (frombus_tobus_ckt)
+        """
+        _, buses = self.psspy.abusint(sid=-1, string="NUMBER")
+        _, machine_buses = self.psspy.amachint(sid=-1, string="NUMBER")
+        _, machine_ids = self.psspy.amachchar(sid=-1, string="ID")
+        _, ends = self.psspy.aflowint(sid=-1,
+                                      string=["FROMNUMBER", "TONUMBER"])
+        _, branch_ids = self.psspy.aflowchar(sid=-1, string="ID")
+        return {"buses": [str(bus) for bus in buses[0]],
+                "machines": [str(bus) + "_" + mid.strip() for bus, mid in
+                             zip(machine_buses[0], machine_ids[0])],
+                "branches": [str(i) + "_" + str(j) + "_" + ckt.strip()
+                             for i, j, ckt in zip(ends[0], ends[1],
+                                                  branch_ids[0])]}
+
+    def warm_start(self, v0):
+        """PSS/E always starts from the voltages of the working case."""
+        pass
+
+    def last_voltage(self):
+        """The voltages stay in the PSS/E working case."""
+        return None
+
+    def cleanup(self, out_dir):
+        """Close the power flow."""
+        self.psspy.close_powerflow()
+
+
+class NativeBackend(object):
+    """Backend using the native raw reader and power flow."""
+
+    def __init__(self, chunk=24, **options):
+        self.options = options
+        self.chunk = chunk
+        self.case = None
+        self.powerflow = None
+        self.result = None
+        self.voltage = None
+        self.queue = []
+        self.batch = None
+        self.names = None
+        self.pending = []
+        self.scaling = None
+        self.template = None
+
+    def open_case(self, basecase):
+        """Load the base case and its network from the compiled case, see
+        nordic44.compiled.
+        Args:
+            basecase: PSS/E raw file, for a saved case the raw file with the
+                same name is used
+        """
+        # I know there should be no imports here,
+        # but PSS/E users do not need scipy
+        from nordic44.compiled import load_case
+        from nordic44.powerflow import PowerFlow
+        if basecase.endswith(".sav"):
+            basecase = os.path.splitext(basecase)[0] + ".raw"
+        self.case, network = load_case(basecase)
+        self.powerflow = PowerFlow(self.case, network=network,
+                                   **self.options)
+        self.queue = []
+        self.pending = []
+        self.scaling = None
+        self.template = None
+
+    def change_load(self, bus, load_id, p, q):
+        """Set the constant power of a load."""
+        load = self.case.load
+        row = (load["bus"] == bus) & (load["id"] == str(load_id).strip())
+        assert row.any(), "Load %s at bus %s not found" % (load_id, bus)
+        load["pl"][row] = p
+        load["ql"][row] = q
+
+    def area_data(self, number, swing_bus, interchange, name):
+        """Set the area swing bus and desired interchange."""
+        area = self.case.area
+        row = area["number"] == number
+        assert row.any(), "Area %s not found" % number
+        area["isw"][row] = swing_bus
+        area["pdes"][row] = interchange
+        area["name"][row] = name
+
+    def scale_area(self, number, prod, con, qcon):
+        """Scale area load and generation to new totals like scal_2, see
+        scale_areas."""
+        return self.scale_areas([number], [prod], [con], [qcon])[0]
+
+    def scale_areas(self, numbers, prod, con, qcon):
+        """Scale the loads and machines of areas to new totals like scal_2,
+        see scaling.AreaScaling.
+        Args:
+            numbers: area numbers
+            prod, con, qcon: production, consumption and reactive
+                consumption of every area
+        Output:
+            production of every area that could not be placed within the
+            machine limits, in MW
+        """
+        from nordic44.scaling import AreaScaling
+        numbers = list(numbers)
+        if self.scaling is None or self.scaling.numbers.tolist() != numbers:
+            self.scaling = AreaScaling(self.case, numbers)
+        case = self.case
+        pload, qload, pgen, unplaced = self.scaling.scale(
+            prod, con, qcon, case.load["pl"], case.load["ql"],
+            case.generator["pg"])
+        case.load["pl"] = pload[0]
+        case.load["ql"] = qload[0]
+        case.generator["pg"] = pgen[0]
+        return unplaced[0]
+
+    def snapshot(self):
+        """Copy of the working case in memory, see RawCase.snapshot."""
+        return self.case.snapshot()
+
+    def restore(self, state):
+        """Bring the working case back to a snapshot, the network is built
+        again for its transformer ratios."""
+        self.case.restore(state)
+        self.powerflow.network.build()
+
+    def write_raw(self, fname, defer=False):
+        """Write the working case to a raw file.
+        Args:
+            fname: Name of the raw file
+            defer: Only keep a snapshot of the case, the file is written by
+                flush_raw
+        """
+        if defer:
+            self.pending.append((fname, self.case.snapshot()))
+            return
+        self._write(self.case, fname)
+
+    def _write(self, case, fname):
+        """Write a case with the raw template of the working case, only the
+        changed loads, machines, voltages, ratios and interchanges are
+        formatted, see rawcase.RawTemplate."""
+        from nordic44.rawcase import RawTemplate
+        if self.template is None:
+            self.template = RawTemplate(case)
+        self.template.write(case, fname)
+
+    def flush_raw(self):
+        """Write the deferred raw files.
+        Output:
+            list of the written files
+        """
+        written = []
+        for fname, state in self.pending:
+            self._write(self.case.with_state(state), fname)
+            written.append(fname)
+        self.pending = []
+        return written
+
+    def solved_case(self):
+        """The working case and the result of its solution.
+        Output:
+            (RawCase, PowerFlowResult)
+        """
+        return self.case, self.result
+
+    def warm_start(self, v0):
+        """Start the next solution from the given complex voltages."""
+        self.voltage = v0
+
+    def load_solution(self, fname):
+        """Make a solved raw file of an earlier run the working case, the
+        next hour starts from it and its voltages.
+
+        The raw file keeps the values with the precision of its format, so
+        the start point is rounded compared to the solution in memory.
+        """
+        from nordic44.rawcase import read_raw
+        self.restore(read_raw(fname).snapshot())
+        self.voltage = self.case.bus["vm"]*np.exp(
+            1j*np.radians(self.case.bus["va"]))
+
+    def last_voltage(self):
+        """Complex voltages of the last solution."""
+        return self.voltage
+
+    def solve(self):
+        """Solve the power flow.
+        Output:
+            PSS/E style solution flag, 0 if converged
+        """
+        self.result = self.powerflow.solve(self.voltage)
+        if self.result.converged:
+            self.voltage = self.result.v
+        return self.result.solved
+
+    def solve_info(self):
+        """Iterations and mismatch in MVA of the last solution, summed and
+        the largest over all hours after solve_queued."""
+        if self.result is None:
+            return {"iterations": int(self.batch.iterations.sum()),
+                    "mismatch": float(self.batch.mismatch.max())}
+        return {"iterations": int(self.result.iterations),
+                "mismatch": float(self.result.mismatch)}
+
+    def queue_hour(self):
+        """Keep the loads, machines and interchanges of the working case
+        for a batch solution with solve_queued."""
+        case = self.case
+        self.queue.append((case.load["pl"].copy(), case.load["ql"].copy(),
+                           case.generator["pg"].copy(),
+                           case.area["pdes"].copy()))
+
+    def solve_queued(self):
+        """Solve all queued hours together, all from the voltages and taps
+        of the working case, see powerflow.BatchPowerFlow.
+        Output:
+            PSS/E style solution flag of every hour
+        """
+        from nordic44.powerflow import BatchPowerFlow
+        pload, qload, pgen, pdes = [np.array(x) for x in zip(*self.queue)]
+        self.batch = BatchPowerFlow(
+            self.case, chunk=self.chunk, network=self.powerflow.network,
+            chain=False, **self.options).solve(pload, qload, pgen, pdes,
+                                               self.voltage)
+        self.result = None
+        converged = np.flatnonzero(self.batch.converged)
+        if len(converged):
+            self.voltage = self.batch.v[converged[-1]]
+        return self.batch.solved.tolist()
+
+    def use_hour(self, i):
+        """Make a queued hour and its solution the working case.
+        Args:
+            i: position of the hour in the queue
+        """
+        case = self.case
+        case.load["pl"], case.load["ql"], pgen, case.area["pdes"] = (
+            self.queue[i])
+        self.result = self.batch.snapshot(i)
+        case.generator["pg"] = pgen
+        if self.result.converged:
+            case.bus["vm"] = self.result.vm
+            case.bus["va"] = self.result.va
+            case.generator["pg"] = self.result.pgen
+            case.generator["qg"] = self.result.qgen
+            case.transformer["windv1"] = self.result.windv1
+
+    def store_solution(self, out_dir):
+        """The solution is already kept in the working case."""
+        pass
+
+    def area_results(self, numbers):
+        """Area generation, load and net interchange after the solution.
+        Args:
+            numbers: area numbers
+        Output:
+            (generation, load, interchange) lists in MW
+        """
+        position = self.case.area_index(numbers)
+        return (self.result.area_gen[position].tolist(),
+                self.result.area_load[position].tolist(),
+                self.result.area_pint.tolist())
+
+    def limit_data(self):
+        """Quantities needed for the limit checks.
+        Output:
+            dict of arrays keyed by the PSS/E quantity names
+        """
+        gen = self.case.generator
+        result = self.result
+        return {"PU": result.vm,
+                "PGEN": result.pgen, "PMAX": gen["pt"], "PMIN": gen["pb"],
+                "QGEN": result.qgen, "QMAX": gen["qt"], "QMIN": gen["qb"],
+                "MVA": np.hypot(result.pgen, result.qgen),
+                "MBASE": gen["mbase"],
+                "PCTCORPRATEA": result.loading[0],
+                "PCTCORPRATEB": result.loading[1],
+                "PCTCORPRATEC": result.loading[2]}
+
+    def element_names(self):
+        """Names of the elements of limit_data.
+        Output:
+            dict of lists for buses, machines (bus_id) and branches
+            (frombus_tobus_ckt)
+        """
+        if self.names is None:
+            from nordic44.snapshots import case_elements
+            self.names = case_elements(self.case)
+        return self.names
+
+    def cleanup(self, out_dir):
+        """Nothing to close for the native backend."""
+        pass
+
+
+BACKENDS = {"psse": PsseBackend, "native": NativeBackend}
+
+
+def get_backend(name, **options):
+    """Create a backend by name.
+    Args:
+        name: "psse" or "native"
+        options: passed on to the backend
+    Output:
+        backend instance
+    """
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError("Unknown backend " + str(name))
+    return backend(**options)
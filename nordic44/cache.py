@@ -0,0 +1,199 @@
+"""Local caches of Nordpool market data files.
+
+The published weekly files never change, so every file is fetched once
+and kept gzip compressed under a cache directory. The files are stored by
+the SHA-256 checksum of their content, index.json maps the server path of
+a file to its checksum, size and fetch time.
+
+Parsed iTesla format excel files are memoized in the same way by
+SheetCache, keyed by the path, modification time and size of the file.
+"""
+import os
+import gzip
+import json
+import hashlib
+import time
+import tempfile
+from datetime import datetime
+import numpy as np
+
+
+class WeekCache(object):
+    """Content-addressed store of weekly .sdv files.
+
+    Args:
+        directory: Folder of the cache, created when missing
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.objects = os.path.join(directory, "objects")
+        self.index_fname = os.path.join(directory, "index.json")
+        if not os.path.isdir(self.objects):
+            os.makedirs(self.objects)
+
+    def read_index(self):
+        """The index as a dictionary from server path to entry."""
+        if not os.path.exists(self.index_fname):
+            return dict()
+        with open(self.index_fname) as index:
+            return json.load(index)
+
+    def object_fname(self, checksum):
+        """File storing the content with a checksum."""
+        return os.path.join(self.objects, checksum + ".sdv.gz")
+
+    def get(self, key):
+        """Lines of a cached file.
+        Args:
+            key: Server path of the file, e.g. Norway/pono1601.sdv
+        Output:
+            list of lines, None if the file is not cached or damaged
+        """
+        entry = self.read_index().get(key)
+        if entry is None:
+            return None
+        fname = self.object_fname(entry["sha256"])
+        if not os.path.exists(fname):
+            return None
+        with gzip.open(fname, "rb") as blob:
+            content = blob.read()
+        if hashlib.sha256(content).hexdigest() != entry["sha256"]:
+            return None
+        return content.decode("utf-8").split("\n")
+
+    def put(self, key, lines):
+        """Store the lines of a fetched file.
+        Args:
+            key: Server path of the file
+            lines: list of lines
+        """
+        content = "\n".join(lines).encode("utf-8")
+        checksum = hashlib.sha256(content).hexdigest()
+        fname = self.object_fname(checksum)
+        if not os.path.exists(fname):
+            self._replace(fname, gzip.compress(content))
+
+        # Other processes may share the cache, the index is read and
+        # written while holding its lock
+        with _FileLock(self.index_fname + ".lock"):
+            index = self.read_index()
+            index[key] = {"sha256": checksum, "size": len(content),
+                          "fetched": time.strftime("%Y-%m-%dT%H:%M:%SZ",
+                                                   time.gmtime())}
+            self._replace(self.index_fname,
+                          json.dumps(index, indent=1, sort_keys=True).encode())
+
+    def _replace(self, fname, data):
+        """Write a file atomically."""
+        handle, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, "wb") as out:
+            out.write(data)
+        os.replace(tmp, fname)
+
+
+class _FileLock(object):
+    """Lock shared between processes, held while a lock file exists.
+
+    The lock file is created exclusively, other processes wait until it is
+    removed. A lock file older than stale seconds is left from a crashed
+    process and is taken over.
+    Args:
+        fname: Name of the lock file
+        stale: Seconds after which a lock file is taken over
+        wait: Seconds between attempts
+    """
+
+    def __init__(self, fname, stale=60, wait=0.01):
+        self.fname = fname
+        self.stale = stale
+        self.wait = wait
+
+    def __enter__(self):
+        while True:
+            try:
+                os.close(os.open(self.fname,
+                                 os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except FileExistsError:
+                pass
+            try:
+                if time.time() - os.path.getmtime(self.fname) > self.stale:
+                    os.remove(self.fname)
+                    continue
+            except OSError:
+                # Released in the meantime
+                continue
+            time.sleep(self.wait)
+
+    def __exit__(self, *exc):
+        os.remove(self.fname)
+        return False
+
+
+class SheetCache(object):
+    """Memo of parsed iTesla format excel files.
+
+    An entry is found only while the file keeps its path, modification
+    time and size, so edited files are parsed again.
+    Args:
+        directory: Folder of the cache, created when missing
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.sheets = os.path.join(directory, "sheets")
+        if not os.path.isdir(self.sheets):
+            os.makedirs(self.sheets)
+
+    def sheet_fname(self, fname):
+        """File storing the parsed content of an excel file."""
+        stat = os.stat(fname)
+        key = "%s|%d|%d" % (os.path.abspath(fname), stat.st_mtime_ns,
+                            stat.st_size)
+        checksum = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.sheets, checksum + ".npz")
+
+    def get(self, fname):
+        """Parsed content of an excel file.
+        Args:
+            fname: name of excel file
+        Output:
+            (date, dictionary from area name to float array), None if the
+            file is not cached
+        """
+        memo = self.sheet_fname(fname)
+        if not os.path.exists(memo):
+            return None
+        with np.load(memo) as stored:
+            date = stored["date"].item() or None
+            if stored["is_date"]:
+                date = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+            values = stored["values"]
+            return date, dict((name, values[i, :length])
+                              for i, (name, length) in enumerate(
+                                  zip(stored["names"].tolist(),
+                                      stored["lengths"])))
+
+    def put(self, fname, date, columns):
+        """Store the parsed content of an excel file.
+        Args:
+            fname: name of excel file
+            date: date cell of the file
+            columns: dictionary from area name to float array
+        """
+        names = list(columns)
+        lengths = np.array([len(columns[name]) for name in names], dtype=int)
+        values = np.full((len(names), lengths.max() if names else 0), np.nan)
+        for i, name in enumerate(names):
+            values[i, :lengths[i]] = columns[name]
+        is_date = isinstance(date, datetime)
+        if is_date:
+            date = date.strftime("%Y-%m-%d %H:%M:%S")
+        handle, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, "wb") as out:
+            np.savez(out, date=np.array("" if date is None else str(date)),
+                     is_date=is_date,
+                     names=np.array(names, dtype=str), lengths=lengths,
+                     values=values)
+        os.replace(tmp, self.sheet_fname(fname))
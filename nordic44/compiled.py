@@ -0,0 +1,159 @@
+"""Precompiled base case for a fast start of the native power flow.
+
+Parsing N44_BC.raw and building its admittance matrices is repeated by
+every day and every worker process. compile_case does it once and keeps
+the result next to the raw file, N44_BC.raw gives N44_BC.n44c, holding the
+section arrays of the RawCase (buses, loads, fixed shunts, machines,
+branches, transformers and areas), the bus positions of the loads,
+machines and shunts and the CSR arrays of the Y-bus and the branch flow
+matrices. The file records the SHA-256 checksum of the raw file and is
+compiled again by load_case when the raw file changes.
+
+The file starts with the length of a json index as 8 byte little endian
+integer, followed by the index and the bytes of all arrays. The index
+holds the case header, tail and name and the dtype, shape and offset of
+every array, so the whole case is read with one read call.
+"""
+import os
+import json
+import struct
+import hashlib
+import tempfile
+import numpy as np
+from nordic44.rawcase import RawCase, STATE_SECTIONS, read_raw
+
+# Layout of the compiled file, files of another version are compiled again
+VERSION = 1
+
+BASECASE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "models", "N44_BC.raw")
+
+
+def source_checksum(fname):
+    """SHA-256 checksum of a raw file."""
+    with open(fname, "rb") as raw:
+        return hashlib.sha256(raw.read()).hexdigest()
+
+
+def compiled_fname(fname):
+    """Compiled file of a raw file."""
+    return os.path.splitext(fname)[0] + ".n44c"
+
+
+def compile_case(fname=BASECASE, out=None):
+    """Compile a raw file.
+    Args:
+        fname: PSS/E raw file, default the N44 base case
+        out: Name of the compiled file, default next to the raw file
+    Output:
+        name of the compiled file
+    """
+    # I know there should be no imports here,
+    # but PSS/E users do not need scipy
+    from nordic44.powerflow import Network
+    if out is None:
+        out = compiled_fname(fname)
+    checksum = source_checksum(fname)
+    case = read_raw(fname)
+    arrays = [(section, getattr(case, section))
+              for section in STATE_SECTIONS]
+    arrays.extend(("network_" + key, value) for key, value in
+                  sorted(Network(case).matrices().items()))
+    index = {"version": VERSION, "sha256": checksum, "name": case.name,
+             "header": case.header, "tail": case.tail, "arrays": dict()}
+    blobs = []
+    offset = 0
+    for key, array in arrays:
+        blob = np.ascontiguousarray(array).tobytes()
+        index["arrays"][key] = {
+            "descr": np.lib.format.dtype_to_descr(array.dtype),
+            "shape": list(array.shape), "offset": offset}
+        blobs.append(blob)
+        offset += len(blob)
+    head = json.dumps(index).encode("utf-8")
+
+    # Written to a temporary file first, workers may load it meanwhile
+    handle, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(out)))
+    try:
+        with os.fdopen(handle, "wb") as compiled:
+            compiled.write(struct.pack("<Q", len(head)))
+            compiled.write(head)
+            for blob in blobs:
+                compiled.write(blob)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, out)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return out
+
+
+def _load(out, checksum):
+    """Index and arrays of a compiled file, None if it is missing, damaged
+    or of another raw file."""
+    if not os.path.exists(out):
+        return None
+    with open(out, "rb") as compiled:
+        content = compiled.read()
+    try:
+        size, = struct.unpack("<Q", content[:8])
+        index = json.loads(content[8:8+size].decode("utf-8"))
+        if index["version"] != VERSION or index["sha256"] != checksum:
+            return None
+        arrays = dict()
+        for key, entry in index["arrays"].items():
+            dtype = np.lib.format.descr_to_dtype(
+                [tuple(field) for field in entry["descr"]]
+                if isinstance(entry["descr"], list) else entry["descr"])
+            count = int(np.prod(entry["shape"]))
+            start = 8 + size + entry["offset"]
+            # Copies, the working case is changed in place
+            arrays[key] = np.frombuffer(
+                content, dtype=dtype, count=count,
+                offset=start).reshape(entry["shape"]).copy()
+    except (struct.error, ValueError, KeyError, TypeError):
+        return None
+    return index, arrays
+
+
+def load_case(fname=BASECASE, network=True):
+    """The case of a raw file from its compiled file.
+
+    The raw file is compiled when the compiled file is missing, damaged or
+    of another raw file. When its folder is not writable the case is read
+    from the raw file without keeping the compiled one.
+    Args:
+        fname: PSS/E raw file, default the N44 base case
+        network: Also give the powerflow.Network of the case
+    Output:
+        RawCase, or (RawCase, Network) with network
+    """
+    out = compiled_fname(fname)
+    checksum = source_checksum(fname)
+    loaded = _load(out, checksum)
+    if loaded is None:
+        try:
+            compile_case(fname, out)
+            loaded = _load(out, checksum)
+        except OSError:
+            loaded = None
+    if loaded is None:
+        case = read_raw(fname)
+        if not network:
+            return case
+        from nordic44.powerflow import Network
+        return case, Network(case)
+
+    index, arrays = loaded
+    case = RawCase.from_sections(
+        index["header"],
+        dict((section, arrays[section]) for section in STATE_SECTIONS),
+        index["tail"], index["name"])
+    if not network:
+        return case
+    from nordic44.powerflow import Network
+    matrices = dict((key[len("network_"):], value)
+                    for key, value in arrays.items()
+                    if key.startswith("network_"))
+    return case, Network(case, matrices)
@@ -0,0 +1,73 @@
+"""Buffered excel output written in one pass.
+
+Cells are collected in memory and the workbook is written with the
+openpyxl write-only mode, which streams the rows to the file instead of
+building a full workbook. All wrapped cells share one cached style.
+"""
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment
+from openpyxl.utils import get_column_letter
+
+WRAP = Alignment(wrapText=True)
+
+
+class SheetBuffer(object):
+    """Cells of a single sheet workbook.
+
+    Args:
+        title: Sheet title
+    """
+
+    def __init__(self, title="Sheet"):
+        self.title = title
+        self.cells = dict()
+        self.wrapped = set()
+        self.merged = []
+        self.max_row = 0
+
+    def set(self, row, column, value, wrap=False):
+        """Set the value of a cell, rows and columns start at 1."""
+        self.cells[row, column] = value
+        if wrap:
+            self.wrapped.add((row, column))
+        self.max_row = max(self.max_row, row)
+
+    def get(self, row, column):
+        """Value of a cell, None if empty."""
+        return self.cells.get((row, column))
+
+    def append(self, values):
+        """Add a row below the last one."""
+        row = self.max_row + 1
+        for column, value in enumerate(values, 1):
+            if value is not None:
+                self.cells[row, column] = value
+        self.max_row = row
+
+    def merge(self, start_row, start_column, end_row, end_column):
+        """Merge a range of cells."""
+        self.merged.append("%s%d:%s%d" % (get_column_letter(start_column),
+                                          start_row,
+                                          get_column_letter(end_column),
+                                          end_row))
+
+    def save(self, fname):
+        """Write the workbook."""
+        rows = dict()
+        for (row, column), value in self.cells.items():
+            rows.setdefault(row, dict())[column] = value
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(self.title)
+        for row in range(1, self.max_row + 1):
+            cells = rows.get(row, dict())
+            values = [None]*max(cells or [0])
+            for column, value in cells.items():
+                if (row, column) in self.wrapped:
+                    value = WriteOnlyCell(ws, value)
+                    value.alignment = WRAP
+                values[column - 1] = value
+            ws.append(values)
+        for cell_range in self.merged:
+            ws.merged_cells.add(cell_range)
+        wb.save(fname)
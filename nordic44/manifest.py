@@ -0,0 +1,119 @@
+"""Manifest of a data_from_nordpool run for resuming it.
+
+manifest.json in the output folder holds an entry per date with the
+status of the day, a checksum of its market data and settings, and per
+hour the checksum of its market data and the solution flag:
+
+    {"2016-01-01": {"status": "partial", "checksum": "...",
+                    "hours": {"0": {"checksum": "...", "flag": 0}, ...}}}
+
+A day is done when all hours converged, partial when some did not and
+failed when processing raised an error. A rerun skips the days that are
+done with unchanged inputs and processes the others again.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+from nordic44.marketdata import MarketData, HOURS
+
+
+def day_entry(data, settings):
+    """Entry of a day before it is processed.
+    Args:
+        data: NordPool.data of the day
+        settings: dictionary of the options changing the results
+    Output:
+        entry with the checksums of the day and of every hour
+    """
+    market = MarketData.from_data(None, data)
+    order = np.argsort(market.names)
+    names = json.dumps([market.names[s] for s in order]).encode("utf-8")
+    values = np.ascontiguousarray(market.values[0][:, :, order])
+    hours = dict()
+    for hour in range(HOURS):
+        checksum = hashlib.sha256(names + values[hour].tobytes())
+        hours[str(hour)] = {"checksum": checksum.hexdigest()}
+    day = hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    for hour in range(HOURS):
+        day.update(hours[str(hour)]["checksum"].encode("utf-8"))
+    return {"checksum": day.hexdigest(), "hours": hours}
+
+
+def pending_hours(previous, entry, only_failed=False):
+    """Hours of a day to process.
+    Args:
+        previous: entry of an earlier run, None if the day is new
+        entry: entry of the current inputs from day_entry
+        only_failed: Only the hours that did not converge or whose inputs
+            changed, and days that failed altogether
+    Output:
+        list of hours, empty if the day is skipped
+    """
+    everything = list(range(HOURS))
+    if previous is None:
+        return [] if only_failed else everything
+    if previous.get("status") == "failed":
+        return everything
+    if (previous.get("status") == "done" and
+            previous.get("checksum") == entry["checksum"]):
+        return []
+    if not only_failed:
+        return everything
+    pending = []
+    for hour in everything:
+        old = previous.get("hours", dict()).get(str(hour), dict())
+        new = entry["hours"][str(hour)]
+        if old.get("flag") != 0 or old.get("checksum") != new["checksum"]:
+            pending.append(hour)
+    return pending
+
+
+def finish_entry(entry, previous, flags):
+    """Complete an entry with the solution flags.
+    Args:
+        entry: entry from day_entry
+        previous: entry of an earlier run, for the hours not solved now
+        flags: dictionary from solved hour to solution flag
+    Output:
+        the entry with its status
+    """
+    for hour, hour_entry in entry["hours"].items():
+        if int(hour) in flags:
+            hour_entry["flag"] = flags[int(hour)]
+        elif previous is not None:
+            hour_entry["flag"] = previous.get("hours", dict()).get(
+                hour, dict()).get("flag")
+    solved = all(hour_entry.get("flag") in (0, None)
+                 for hour_entry in entry["hours"].values())
+    entry["status"] = "done" if solved else "partial"
+    return entry
+
+
+class RunManifest(object):
+    """Manifest file of a run.
+
+    Args:
+        fname: Name of the json file
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.days = dict()
+        if os.path.exists(fname):
+            with open(fname) as manifest:
+                self.days = json.load(manifest)
+
+    def day(self, date):
+        """Entry of a date, None if it was not processed."""
+        return self.days.get(date.strftime("%Y-%m-%d"))
+
+    def update(self, date, entry):
+        """Store the entry of a date and write the file."""
+        self.days[date.strftime("%Y-%m-%d")] = entry
+        handle, tmp = tempfile.mkstemp(dir=os.path.dirname(
+            os.path.abspath(self.fname)))
+        with os.fdopen(handle, "w") as out:
+            json.dump(self.days, out, indent=1, sort_keys=True)
+        os.replace(tmp, self.fname)
@@ -0,0 +1,196 @@
+"""Vectorized mapping of Nordpool market data to N44 setpoints.
+
+N44.area_info and N44.ex_as_load are compiled once against the series
+names of a MarketData container. Interchanges come from a signed
+incidence matrix between areas and interconnector series, and the
+exchanges modelled as loads from a selection of series plus an incidence
+matrix adding them to the area consumption. All days and hours are then
+mapped with a few array products.
+"""
+import math
+import warnings
+import numpy as np
+from nordic44.marketdata import MarketData
+
+
+def flip_area(code):
+    """Flip area string"""
+    return code[4:] + "_" + code[0:3]
+
+
+class Setpoints(object):
+    """Setpoints of every day and hour, ready for any backend.
+
+    Attributes:
+        loads: ExchangeLoad of every load column
+        areas: (name, AreaInfo) of every area column
+        load_p, load_q: (day, hour, load) active and reactive power of the
+            exchanges modelled as loads
+        prod, con, qcon: (day, hour, area) production, consumption
+            including the exchange loads and reactive consumption
+        exchange: (day, hour, area) desired net interchange
+
+    Setpoints depending on missing market data are NaN, see missing.
+    """
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def missing(self):
+        """(day, hour) True where market data of an hour are missing."""
+        return np.logical_or.reduce(
+            [np.isnan(values).any(axis=2) for values in
+             (self.load_p, self.prod, self.con, self.exchange)])
+
+    def apply(self, backend, day, hour):
+        """Set one hour in the working case of a backend."""
+        for j, load in enumerate(self.loads):
+            backend.change_load(load.bus, load.i, self.load_p[day, hour, j],
+                                self.load_q[day, hour, j])
+        for j, (area, info) in enumerate(self.areas):
+            backend.area_data(info.number, info.bus,
+                              self.exchange[day, hour, j], area)
+            backend.scale_area(info.number, self.prod[day, hour, j],
+                               self.con[day, hour, j],
+                               self.qcon[day, hour, j])
+
+
+class Mapping(object):
+    """Mapping compiled for the series names of a MarketData container.
+
+    Args:
+        ex_as_load: list of ExchangeLoad, see N44
+        area_info: ordered dictionary of AreaInfo, see N44
+        names: series names of the market data
+        has_ut: names with exchange (UT) data, default all names
+    """
+
+    def __init__(self, ex_as_load, area_info, names, has_ut=None):
+        self.loads = list(ex_as_load)
+        self.areas = list(area_info.items())
+        index = dict((name, i) for i, name in enumerate(names))
+        has_ut = set(names if has_ut is None else has_ut)
+        narea = len(self.areas)
+        nload = len(self.loads)
+        area_position = dict((area, j)
+                             for j, (area, _) in enumerate(self.areas))
+
+        def exchange(country, name):
+            """Position of a UT series of a country, None if missing."""
+            if name in has_ut and name.startswith(country):
+                return index[name]
+            return None
+
+        # Net interchange: +1 for imports, -1 for exports, flipped names
+        # count with the opposite sign
+        self.incidence = np.zeros((narea, len(names)))
+        for j, (area, info) in enumerate(self.areas):
+            country = area[0:2]
+            for names_, sign in ((info.pos, 1.0), (info.neg, -1.0)):
+                for name in names_:
+                    s = exchange(country, name)
+                    if s is None:
+                        s = exchange(country, flip_area(name))
+                        if s is None:
+                            raise KeyError(name)
+                        self.incidence[j, s] -= sign
+                    else:
+                        self.incidence[j, s] += sign
+
+        # Exchanges as loads: the series, missing ones are zero
+        self.load_series = np.zeros(nload, dtype=int)
+        self.load_found = np.zeros(nload, dtype=bool)
+        self.load_tan = np.zeros(nload)
+        # Consumption of the area the load belongs to
+        self.load_incidence = np.zeros((narea, nload))
+        for k, load in enumerate(self.loads):
+            country = load.area[0:2]
+            s = exchange(country, load.areas)
+            if s is None:
+                # Sweden hack
+                s = exchange(country, load.area + load.areas[2:])
+            if s is None:
+                warnings.warn("Missing data for " + load.areas +
+                              " filling in zero")
+            else:
+                self.load_series[k] = s
+                self.load_found[k] = True
+            self.load_tan[k] = math.tan(math.acos(load.pf))
+            area = "FI" if country == "FI" else load.area
+            self.load_incidence[area_position[area], k] = 1.0
+
+        self.area_series = np.array([index[area] for area, _ in self.areas])
+        self.area_tan = np.array([math.tan(math.acos(info.pf))
+                                  for _, info in self.areas])
+
+    @classmethod
+    def for_market(cls, ex_as_load, area_info, market):
+        """Compile for the series with exchange data in a container."""
+        ut = market.values[:, :, market.code_index["UT"], :]
+        has_ut = [name for name, s in market.index.items()
+                  if not np.isnan(ut[:, :, s]).all()]
+        return cls(ex_as_load, area_info, market.names, has_ut)
+
+    def setpoints(self, market, load_decimals=4, area_decimals=4):
+        """Map all days and hours of a container.
+        Args:
+            market: MarketData with the names the mapping was compiled for
+            load_decimals: Rounding of the reactive power of the loads
+            area_decimals: Rounding of the reactive area consumption
+        Output:
+            Setpoints
+        """
+        values = market.values
+        ut = values[:, :, market.code_index["UT"], :]
+        ps = values[:, :, market.code_index["PS"], :]
+        fb = values[:, :, market.code_index["FB"], :]
+
+        load_p = -np.where(self.load_found,
+                           ut[:, :, self.load_series], 0.0)
+        load_q = np.round(load_p*self.load_tan, load_decimals)
+
+        con = (fb[:, :, self.area_series] +
+               sum_series(load_p, self.load_incidence))
+        exchange = sum_series(ut, self.incidence)
+        setpoints = Setpoints(
+            loads=self.loads, areas=self.areas,
+            load_p=load_p, load_q=load_q,
+            prod=ps[:, :, self.area_series], con=con,
+            qcon=np.round(con*self.area_tan, area_decimals),
+            exchange=exchange)
+        missing = setpoints.missing()
+        if missing.any():
+            warnings.warn("Missing data in " + str(missing.sum()) +
+                          " hours, the setpoints of these hours are NaN")
+        return setpoints
+
+
+def sum_series(values, incidence):
+    """Signed sums of series, NaN where a series of a sum is missing.
+    Args:
+        values: (day, hour, series) values
+        incidence: (sum, series) weight of each series in each sum
+    Output:
+        (day, hour, sum) sums
+    """
+    sums = np.dot(np.nan_to_num(values), incidence.T)
+    missing = np.dot(np.isnan(values).astype(float),
+                     (incidence != 0).T) > 0
+    sums[missing] = np.nan
+    return sums
+
+
+def as_market(data):
+    """MarketData for the data accepted by N44.
+    Args:
+        data: MarketData, a day of it from day_data or a NordPool.data
+            dictionary
+    """
+    from nordic44.marketdata import DayView
+    if isinstance(data, MarketData):
+        return data
+    if isinstance(data, DayView):
+        market = data.market
+        return MarketData(market.dates()[data.day], market.names,
+                          market.values[data.day:data.day + 1])
+    return MarketData.from_data(None, data)
@@ -0,0 +1,242 @@
+"""Columnar container for Nordpool market data of many days.
+
+NordPool.data holds one day as data[country][code][name][hour]. MarketData
+keeps any number of consecutive days in one float array indexed by
+(day, hour, code, series), where a series is an area (NO1), a country
+total (NO) or an interconnector (NO1_SE3). Series names start with the
+country code, so one name table covers all countries. Missing values are
+NaN.
+"""
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+
+# Nordpool codes: production, consumption and exchange
+CODES = ["PS", "FB", "UT"]
+HOURS = 24
+
+
+class MarketData(object):
+    """Market data of consecutive days.
+
+    Args:
+        start_date: Date of the first day
+        names: Series names, e.g. NO1, SE or NO1_SE3
+        values: (day, hour, code, series) array, the codes in CODES order
+    """
+
+    def __init__(self, start_date, names, values):
+        self.start_date = start_date
+        self.names = list(names)
+        self.index = dict((name, i) for i, name in enumerate(self.names))
+        self.code_index = dict((code, i) for i, code in enumerate(CODES))
+        self.values = values
+
+    @classmethod
+    def empty(cls, start_date, ndays, names):
+        """Container with all values missing."""
+        values = np.full((ndays, HOURS, len(CODES), len(names)), np.nan)
+        return cls(start_date, names, values)
+
+    @classmethod
+    def from_data(cls, date, data):
+        """Container with one day given as a NordPool.data dictionary."""
+        names = [name for country in data.values()
+                 for series in country.values() for name in series]
+        market = cls.empty(date, 1, list(OrderedDict.fromkeys(names)))
+        market.set_day(0, data)
+        return market
+
+    @classmethod
+    def from_nordpool(cls, days):
+        """Collect NordPool objects of consecutive dates.
+        Args:
+            days: list of NordPool objects, e.g. from read_range_from_ftp
+        """
+        names = []
+        seen = set()
+        for nord in days:
+            for country in nord.data.values():
+                for series in country.values():
+                    for name in series:
+                        if name not in seen:
+                            seen.add(name)
+                            names.append(name)
+        market = cls.empty(days[0].date, len(days), names)
+        for day, nord in enumerate(days):
+            market.set_day(day, nord.data)
+        return market
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Join containers of consecutive date ranges."""
+        names = []
+        for part in parts:
+            names.extend(name for name in part.names if name not in names)
+        market = cls.empty(parts[0].start_date,
+                           sum(part.ndays for part in parts), names)
+        day = 0
+        for part in parts:
+            columns = market.series(part.names)
+            market.values[day:day + part.ndays, :, :, columns] = part.values
+            day += part.ndays
+        return market
+
+    @property
+    def ndays(self):
+        """Number of days."""
+        return self.values.shape[0]
+
+    def dates(self):
+        """Dates of all days."""
+        return [self.start_date + timedelta(i) for i in range(self.ndays)]
+
+    def day_index(self, date):
+        """Position of a date."""
+        day = (date - self.start_date).days
+        if not 0 <= day < self.ndays:
+            raise KeyError(str(date) + " is not in the data")
+        return day
+
+    def series(self, names):
+        """Positions of series names.
+        Args:
+            names: list of series names
+        Output:
+            integer array
+        """
+        return np.array([self.index[name] for name in names], dtype=int)
+
+    def column(self, code, name):
+        """All values of one series.
+        Args:
+            code: PS, FB or UT
+            name: series name
+        Output:
+            (day, hour) view
+        """
+        return self.values[:, :, self.code_index[code], self.index[name]]
+
+    def days(self, start_date, end_date):
+        """Sub range of dates sharing the values.
+        Args:
+            start_date: first date
+            end_date: last date, included
+        Output:
+            MarketData view
+        """
+        start = self.day_index(start_date)
+        stop = self.day_index(end_date) + 1
+        return MarketData(start_date, self.names, self.values[start:stop])
+
+    def set_day(self, day, data):
+        """Store a day given as a NordPool.data dictionary.
+
+        Values beyond the 24 hours, i.e. the daily sum, are dropped.
+        """
+        for country in data.values():
+            for code, series in country.items():
+                c = self.code_index[code]
+                for name, values in series.items():
+                    values = np.asarray(list(values), dtype=float)[:HOURS]
+                    self.values[day, :len(values), c, self.index[name]] = (
+                        values)
+
+    def to_dict(self, day):
+        """A day as a NordPool.data dictionary.
+
+        Every series ends with the daily sum like the Nordpool files.
+        """
+        data = dict()
+        for code, c in self.code_index.items():
+            for name, s in self.index.items():
+                values = self.values[day, :, c, s]
+                if np.isnan(values).all():
+                    continue
+                country = data.setdefault(name[0:2], dict())
+                country.setdefault(code, dict())[name] = np.append(
+                    values, np.nansum(values))
+        return data
+
+    def day_data(self, day):
+        """Adapter reading a day like NordPool.data, for N44.
+
+        The hourly values are views into the container, changes to them
+        are changes to the container.
+        Args:
+            day: day position or date
+        """
+        if not isinstance(day, int):
+            day = self.day_index(day)
+        return DayView(self, day)
+
+    def save(self, fname):
+        """Store to fname.npy and the names to fname.json."""
+        np.save(fname + ".npy", self.values)
+        with open(fname + ".json", "w") as out:
+            json.dump({"start_date": self.start_date.strftime("%Y-%m-%d"),
+                       "names": self.names}, out)
+
+    @classmethod
+    def load(cls, fname, mmap_mode="r"):
+        """Open a container stored with save.
+        Args:
+            fname: name without extension
+            mmap_mode: see numpy.load, None reads it into memory
+        """
+        with open(fname + ".json") as meta_file:
+            meta = json.load(meta_file)
+        values = np.load(fname + ".npy", mmap_mode=mmap_mode)
+        return cls(datetime.strptime(meta["start_date"], "%Y-%m-%d"),
+                   meta["names"], values)
+
+
+class DayView(object):
+    """One day of MarketData indexed as data[country][code][name][hour]."""
+
+    def __init__(self, market, day):
+        self.market = market
+        self.day = day
+
+    def __getitem__(self, country):
+        return _CountryView(self.market, self.day, country)
+
+
+class _CountryView(object):
+    """Codes of one country, see DayView."""
+
+    def __init__(self, market, day, country):
+        self.market = market
+        self.day = day
+        self.country = country
+
+    def __getitem__(self, code):
+        return _SeriesView(self.market, self.day, self.country,
+                           self.market.code_index[code])
+
+
+class _SeriesView(object):
+    """Series of one country and code, see DayView."""
+
+    def __init__(self, market, day, country, code):
+        self.market = market
+        self.day = day
+        self.country = country
+        self.code = code
+
+    def __getitem__(self, name):
+        s = self.market.index.get(name)
+        if s is None or not name.startswith(self.country):
+            raise KeyError(name)
+        values = self.market.values[self.day, :, self.code, s]
+        if np.isnan(values).all():
+            raise KeyError(name)
+        return values
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+        return True
@@ -1,14 +1,33 @@
 """Functions for updating the PSS/E data sets."""
 import os
-import sys
 import math
-import warnings
-import psspy
-import redirect
-import openpyxl
-from openpyxl.styles import Alignment
+import numpy as np
 from collections import namedtuple
 from collections import OrderedDict
+from nordic44 import trace
+from nordic44.backends import get_backend
+from nordic44.excel import SheetBuffer
+from nordic44.mapping import Mapping, as_market
+from nordic44.violations import check_limits, VIOLATION_FIELDS
+
+# Excel row and message of the limit violations of a quantity
+LIMIT_MESSAGES = [(43, "PU", 'Bus voltage problem'),
+                  (45, "PGEN", 'Generator active power output problem'),
+                  (46, "QGEN", 'Generator reactive power output problem'),
+                  (47, "MVA", 'Generator overloading problem'),
+                  (48, "PCTCORPRATEA", 'Branch overloading problem (Rate A)'),
+                  (49, "PCTCORPRATEB", 'Branch overloading problem (Rate B)'),
+                  (50, "PCTCORPRATEC", 'Branch overloading problem (Rate C)')]
+
+# When update_raw_files writes the raw files of the hours: at once, at the
+# end of the day from in-memory snapshots, or not at all
+RAW_FILES = ["now", "deferred", "none"]
+
+# Solution flag of the hours that are not solved for missing market data
+MISSING_DATA = -1
+
+# Production in MW an area may miss before it is reported in unplaced
+UNPLACED_TOL = 1e-3
 
 # Define enums containing the mapping
 ExchangeLoad = namedtuple("ExchangeLoad", "bus, i, area, areas, pf")
@@ -19,23 +38,31 @@ class N44(object):
     """Class mapping nordpool and N44
     Args:
         basecase: name of the PSS/E base case
-        data: Nordpool data dictionary
+        data: Nordpool data dictionary, a day of a MarketData from
+            day_data or a MarketData of one day
     """
     def __init__(self, data, basecase=None):
         self.data = data
         if not basecase:
             cwd = os.path.dirname(os.path.abspath(__file__))
-            encoding = sys.getfilesystemencoding()
             self.basecase = os.path.join(
-                cwd.encode(encoding),
+                cwd,
                 "models",
                 "N44_BC.sav")
         else:
             self.basecase = basecase
 
-        self.wb = None
+        self.backend = None
+        self.store = None
+        self.prefix = ""
+        self.flags = OrderedDict()
+        self.violations = None
+        self.unplaced = OrderedDict()
+        self.setpoints = None
+        self.last_voltage = None
         self.sheet = None
         self.to_excel = True
+        self.raw_files = "now"
 
         # In the future these mappings could be input
         # Mapping of exchanges represented as loads
@@ -99,264 +126,327 @@ class N44(object):
                        pos=[],
                        neg=["FI_SE1"]))])
 
-    def update_raw_files(self, to_excel=True, out_dir=None):
+    def update_raw_files(self, to_excel=True, out_dir=None, backend="psse",
+                         batch=False, v0=None, store=None, prefix="",
+                         hours=None, excel_name='PSSE_in_out.xlsx',
+                         raw_files="now", start_dir=None):
         """Function for updating the psse case file.
         Args:
             to_excel(default=True): If a summary should be written to excel
             out_dir: The directory where the results are stored
+            backend(default="psse"): Power flow backend, "psse" or "native"
+            batch(default=False): Solve the hours together with the batch
+                solver of the native backend. Every hour is then mapped on
+                the base case and solved from v0, instead of from the
+                solved case of the previous hour. The results differ from
+                the sequential solution by the start point: the machines
+                are scaled from the base case outputs and the taps start
+                from the base case positions.
+            v0: Start voltages of the first hour, e.g. last_voltage of the
+                previous day, only with the native backend
+            store: snapshots.SnapshotStore receiving every solved hour
+            prefix: Start of the snapshot names in the store, the hours
+                are named prefix + h0 to h23
+            hours: The hours to process, default all 24. The solution
+                flag of every processed hour is kept in flags. Hours with
+                missing market data are not solved, their flag is
+                MISSING_DATA.
+            excel_name: Name of the summary excel file
+            raw_files(default="now"): When the raw files of the hours are
+                written, see RAW_FILES. "deferred" keeps in-memory snapshots
+                of the case and writes all files at the end, with PSS/E the
+                files are still written at once.
+            start_dir: Folder with the solved raw files of an earlier run,
+                e.g. when only some hours are processed again. Without
+                batch an hour whose previous hour is not processed starts
+                from h<previous hour>_after_PF.raw there, as it would
+                start from the solution of the previous hour in a full run.
+                Hours with missing market data are passed over.
+
+        The limit violations of the solved hours are kept in violations, a
+        table with a row per violation, see nordic44.violations. The
+        production that the native backend could not place within the
+        machine limits is kept per hour and area in unplaced.
         """
+        if batch and backend != "native":
+            raise ValueError("Batch solves need the native backend")
+        if raw_files not in RAW_FILES:
+            raise ValueError("Unknown raw file mode " + str(raw_files))
+        market = as_market(self.data)
+        if market.ndays != 1:
+            raise ValueError("The market data hold " + str(market.ndays) +
+                             " days, process one day at a time, e.g. "
+                             "with day_data")
         if not out_dir:
             out_dir = os.getcwd()
 
-        redirect.psse2py()
-        psspy.throwPsseExceptions = True
-        nbuses = 50000  # max no of buses
-        ierr = psspy.psseinit(nbuses)
-        psspy.case(self.basecase)
+        self.backend = get_backend(backend)
+        with trace.span("open"):
+            self.backend.open_case(self.basecase)
+        self.store = store
+        self.prefix = prefix
+        self.raw_files = raw_files
+        if v0 is not None:
+            self.backend.warm_start(v0)
+
+        # Setpoints of all hours from the market data
+        self.setpoints = Mapping.for_market(
+            self.ex_as_load, self.area_info, market).setpoints(market)
 
         if to_excel:
             self.create_excel_sheet()
             self.to_excel = True
         else:
             self.sheet = None
+            self.to_excel = False
+
+        self.flags = OrderedDict()
+        self.unplaced = OrderedDict()
+        self.violations = []
+        columns = list(zip(range(0, 24), range(2, 2+24*3, 3)))
+        if hours is not None:
+            columns = [(i, col) for i, col in columns if i in hours]
+        missing = self.setpoints.missing()[0]
+        for i, col in columns:
+            if missing[i]:
+                self.skip_hour(i, col)
+        if batch:
+            columns = [(i, col) for i, col in columns if not missing[i]]
+            # Every hour starts from the base case
+            base = self.backend.snapshot()
+            for i, col in columns:
+                self.backend.restore(base)
+                with trace.context(hour=i):
+                    self.map_hour(i, col, to_excel, out_dir)
+                self.backend.queue_hour()
+            with trace.span("solve", hours=len(columns)) as timed:
+                flags = self.backend.solve_queued()
+                if trace.enabled():
+                    timed.set(**self.backend.solve_info())
+            for j, ((i, col), ival) in enumerate(zip(columns, flags)):
+                self.backend.use_hour(j)
+                with trace.context(hour=i):
+                    self.report_hour(i, col, ival, out_dir)
+        else:
+            previous = None
+            for i, col in columns:
+                if missing[i]:
+                    # The next hour starts from the case of this one, as
+                    # in a run of all hours
+                    previous = i
+                    continue
+                if start_dir and previous != i - 1:
+                    # The last hour before with market data
+                    k = i - 1
+                    while k >= 0 and missing[k]:
+                        k -= 1
+                    if k >= 0 and k != previous:
+                        self.load_solution(start_dir, k)
+                previous = i
+                with trace.context(hour=i):
+                    self.map_hour(i, col, to_excel, out_dir)
+                    # Solve the power flow
+                    with trace.span("solve") as timed:
+                        # flag to check convergence
+                        ival = self.backend.solve()
+                        if trace.enabled():
+                            timed.set(**self.backend.solve_info())
+                    self.report_hour(i, col, ival, out_dir)
+
+        self.last_voltage = self.backend.last_voltage()
+        with trace.span("raw_flush"):
+            for fname in self.backend.flush_raw():
+                trace.count("bytes", os.path.getsize(fname))
+        self.backend.cleanup(out_dir)
+        self.violations = np.concatenate(
+            self.violations or [np.zeros(0, dtype=VIOLATION_FIELDS)]).view(
+                np.recarray)
 
-        for i, col in zip(range(0, 24),
-                          range(2, 2+24*3, 3)):
+        if self.to_excel:
+            # save the Excel file with all data
+            with trace.span("excel"):
+                self.sheet.save(os.path.join(out_dir, excel_name))
+                if trace.enabled():
+                    trace.count("bytes", os.path.getsize(
+                        os.path.join(out_dir, excel_name)))
+
+    def map_hour(self, i, col, to_excel, out_dir):
+        """Map the market data of one hour to the working case.
+        Args:
+            i: Hour index
+            col: First excel column of the hour
+            to_excel: If a summary is written to excel
+            out_dir: The directory where the results are stored
+        """
+        with trace.span("map"):
+            setpoints = self.setpoints
             # Represent HVDC links as load and some other exchanges as well
             print('Changing additional loads...')
 
             row = 15
-            for load in self.ex_as_load:
-                self.load_change(load, i,
-                                 to_excel, row, col)
+            for j, load in enumerate(self.ex_as_load):
+                realar = setpoints.load_p[0, i, j]
+                realar2 = setpoints.load_q[0, i, j]
+                if self.to_excel:
+                    self.sheet.set(row, col, realar)
+                    self.sheet.set(row, col+1, realar2)
+                self.backend.change_load(load.bus, load.i, realar, realar2)
                 row = row + 1
 
             print('Changing interarea exchanges...')
             row = 3
-            for area, info in self.area_info.items():
-                country = area[0:2]
+            for j, (area, info) in enumerate(self.area_info.items()):
                 # Changing interarea exchanges
-                exchange = self.calculate_exchange(info, area, i)
                 self.area_data(
                     info.number,
                     info.bus,
-                    exchange,
+                    setpoints.exchange[0, i, j],
                     area,
                     row, col+2)
-                # Changing areas production and consumption
-                self.change_prod_con(
-                    info.number,
-                    self.data[country]["PS"][area][i],
-                    self.data[country]["FB"][area][i],
-                    info.pf,
-                    tol=4, row=row, column=col)
-                row = row + 1
-
-            print('Changes completed...')
-            # Save the raw file to convert to CIM
-            psspy.rawd_2(0, 1, [0, 0, 1, 0, 0, 0, 0], 0, "Snap_before_PF.raw")
-            b = os.path.join(out_dir, 'h' + str((col-1)/3) + '_before_PF.raw')
-            os.rename("Snap_before_PF.raw", b)
-            # Solve the power flow
-            psspy.fnsl([1, 2, 0, 0, 1, 0, 0, 0])
-            ival = psspy.solved()  # flag to check power flow convergence
-            if ival == 0:
-                print('Convergence')
                 if self.to_excel:
-                    self.sheet.cell(row=42, column=col).value = 'Convergence'
-                
-                temp_fname = os.path.join(out_dir, "temp.sav")
-                print(temp_fname)
-
-                psspy.save(temp_fname)  # save temporarily the solved case
-                psspy.case(temp_fname)  # set the saved case as current case
+                    self.sheet.set(row, col, setpoints.prod[0, i, j])
+                    self.sheet.set(row, col+1, setpoints.con[0, i, j])
+                row = row + 1
+            # Changing areas production and consumption, the consumption
+            # includes the exchanges represented as loads
+            self.scale_areas(i)
 
-                # save the raw file to convert to CIM
-                raw_fname = os.path.join(out_dir, "Snap_after_PF.raw")
-                psspy.rawd_2(0, 1, [0, 0, 1, 0, 0, 0, 0], 0,
-                             raw_fname)
-                b = os.path.join(out_dir, 'h' + str(i) + '_after_PF.raw')
-                os.rename(raw_fname, b)
+        print('Changes completed...')
+        # Save the raw file to convert to CIM
+        self.write_raw(os.path.join(out_dir,
+                                    'h' + str(i) + '_before_PF.raw'))
 
-                if self.to_excel:
-                    # Merge cells
-                    self.sheet.merge_cells(start_row=1, start_column=col,
-                                           end_row=1, end_column=col+2)
-
-                    self.sheet.cell(row=2, column=col).alignment = (
-                        Alignment(wrapText=True))
-                    self.sheet.cell(row=2, column=col+1).alignment = (
-                        Alignment(wrapText=True))
-                    self.sheet.cell(row=2, column=col+2).alignment = (
-                        Alignment(wrapText=True))
-                    self.sheet.cell(row=14, column=col).alignment = (
-                        Alignment(wrapText=True))
-                    self.sheet.cell(row=14, column=col+1).alignment = (
-                        Alignment(wrapText=True))
-                    self.sheet.cell(row=30, column=col).alignment = (
-                        Alignment(wrapText=True))
-                    self.sheet.cell(row=30, column=col+1).alignment = (
-                        Alignment(wrapText=True))
-
-                    # Headers for data from nordpool
-                    self.sheet.cell(row=1, column=col).value = (
-                        'hour ' + str(i))
-                    self.sheet.cell(row=2, column=col).value = (
-                        'Scheduled\nProduction\n[MWh]')
-                    self.sheet.cell(row=2, column=col+1).value = (
-                        'Scheduled\nConsumption\n[MWh]')
-                    self.sheet.cell(row=2, column=col+2).value = (
-                        'Scheduled\nExchange\n[MWh]')
-
-                    # Headers for exchanges represented as loads
-                    self.sheet.cell(row=14, column=col).value = (
-                        'Active Power\n[MW]')
-                    self.sheet.cell(row=14, column=col+1).value = (
-                        'Reactive Power\n[MW]')
-
-                    # Headers for results after PSS/E
-                    self.sheet.cell(row=30, column=col).value = (
-                        'PSSE\nProduction\n[MWh]')
-                    self.sheet.cell(row=30, column=col+1).value = (
-                        'PSSE\nConsumption\n[MWh]')
-                    self.sheet.cell(row=30, column=col+2).value = (
-                        'PSSE\nExchange\n[MWh]')
-
-                    row = 31
-                    for _, info in self.area_info.items():
-                        # to get the area production complex power
-                        ierr = psspy.ardat(info.number, 'GEN')
-                        self.sheet.cell(row=row, column=col).value = (
-                            round(ierr[1].real, 0))
-
-                        # to get the area consumption complex power
-                        ierr = psspy.ardat(info.number, 'LOAD')
-                        self.sheet.cell(row=row, column=col+1).value = (
-                            round(ierr[1].real, 0))
-                        row += 1
-
-                    # to get the value of the areas active power interchange
-                    ierr, intch = psspy.aareareal(-1, 1, 'PINT')
-                    for r in range(0, len(intch[0])):
-                        self.sheet.cell(
-                            row=31+r,
-                            column=col+2).value = round(intch[0][r].real, 0)
-
-                    # limits check
-                    ierr, busvoltages = psspy.abusreal(sid=-1, string="PU")
-                    if any(x < 0.95 or x > 1.05 for x in busvoltages[0]):
-                        self.sheet.cell(row=43, column=col).value = (
-                            'Bus voltage problem')
-                    ierr, machPGen = psspy.amachreal(sid=-1, string="PGEN")
-                    ierr, machPMax = psspy.amachreal(sid=-1, string="PMAX")
-                    ierr, machPMin = psspy.amachreal(sid=-1, string="PMIN")
-                    ierr, machQGen = psspy.amachreal(sid=-1, string="QGEN")
-                    ierr, machQMax = psspy.amachreal(sid=-1, string="QMAX")
-                    ierr, machQMin = psspy.amachreal(sid=-1, string="QMIN")
-                    ierr, machS = psspy.amachreal(sid=-1, string="MVA")
-                    ierr, machMbase = psspy.amachreal(sid=-1, string="MBASE")
-                    for l in range(0, len(machPGen[0])):
-                        if (machPGen[0][l] <= machPMin[0][l] or
-                                machPGen[0][l] >= machPMax[0][l]):
-                            self.sheet.cell(
-                                row=45,
-                                column=col).value = (
-                                    'Generator active power output problem')
-                for m in range(0, len(machQGen[0])):
-                    if (machQGen[0][m] <= machQMin[0][m] or
-                            machQGen[0][m] >= machQMax[0][m]):
-                        self.sheet.cell(row=46, column=col).value = (
-                            'Generator reactive power output problem')
-                        break
-                for n in range(0, len(machS[0])):
-                    if machS[0][n] >= machMbase[0][n]:
-                        self.sheet.cell(row=47, column=col).value = (
-                            'Generator overloading problem')
-                        break
-                ierr, brflowA = psspy.aflowreal(sid=-1, string="PCTCORPRATEA")
-                if any(x >= 100 for x in brflowA[0]):
-                    self.sheet.cell(row=48, column=col).value = (
-                        'Branch overloading problem (Rate A)')
-                ierr, brflowB = psspy.aflowreal(sid=-1, string="PCTCORPRATEB")
-                if any(x >= 100 for x in brflowB[0]):
-                    self.sheet.cell(row=48, column=col).value = (
-                        'Branch overloading problem (Rate B)')
-                ierr, brflowC = psspy.aflowreal(sid=-1, string="PCTCORPRATEC")
-                if any(x >= 100 for x in brflowC[0]):
-                    self.sheet.cell(row=48, column=col).value = (
-                        'Branch overloading problem (Rate C)')
-            else:
-                print('No convergence')
-                self.sheet.cell(row=43, column=col).value = 'No convergence'
-
-        psspy.close_powerflow()
-
-        # save the Excel file with all data
-        self.wb.save(os.path.join(out_dir, 'PSSE_in_out.xlsx'))
-        os.remove(temp_fname)
-
-    def change_prod_con(self, areas, prod, con, pf, tol=4,
-                        row=None, column=None):
-        """Wrapper function to change load and production
+    def report_hour(self, i, col, ival, out_dir):
+        """Store the solution of one hour and summarize it.
         Args:
-            areas: area number
-            prod: production
-            con: consumption
-            pf: power factor
-            tol: tolerance for round
-            row: which row to write to
-            column: which column to write to
+            i: Hour index
+            col: First excel column of the hour
+            ival: Solution flag, 0 if converged
+            out_dir: The directory where the results are stored
         """
-        psspy.bsys(sid=0, numarea=1, areas=[areas])
-        psspy.scal_2(0, 0, 0,
-                     [0, 1, 1, 1, 0],
-                     [con, prod,
-                      0.0, 0.0, 0.0, 0.0,
-                      round(con*math.tan(math.acos(pf)), tol)])
-        if self.to_excel:
-            self.sheet.cell(row=row, column=column).value = prod
-            self.sheet.cell(row=row, column=column+1).value = con
+        self.flags[i] = ival
+        if ival == 0:
+            print('Convergence')
+            if self.to_excel:
+                self.sheet.set(42, col, 'Convergence')
+
+            self.backend.store_solution(out_dir)
+
+            # save the raw file to convert to CIM
+            self.write_raw(os.path.join(out_dir,
+                                        'h' + str(i) + '_after_PF.raw'))
+            if self.store is not None:
+                with trace.span("store"):
+                    case, result = self.backend.solved_case()
+                    self.store.append_case(self.prefix + 'h' + str(i), case,
+                                           result)
+
+            if self.to_excel:
+                # Merge cells
+                self.sheet.merge(1, col, 1, col+2)
+
+                # Headers for data from nordpool
+                self.sheet.set(1, col, 'hour ' + str(i))
+                self.sheet.set(2, col, 'Scheduled\nProduction\n[MWh]',
+                               wrap=True)
+                self.sheet.set(2, col+1, 'Scheduled\nConsumption\n[MWh]',
+                               wrap=True)
+                self.sheet.set(2, col+2, 'Scheduled\nExchange\n[MWh]',
+                               wrap=True)
+
+                # Headers for exchanges represented as loads
+                self.sheet.set(14, col, 'Active Power\n[MW]', wrap=True)
+                self.sheet.set(14, col+1, 'Reactive Power\n[MW]', wrap=True)
+
+                # Headers for results after PSS/E
+                self.sheet.set(30, col, 'PSSE\nProduction\n[MWh]', wrap=True)
+                self.sheet.set(30, col+1, 'PSSE\nConsumption\n[MWh]',
+                               wrap=True)
+                self.sheet.set(30, col+2, 'PSSE\nExchange\n[MWh]')
+
+                numbers = [info.number for info in self.area_info.values()]
+                gen, load, intch = self.backend.area_results(numbers)
+                row = 31
+                for area_gen, area_load in zip(gen, load):
+                    # the area production and consumption
+                    self.sheet.set(row, col, round(area_gen, 0))
+                    self.sheet.set(row, col+1, round(area_load, 0))
+                    row += 1
+
+                # the value of the areas active power interchange
+                for r in range(0, len(intch)):
+                    self.sheet.set(31+r, col+2, round(intch[r], 0))
+
+            # limits check
+            with trace.span("limits"):
+                table = check_limits(self.backend.limit_data(),
+                                     self.backend.element_names(), hours=[i])
+            self.violations.append(table)
+            if self.to_excel:
+                for row, quantity, message in LIMIT_MESSAGES:
+                    if (table["quantity"] == quantity).any():
+                        self.sheet.set(row, col, message)
+        else:
+            print('No convergence')
+            if self.to_excel:
+                self.sheet.set(43, col, 'No convergence')
 
-    def load_change(self, load, hour, tol=4,
-                    row=None, column=None):
-        """Wrapper function for changing loads in PSS/E
+    def skip_hour(self, i, col):
+        """Leave out an hour with missing market data.
         Args:
-            load: LoadExchange
-            hour: Time of day
-            tol: Tolerance of round
-            row: which row to write to
-            column:which column to write to
+            i: Hour index
+            col: First excel column of the hour
         """
-        country = load.area[0:2]
-        try:
-            realar = -self.data[country]["UT"][load.areas][hour]
-        except IndexError:
-            realar = 0
-            warnings.warn("Missing data filling in zero")
-            with open("warnings.txt", "a") as warn:
-                warn.write("Missing data for " +
-                           load.areas + " at hour " +
-                           str(hour))
-        except KeyError:
-            # Sweden hack
-            temp = load.area + load.areas[2:]
-            realar = -self.data[country]["UT"][temp][hour]
-
-        realar2 = round(realar*math.tan(math.acos(load.pf)), tol)
-
-        # Update the load
-        if country == "FI":
-            area = "FI"
-        else:
-            area = load.area
-        self.data[country]["FB"][area][hour] += (
-            realar)
-
+        self.flags[i] = MISSING_DATA
+        print('Missing market data, hour ' + str(i) + ' is not solved')
         if self.to_excel:
-            self.sheet.cell(row=row, column=column).value = realar
-            self.sheet.cell(row=row, column=column+1).value = realar2
+            self.sheet.set(43, col, 'Missing market data')
 
-        psspy.load_chng_4(load.bus, load.i, realar1=realar, realar2=realar2)
+    def load_solution(self, start_dir, i):
+        """Start from the stored solution of an hour of an earlier run.
+        Args:
+            start_dir: Folder with the solved raw files
+            i: Hour index
+        """
+        fname = os.path.join(start_dir, 'h' + str(i) + '_after_PF.raw')
+        if not os.path.exists(fname):
+            raise IOError("No solution of hour " + str(i) + " to start "
+                          "hour " + str(i + 1) + " from: " + fname)
+        print('Starting from the solution of hour ' + str(i) + '...')
+        self.backend.load_solution(fname)
+
+    def write_raw(self, fname):
+        """Write the working case to a raw file as set by raw_files.
+        Args:
+            fname: Name of the raw file
+        """
+        if self.raw_files == "none":
+            return
+        with trace.span("raw", file=os.path.basename(fname)):
+            self.backend.write_raw(fname,
+                                   defer=self.raw_files == "deferred")
+            if self.raw_files == "now" and trace.enabled():
+                trace.count("bytes", os.path.getsize(fname))
+
+    def scale_areas(self, i, tol=4):
+        """Scale the production and consumption of all areas to an hour.
+        Args:
+            i: Hour index
+            tol: tolerance for round of the reactive consumption
+        """
+        infos = list(self.area_info.values())
+        con = self.setpoints.con[0, i]
+        qcon = [round(area_con*math.tan(math.acos(info.pf)), tol)
+                for area_con, info in zip(con, infos)]
+        unplaced = self.backend.scale_areas(
+            [info.number for info in infos], self.setpoints.prod[0, i], con,
+            qcon)
+        if unplaced is not None and (np.abs(unplaced) > UNPLACED_TOL).any():
+            self.unplaced[i] = np.asarray(unplaced)
+            print('Production not placed within the machine limits: ' +
+                  ', '.join(area + ' ' + str(round(value, 1)) + ' MW'
+                            for area, value in zip(self.area_info, unplaced)
+                            if abs(value) > UNPLACED_TOL))
 
     def area_data(self, i, intgar, realar, arname,
                   row=None, column=None):
@@ -370,77 +460,49 @@ class N44(object):
             column:which column to write to
         """
         if self.to_excel:
-            self.sheet.cell(row=row, column=column).value = realar
-        psspy.area_data(i, intgar, realar1=realar, arname=arname)
-
-    def calculate_exchange(self, info, area, hour):
-        """Calculates area exchanges
-        Args:
-            info: Areainfo
-            area: name of area
-            hour: Hour index
-        Outputs:
-            exchange
-        """
-        exchange = 0
-        temp = self.data[area[0:2]]["UT"]
-        for pos in info.pos:
-            try:
-                exchange += temp[pos][hour]
-            except KeyError:
-                exchange -= temp[flip_area(pos)][hour]
-        for neg in info.neg:
-            try:
-                exchange -= temp[neg][hour]
-            except KeyError:
-                exchange += temp[flip_area(neg)][hour]
-        return exchange
+            self.sheet.set(row, column, realar)
+        self.backend.area_data(i, intgar, realar, arname)
 
     def create_excel_sheet(self):
         """Function to set up the summary excel sheet.
         """
 
-        self.wb = openpyxl.Workbook()
-        sheet = self.wb.active
+        sheet = SheetBuffer()
         # Row and column headings
-        sheet['A3'] = 'NO1'
-        sheet['A4'] = 'NO2'
-        sheet['A5'] = 'NO3'
-        sheet['A6'] = 'NO4'
-        sheet['A7'] = 'NO5'
-        sheet['A8'] = 'SE1'
-        sheet['A9'] = 'SE2'
-        sheet['A10'] = 'SE3'
-        sheet['A11'] = 'SE4'
-        sheet['A12'] = 'FI1'
-        sheet['A14'] = 'Additional loads'
-        sheet['A15'] = 'Bus 3020, area SE3, HVDC link SE3-FI'
-        sheet['A16'] = 'Bus 3360, area SE3, HVDC link SE3-DK1'
-        sheet['A17'] = 'Bus 5610, area NO2, HVDC link NO-DK'
-        sheet['A18'] = 'Bus 5620, area NO2, HVDC link NO-NL'
-        sheet['A19'] = 'Bus 6701, area NO4, exchange NO-FI'
-        sheet['A20'] = 'Bus 6701, area NO4, exchange NO-RU'
-        sheet['A21'] = 'Bus 7000, area FI1, HVDC link FI-SE3'
-        sheet['A22'] = 'Bus 7010, area FI1, HVDC link FI-RU'
-        sheet['A23'] = 'Bus 7020, area FI1, HVDC link FI-EE'
-        sheet['A24'] = 'Bus 7100, area FI1, exchange FI-NO'
-        sheet['A25'] = 'Bus 8500, area SE4, link SE4-DK2'
-        sheet['A26'] = 'Bus 8600, area SE4, HVDC link SE-DE'
-        sheet['A27'] = 'Bus 8700, area SE4, HVDC link SE-PL'
-        sheet['A30'] = 'Results after Power Flow in PSSE'
-        sheet['A31'] = 'NO1'
-        sheet['A32'] = 'NO2'
-        sheet['A33'] = 'NO3'
-        sheet['A34'] = 'NO4'
-        sheet['A35'] = 'NO5'
-        sheet['A36'] = 'SE1'
-        sheet['A37'] = 'SE2'
-        sheet['A38'] = 'SE3'
-        sheet['A39'] = 'SE4'
-        sheet['A40'] = 'FI1'
+        sheet.set(3, 1, 'NO1')
+        sheet.set(4, 1, 'NO2')
+        sheet.set(5, 1, 'NO3')
+        sheet.set(6, 1, 'NO4')
+        sheet.set(7, 1, 'NO5')
+        sheet.set(8, 1, 'SE1')
+        sheet.set(9, 1, 'SE2')
+        sheet.set(10, 1, 'SE3')
+        sheet.set(11, 1, 'SE4')
+        sheet.set(12, 1, 'FI1')
+        sheet.set(14, 1, 'Additional loads')
+        sheet.set(15, 1, 'Bus 3020, area SE3, HVDC link SE3-FI')
+        sheet.set(16, 1, 'Bus 3360, area SE3, HVDC link SE3-DK1')
+        sheet.set(17, 1, 'Bus 5610, area NO2, HVDC link NO-DK')
+        sheet.set(18, 1, 'Bus 5620, area NO2, HVDC link NO-NL')
+        sheet.set(19, 1, 'Bus 6701, area NO4, exchange NO-FI')
+        sheet.set(20, 1, 'Bus 6701, area NO4, exchange NO-RU')
+        sheet.set(21, 1, 'Bus 7000, area FI1, HVDC link FI-SE3')
+        sheet.set(22, 1, 'Bus 7010, area FI1, HVDC link FI-RU')
+        sheet.set(23, 1, 'Bus 7020, area FI1, HVDC link FI-EE')
+        sheet.set(24, 1, 'Bus 7100, area FI1, exchange FI-NO')
+        sheet.set(25, 1, 'Bus 8500, area SE4, link SE4-DK2')
+        sheet.set(26, 1, 'Bus 8600, area SE4, HVDC link SE-DE')
+        sheet.set(27, 1, 'Bus 8700, area SE4, HVDC link SE-PL')
+        sheet.set(30, 1, 'Results after Power Flow in PSSE')
+        sheet.set(31, 1, 'NO1')
+        sheet.set(32, 1, 'NO2')
+        sheet.set(33, 1, 'NO3')
+        sheet.set(34, 1, 'NO4')
+        sheet.set(35, 1, 'NO5')
+        sheet.set(36, 1, 'SE1')
+        sheet.set(37, 1, 'SE2')
+        sheet.set(38, 1, 'SE3')
+        sheet.set(39, 1, 'SE4')
+        sheet.set(40, 1, 'FI1')
         self.sheet = sheet
 
-
-def flip_area(code):
-    """Flip area string"""
-    return code[4:] + "_" + code[0:3]
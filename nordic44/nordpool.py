@@ -1,8 +1,11 @@
 """Module for getting data from nordpool."""
 import os
+import ftplib
 from ftplib import FTP
-from openpyxl import Workbook
-from pandas import ExcelFile
+from datetime import timedelta
+import numpy as np
+from openpyxl import load_workbook
+from nordic44.excel import SheetBuffer
 
 
 def fix_digit(x):
@@ -17,33 +20,376 @@ def fix_digit(x):
         return x
 
 
-def read_excel(fname, header=None):
+# Weekly operating data file prefix of each country
+FILE_PREFIX = {"Norway": "pono", "Sweden": "pose", "Finland": "pofi"}
+
+
+def week_file(country, date):
+    """Weekly operating data file holding a date.
+    Args:
+        country: Norway, Sweden or Finland
+        date: The date
+    Output:
+        (file name, list of folders below Operating_data)
+    """
+    # The first days of a year can be in the file of the 53 week
+    # of the previous year and the last days in week 1 of the next.
+    # The file is kept in the folder of its year, not of the date.
+    year, week = date.isocalendar()[0:2]
+    year_str = str(year)
+
+    fname = (FILE_PREFIX[country] + fix_digit(year_str[2:]) +
+             fix_digit(str(week)) + ".sdv")
+    folders = [country]
+    if year < 2016:
+        folders.append(year_str)
+    return fname, folders
+
+
+def iter_sdv(lines, codes=("PS", "FB", "UT")):
+    """Parse the lines of a weekly operating data file as they arrive.
+
+    Only the current line is held in memory, so the lines can come
+    straight from a file or from the ftp data connection.
+    Args:
+        lines: Iterable of lines
+        codes: NordPool codes to keep, for instance PS and FB
+    Output:
+        generator of (weekday, code, area, values) where weekday is "1"
+        for Monday and values is a float array with the hourly values and
+        the sum of the day
+    """
+    for line in lines:
+        temp = line.rstrip("\r\n").split(";")
+        if len(temp) > 6 and temp[0] in codes and temp[1] == temp[0][0]:
+            yield (temp[4], temp[0], temp[6],
+                   np.array([value for value in temp[7:] if value != ""],
+                            dtype=float))
+
+
+def split_weekdays(lines, codes=("PS", "FB", "UT")):
+    """Split a weekly file by weekday in a single pass.
+    Args:
+        lines: Iterable of lines of the .sdv file
+        codes: NordPool codes to keep
+    Output:
+        dictionary from weekday ("1" is Monday) to a list of
+        (code, area, values)
+    """
+    days = dict()
+    for weekday, code, area, values in iter_sdv(lines, codes):
+        days.setdefault(weekday, []).append((code, area, values))
+    return days
+
+
+def read_sdv(fname, codes=("PS", "FB", "UT")):
+    """Read a weekly operating data file from disk, see split_weekdays."""
+    with open(fname) as lines:
+        return split_weekdays(lines, codes)
+
+
+class FtpFetcher(object):
+    """One logged-in session to the Nordpool ftp server for a whole run.
+
+    The weekly file of each country is downloaded once and split by
+    weekday, the following days of the same week are served from memory.
+    With a cache directory the files are also kept on disk and never
+    downloaded again, see nordic44.cache. prefetch downloads the files of
+    many dates concurrently, see nordic44.asyncftp.
+
+    Args:
+        user: The user name for the server
+        passwd: The password for the server
+        host: The ftp server
+        cache_dir: Folder of the local file cache, no cache by default
+        offline: Only use the cache and never connect to the server
+        port: Port of the ftp server
+    """
+
+    def __init__(self, user, passwd, host="ftp.nordpoolspot.com",
+                 cache_dir=None, offline=False, port=21):
+        self.user = user
+        self.passwd = passwd
+        self.host = host
+        self.port = port
+        if offline and not cache_dir:
+            raise ValueError("The offline mode needs a cache directory")
+        self.offline = offline
+        self.cache = None
+        if cache_dir:
+            from nordic44.cache import WeekCache
+            self.cache = WeekCache(cache_dir)
+        self.codes = ["PS", "FB", "UT"]
+        self.ftp = None
+        # Last weekly file of each country: (file name, split_weekdays)
+        self.weeks = dict()
+        # split_weekdays of the prefetched files by server path
+        self.prefetched = dict()
+
+    def connect(self):
+        """Log in unless there is an open session."""
+        if self.ftp is None:
+            ftp = FTP()
+            ftp.connect(self.host, self.port)
+            ftp.login(user=self.user, passwd=self.passwd)
+            ftp.cwd("Operating_data")
+            self.ftp = ftp
+        return self.ftp
+
+    def retrieve(self, fname, folders):
+        """Stream the lines of a file from the server.
+        Args:
+            fname: Name of the file
+            folders: Folders below Operating_data
+        Output:
+            generator of lines without line endings
+        """
+        for attempt in range(2):
+            ftp = self.connect()
+            try:
+                for folder in folders:
+                    ftp.cwd(folder)
+                ftp.sendcmd("TYPE A")
+                conn = ftp.transfercmd("RETR " + fname)
+                break
+            except (EOFError, OSError, ftplib.error_temp):
+                # The server drops idle sessions, log in again once
+                self.drop()
+                if attempt:
+                    raise
+            except ftplib.Error:
+                # e.g. a missing file, the session may be left in a folder
+                # of the file
+                self.drop()
+                raise
+        finished = False
+        try:
+            with conn, conn.makefile("r", encoding=ftp.encoding) as lines:
+                for line in lines:
+                    yield line.rstrip("\r\n")
+            ftp.voidresp()
+            ftp.cwd("/".join([".."]*len(folders)))
+            finished = True
+        finally:
+            # A transfer that failed or was not read to its end leaves the
+            # session in an unknown folder, the next file logs in again
+            if not finished:
+                self.drop()
+
+    def drop(self):
+        """Close the session without logging out, the next file logs in
+        again."""
+        if self.ftp is not None:
+            try:
+                self.ftp.close()
+            except ftplib.all_errors:
+                pass
+            self.ftp = None
+
+    def fetch(self, fname, folders):
+        """Lines of a weekly file, from the cache if possible.
+        Args:
+            fname: Name of the file
+            folders: Folders below Operating_data
+        Output:
+            iterable of lines
+        """
+        key = "/".join(folders + [fname])
+        if self.cache is not None:
+            content = self.cache.get(key)
+            if content is not None:
+                return content
+        if self.offline:
+            raise IOError(key + " is not in the cache")
+        if self.cache is None:
+            return self.retrieve(fname, folders)
+        return self._store(key, self.retrieve(fname, folders))
+
+    def _store(self, key, lines):
+        """Pass lines on and add the complete file to the cache."""
+        content = []
+        for line in lines:
+            content.append(line)
+            yield line
+        self.cache.put(key, content)
+
+    def rows(self, country, date):
+        """Parsed lines of the weekly file of a country for one date.
+        Args:
+            country: Norway, Sweden or Finland
+            date: The date
+        """
+        fname, folders = week_file(country, date)
+        if self.weeks.get(country, (None,))[0] != fname:
+            key = "/".join(folders + [fname])
+            days = self.prefetched.pop(key, None)
+            if days is None:
+                days = split_weekdays(self.fetch(fname, folders), self.codes)
+            self.weeks[country] = (fname, days)
+        return self.weeks[country][1].get(str(date.weekday()+1), [])
+
+    def prefetch(self, dates, countries=("Norway", "Sweden", "Finland"),
+                 parallel=3, retries=3, backoff=0.5):
+        """Download the weekly files of many dates concurrently.
+
+        The files that are not cached are downloaded over at most parallel
+        ftp sessions and kept parsed until rows asks for them. Files that
+        fail are downloaded again by rows, which raises the error.
+        Args:
+            dates: The dates
+            countries: The countries of the files
+            parallel, retries, backoff: see asyncftp.fetch_weeks
+        Output:
+            number of downloaded files
+        """
+        if self.offline:
+            return 0
+        skip = set(self.prefetched)
+        if self.cache is not None:
+            skip.update(self.cache.read_index())
+        files = []
+        for date in dates:
+            for country in countries:
+                fname, folders = week_file(country, date)
+                key = "/".join(folders + [fname])
+                if key not in skip:
+                    skip.add(key)
+                    files.append((key, fname, folders))
+        if not files:
+            return 0
+        from nordic44.asyncftp import fetch_weeks
+        results, _ = fetch_weeks(files, self.host, self.user, self.passwd,
+                                 port=self.port, parallel=parallel,
+                                 retries=retries, backoff=backoff,
+                                 codes=self.codes,
+                                 keep_lines=self.cache is not None)
+        for key, (days, lines) in results.items():
+            if self.cache is not None:
+                self.cache.put(key, lines)
+            self.prefetched[key] = days
+        return len(results)
+
+    def close(self):
+        """Log out from the server."""
+        if self.ftp is not None:
+            try:
+                self.ftp.quit()
+            except ftplib.all_errors:
+                self.ftp.close()
+            self.ftp = None
+
+
+def read_range_from_ftp(start_date, end_date, user, passwd, cache_dir=None,
+                        offline=False, parallel=3):
+    """Read the data of a date range sharing one ftp session.
+
+    The weekly files of the range are downloaded concurrently first, see
+    FtpFetcher.prefetch.
+    Args:
+        start_date: First date
+        end_date: Last date
+        user: The user name for the server
+        passwd: The password for the server
+        cache_dir, offline: see FtpFetcher
+        parallel: Number of concurrent ftp sessions
+    Output:
+        list of NordPool objects, one per date
+    """
+    fetcher = FtpFetcher(user, passwd, cache_dir=cache_dir, offline=offline)
+    dates = [start_date + timedelta(i)
+             for i in range((end_date-start_date).days + 1)]
+    days = []
+    try:
+        fetcher.prefetch(dates, parallel=parallel)
+        for date in dates:
+            nord = NordPool(date)
+            nord.read_data_from_ftp(user, passwd, fetcher)
+            days.append(nord)
+    finally:
+        fetcher.close()
+    return days
+
+
+def read_sheet(fname):
+    """Read a market data file in the iTesla format.
+
+    The format is the one of write_data_to_excel: a title row, a row with
+    the date followed by the area names and one row per hour ending with
+    the daily sum.
+    Args:
+        fname: name of excel file
+    Output:
+        (date, dictionary from area name to float array)
+    """
+    wb = load_workbook(fname, read_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        next(rows)
+        header = next(rows)
+        names = [str(name).replace(" - ", "_") for name in header[1:]
+                 if name is not None]
+        columns = [[] for _ in names]
+        for row in rows:
+            if row[0] is None:
+                break
+            for column, value in zip(columns, row[1:]):
+                if value is not None:
+                    column.append(value)
+    finally:
+        wb.close()
+    return header[0], dict((name, np.array(column, dtype=float))
+                           for name, column in zip(names, columns))
+
+
+def read_sheets(fnames, cache_dir=None, workers=None):
+    """Read market data files in the iTesla format concurrently.
+    Args:
+        fnames: list of excel file names
+        cache_dir: Folder memoizing the parsed files, see SheetCache
+        workers: Number of threads, default one per file
+    Output:
+        list of (date, dictionary from area name to float array) in the
+        order of fnames
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from nordic44.cache import SheetCache
+    cache = SheetCache(cache_dir) if cache_dir else None
+
+    def read(fname):
+        """Parse a file or take it from the cache."""
+        if cache is not None:
+            parsed = cache.get(fname)
+            if parsed is not None:
+                return parsed
+        parsed = read_sheet(fname)
+        if cache is not None:
+            cache.put(fname, *parsed)
+        return parsed
+
+    if not fnames:
+        return []
+    with ThreadPoolExecutor(workers or len(fnames)) as executor:
+        return list(executor.map(read, fnames))
+
+
+def read_excel(fname, header=None, cache_dir=None):
     """Read excel into dict.
     Args:
         fname: name of excel file
-        header: The finland files does not have a header
+        header: Name of the area for files with a single unnamed column,
+            i.e. Finland
+        cache_dir: Folder memoizing the parsed files, see SheetCache
     Output:
-        dictionary containing the data
+        dictionary from area name to float array
     """
-    xls = ExcelFile(fname)
-    if header:
-        parse_cols = [1]
-    else:
-        parse_cols = None
-
-    df = xls.parse(xls.sheet_names[0], skiprows=1,
-                   parse_cols=parse_cols)
+    return _rename(read_sheets([fname], cache_dir)[0][1], header)
 
-    # Fix keys
-    temp = df.to_dict()
-    for key in temp:
-        new_key = key.replace(" - ", "_")
-        temp[new_key] = temp.pop(key)
-    # Stupid hack for Finland
-    if header:
-        temp[header] = temp.pop(temp.keys()[0])
 
-    return temp
+def _rename(columns, header):
+    """Stupid hack for Finland"""
+    if header and columns:
+        return {header: list(columns.values())[0]}
+    return columns
 
 
 class NordPool():
@@ -82,68 +428,57 @@ class NordPool():
             data: data to add to the dict
         """
         x = getattr(self, country)
-        x[code][key] = map(int, filter(lambda val: val != "", data))
+        x[code][key] = np.asarray(data, dtype=float)
 
-    def read_data_from_ftp(self, user, passwd):
+    def add_rows(self, country, rows):
+        """Add parsed lines of a weekly file belonging to the date.
+        Args:
+            country: The country to do the operation for
+            rows: (code, area, values) as returned by split_weekdays
+        """
+        for code, area, values in rows:
+            self.add_content(country, area, code, values)
+
+    def read_data_from_ftp(self, user, passwd, fetcher=None, cache_dir=None,
+                           offline=False):
         """Function to read in the data from NordPool
         Args:
             user: The user name for the server
             passwd: The password for the server
+            fetcher: FtpFetcher shared between dates, by default a new
+                session is opened for this date
+            cache_dir, offline: see FtpFetcher, used without a fetcher
+        """
+        own = fetcher is None
+        if own:
+            fetcher = FtpFetcher(user, passwd, cache_dir=cache_dir,
+                                 offline=offline)
+        try:
+            if own:
+                # The files of the three countries at once
+                fetcher.prefetch([self.date], self.countries)
+            for country in self.countries:
+                self.add_rows(country, fetcher.rows(country, self.date))
+        finally:
+            if own:
+                fetcher.close()
+
+    def read_data_from_sdv(self, no_file, se_file, fi_file):
+        """Read the date from local copies of the weekly files.
+        Args:
+            no_file: Weekly operating data file of Norway (pono)
+            se_file: Weekly operating data file of Sweden (pose)
+            fi_file: Weekly operating data file of Finland (pofi)
         """
-        ftp = FTP("ftp.nordpoolspot.com")
-
-        ftp.login(user=user, passwd=passwd)
-        ftp.cwd("Operating_data")
-
-        fnames = ["pono", "pose", "pofi"]
-
-        week = self.date.isocalendar()[1]
-
-        # The first days of a year can be in the file of the 53 week
-        # of the previous year
-        if week == 53:
-            year_str = str(self.date.year-1)
-        else:
-            year_str = str(self.date.year)
-
         week_day = str(self.date.weekday()+1)
-
-        week_str = fix_digit(str(week))
-        year_2_str = fix_digit(year_str[2:])
-
-        back = ".."
-        i = 0
-        for country in self.countries:
-            content = []
-            ftp.cwd(country)
-
-            if self.date.year < 2016:
-                ftp.cwd(year_str)
-                back = "../.."
-
-            ftp.retrlines(
-                "RETR " + fnames[i] + year_2_str + week_str + ".sdv",
-                content.append)
-
-            temp = []
-            for line in content:
-                temp[:] = line.split(";")
-                if len(temp) > 3 and temp[4] == week_day:
-                    if temp[0] == self.code[0] and temp[1] == self.code[0][0]:
-                        self.add_content(country, temp[6], self.code[0],
-                                         temp[7:])
-                    if temp[0] == self.code[1] and temp[1] == self.code[1][0]:
-                        self.add_content(country, temp[6], self.code[1],
-                                         temp[7:])
-                    if temp[0] == self.code[2] and temp[1] == self.code[2][0]:
-                        self.add_content(country, temp[6], self.code[2],
-                                         temp[7:])
-            ftp.cwd(back)
-            i = i + 1
+        for country, fname in zip(self.countries,
+                                  [no_file, se_file, fi_file]):
+            self.add_rows(country, read_sdv(fname, self.code).get(week_day,
+                                                                  []))
 
     def read_data_from_excel(self, no_prod, se_prod, fi_prod,
                              no_con, se_con, fi_con,
-                             no_ex, se_ex, fi_ex):
+                             no_ex, se_ex, fi_ex, cache_dir=None):
         """ Method for reading nordpool data from excel
         Args:
             no_prod: Excel file containing Norway's production data
@@ -155,20 +490,18 @@ class NordPool():
             no_ex: Excel file containing Norway's exchange data
             se_ex: Excel file containing Sweden's exchange data
             fi_ex: Excel file containing Finland's exchange data
+            cache_dir: Folder memoizing the parsed files, see SheetCache
         """
-        self.data["NO"]["PS"] = read_excel(no_prod)
-        self.data["SE"]["PS"] = read_excel(se_prod)
-        self.data["FI"]["PS"] = read_excel(fi_prod,
-                                           header="FI")
-
-        self.data["NO"]["FB"] = read_excel(no_con)
-        self.data["SE"]["FB"] = read_excel(se_con)
-        self.data["FI"]["FB"] = read_excel(fi_con,
-                                           header="FI")
-
-        self.data["NO"]["UT"] = read_excel(no_ex)
-        self.data["SE"]["UT"] = read_excel(se_ex)
-        self.data["FI"]["UT"] = read_excel(fi_ex)
+        fnames = [no_prod, se_prod, fi_prod,
+                  no_con, se_con, fi_con,
+                  no_ex, se_ex, fi_ex]
+        sheets = iter(read_sheets(fnames, cache_dir))
+        for code in self.code:
+            for cc in ["NO", "SE", "FI"]:
+                columns = next(sheets)[1]
+                if cc == "FI" and code != "UT":
+                    columns = _rename(columns, "FI")
+                self.data[cc][code] = columns
 
     def write_data_to_excel(self, out_dir=None):
         """Write the data to excel in the iTesla format."""
@@ -180,30 +513,18 @@ class NordPool():
             temp = getattr(self, country)
             for code, name in zip(self.code, fnames):
                 x = temp[code]
-                wb = Workbook()
-                ws = wb.active
-                ws.append([name + " in MWh/h"])
-                ws.append([self.date])
-
-                # Add area headers
-                column = 2
-                for key in x:
-                    ws.cell(row=2, column=column).value = key
-                    column = column + 1
+                sheet = SheetBuffer()
+                sheet.append([name + " in MWh/h"])
+                # Date and area headers
+                sheet.append([self.date] + list(x))
                 for i in range(3, 28):
                     if i == 27:
                         value = "SUM"
                     else:
                         value = str(i-3) + " - " + str(i-2)
-                    ws.cell(row=i, column=1).value = value
-
-                column = 2
-                row = 3
-                for key in x:
-                    for data in x[key]:
-                        value = data
-                        ws.cell(row=row, column=column).value = value
-                        row = row + 1
-                    column = column + 1
-                    row = 3
-                wb.save(os.path.join(out_dir, name + "_" + cc + ".xlsx"))
+                    sheet.set(i, 1, value)
+
+                for column, key in enumerate(x, 2):
+                    for row, value in enumerate(x[key], 3):
+                        sheet.set(row, column, value)
+                sheet.save(os.path.join(out_dir, name + "_" + cc + ".xlsx"))
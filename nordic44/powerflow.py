@@ -0,0 +1,1166 @@
+"""Native AC power flow for cases read with nordic44.rawcase.
+
+A full Newton-Raphson solution with a sparse Jacobian, mirroring the
+adjustments requested from PSS/E in N44.update_raw_files (fnsl with tap
+stepping, area interchange control on tie lines and loads and generator
+reactive limits applied immediately).
+"""
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+
+# PSS/E bus types
+PQ = 1
+PV = 2
+REF = 3
+ISOLATED = 4
+
+
+def transformer_admittances(case, windv1=None):
+    """Two-port admittances of the two-winding transformers.
+    Args:
+        case: RawCase
+        windv1: optional winding 1 ratios replacing the case ones, either
+            one value per transformer or a (transformer, snapshot) array
+    Output:
+        (yff, yft, ytf, ytt) in pu, with the shape of windv1
+    """
+    sbase = case.sbase
+    trafo = case.transformer
+
+    # Impedance on system base
+    r12 = trafo["r1_2"].copy()
+    x12 = trafo["x1_2"].copy()
+    on_winding = trafo["cz"] == 2
+    r12[on_winding] *= sbase/trafo["sbase1_2"][on_winding]
+    x12[on_winding] *= sbase/trafo["sbase1_2"][on_winding]
+    losses = trafo["cz"] == 3
+    if losses.any():
+        r_loss = trafo["r1_2"][losses]/(1e6*trafo["sbase1_2"][losses])
+        x_loss = np.sqrt(np.maximum(trafo["x1_2"][losses]**2 - r_loss**2,
+                                    0.0))
+        r12[losses] = r_loss*sbase/trafo["sbase1_2"][losses]
+        x12[losses] = x_loss*sbase/trafo["sbase1_2"][losses]
+    yt = 1.0/(r12 + 1j*x12)
+    ymag = trafo["mag1"] + 1j*trafo["mag2"]
+    on_winding_mag = trafo["cm"] == 2
+    if on_winding_mag.any():
+        # Magnetizing given as no load loss in W and current in pu
+        loss = trafo["mag1"][on_winding_mag]/(1e6*sbase)
+        current = trafo["mag2"][on_winding_mag]*(
+            trafo["sbase1_2"][on_winding_mag]/sbase)
+        ymag[on_winding_mag] = loss - 1j*np.sqrt(
+            np.maximum(current**2 - loss**2, 0.0))
+
+    # Off-nominal ratios in pu, the winding 1 ratio scales with windv1
+    ratio1, ratio2 = case.transformer_ratios()
+    rotation = np.exp(1j*np.radians(trafo["ang1"]))
+    if windv1 is not None:
+        windv1 = np.asarray(windv1, dtype=float)
+        factor = np.where(trafo["windv1"] != 0,
+                          ratio1/np.where(trafo["windv1"] != 0,
+                                          trafo["windv1"], 1.0), 1.0)
+        if windv1.ndim == 2:
+            yt, ymag, ratio2, rotation, factor = [
+                x[:, None] for x in (yt, ymag, ratio2, rotation, factor)]
+        ratio1 = factor*windv1
+    tap = ratio1*rotation
+    yff = yt/(tap*np.conj(tap)) + ymag
+    yft = -yt/(np.conj(tap)*ratio2)
+    ytf = -yt/(tap*ratio2)
+    ytt = np.broadcast_to(yt/ratio2**2, np.shape(tap)).copy()
+    return yff, yft, ytf, ytt
+
+
+def element_admittances(case):
+    """Pi-model admittances of all branches and two-winding transformers.
+
+    Branches come first, followed by the transformers, in the order of the
+    case arrays.
+    Args:
+        case: RawCase
+    Output:
+        dict with the from and to bus numbers, the four admittances of the
+        two-port (yff, yft, ytf, ytt) in pu, the in service status and the
+        ratings A, B and C.
+    """
+    branch = case.branch
+    trafo = case.transformer
+
+    # Branches: series impedance, line charging and line shunts
+    ys = 1.0/(branch["r"] + 1j*branch["x"])
+    bc = 1j*branch["b"]/2.0
+    yff_br = ys + bc + branch["gi"] + 1j*branch["bi"]
+    ytt_br = ys + bc + branch["gj"] + 1j*branch["bj"]
+
+    yff_tr, yft_tr, ytf_tr, ytt_tr = transformer_admittances(case)
+
+    return {
+        "from": np.concatenate([branch["i"], trafo["i"]]),
+        "to": np.concatenate([branch["j"], trafo["j"]]),
+        "yff": np.concatenate([yff_br, yff_tr]),
+        "yft": np.concatenate([-ys, yft_tr]),
+        "ytf": np.concatenate([-ys, ytf_tr]),
+        "ytt": np.concatenate([ytt_br, ytt_tr]),
+        "status": np.concatenate([branch["st"] != 0, trafo["stat"] != 0]),
+        "rates": np.vstack([
+            np.concatenate([branch["ratea"], trafo["rata1"]]),
+            np.concatenate([branch["rateb"], trafo["ratb1"]]),
+            np.concatenate([branch["ratec"], trafo["ratc1"]])])}
+
+
+# Sparse matrices of a Network, stored by their CSR arrays in matrices
+NETWORK_MATRICES = ["ybus", "yf", "yt"]
+
+
+class Network(object):
+    """Admittance model of a RawCase.
+
+    Args:
+        case: RawCase the network is built from
+        matrices: prebuilt model from matrices() of the same case, e.g.
+            from a compiled case, instead of building it
+    """
+
+    def __init__(self, case, matrices=None):
+        self.case = case
+        self.sbase = case.sbase
+        self.nbus = len(case.bus)
+        self.bus_number = case.bus["number"]
+        self.ybus = None
+        self.yf = None
+        self.yt = None
+        self.f = None
+        self.t = None
+        self.rates = None
+        if matrices is None:
+            self.load_bus = case.bus_index(case.load["bus"])
+            self.gen_bus = case.bus_index(case.generator["bus"])
+            self.shunt_bus = case.bus_index(case.fixed_shunt["bus"])
+            self.build()
+        else:
+            self.load_bus = matrices["load_bus"]
+            self.gen_bus = matrices["gen_bus"]
+            self.shunt_bus = matrices["shunt_bus"]
+            self.f = matrices["f"]
+            self.t = matrices["t"]
+            self.rates = matrices["rates"]
+            for name in NETWORK_MATRICES:
+                setattr(self, name, sparse.csr_matrix(
+                    (matrices[name + "_data"], matrices[name + "_indices"],
+                     matrices[name + "_indptr"]),
+                    shape=tuple(matrices[name + "_shape"])))
+
+    def matrices(self):
+        """The built model as plain arrays, see the matrices argument.
+        Output:
+            dictionary of arrays
+        """
+        arrays = {"load_bus": self.load_bus, "gen_bus": self.gen_bus,
+                  "shunt_bus": self.shunt_bus, "f": self.f, "t": self.t,
+                  "rates": self.rates}
+        for name in NETWORK_MATRICES:
+            matrix = getattr(self, name)
+            arrays[name + "_data"] = matrix.data
+            arrays[name + "_indices"] = matrix.indices
+            arrays[name + "_indptr"] = matrix.indptr
+            arrays[name + "_shape"] = np.array(matrix.shape)
+        return arrays
+
+    def build(self):
+        """Build the bus admittance matrix and the branch flow matrices.
+
+        Has to be called again when transformer ratios change.
+        """
+        case = self.case
+        elements = element_admittances(case)
+        on = elements["status"]
+        nel = len(on)
+        self.f = case.bus_index(elements["from"])
+        self.t = case.bus_index(elements["to"])
+        self.rates = elements["rates"]
+        yff = np.where(on, elements["yff"], 0.0)
+        yft = np.where(on, elements["yft"], 0.0)
+        ytf = np.where(on, elements["ytf"], 0.0)
+        ytt = np.where(on, elements["ytt"], 0.0)
+
+        shunt = self.shunts()
+
+        rows = np.arange(nel)
+        shape = (nel, self.nbus)
+        self.yf = sparse.csr_matrix(
+            (np.concatenate([yff, yft]),
+             (np.concatenate([rows, rows]), np.concatenate([self.f, self.t]))),
+            shape=shape)
+        self.yt = sparse.csr_matrix(
+            (np.concatenate([ytf, ytt]),
+             (np.concatenate([rows, rows]), np.concatenate([self.f, self.t]))),
+            shape=shape)
+        connection_f = sparse.csr_matrix(
+            (np.ones(nel), (rows, self.f)), shape=shape)
+        connection_t = sparse.csr_matrix(
+            (np.ones(nel), (rows, self.t)), shape=shape)
+        self.ybus = (connection_f.T*self.yf + connection_t.T*self.yt +
+                     sparse.diags(shunt)).tocsr()
+
+    def shunts(self):
+        """Fixed shunts and constant admittance loads in pu per bus."""
+        case = self.case
+        shunt = np.zeros(self.nbus, dtype=complex)
+        on_shunt = case.fixed_shunt["status"] != 0
+        np.add.at(shunt, self.shunt_bus[on_shunt],
+                  (case.fixed_shunt["gl"][on_shunt] +
+                   1j*case.fixed_shunt["bl"][on_shunt])/self.sbase)
+        on_load = case.load["status"] != 0
+        np.add.at(shunt, self.load_bus[on_load],
+                  (case.load["yp"][on_load] +
+                   1j*case.load["yq"][on_load])/self.sbase)
+        return shunt
+
+    def injections(self):
+        """Scheduled bus injections from the case generators and loads.
+        Output:
+            (sgen, sload, iload) complex arrays in pu, where sload is the
+            constant power and iload the constant current part of the loads
+        """
+        case = self.case
+        gen_on = self.generators_in_service()
+        sgen = np.zeros(self.nbus, dtype=complex)
+        np.add.at(sgen, self.gen_bus[gen_on],
+                  case.generator["pg"][gen_on] +
+                  1j*case.generator["qg"][gen_on])
+        load_on = case.load["status"] != 0
+        sload = np.zeros(self.nbus, dtype=complex)
+        np.add.at(sload, self.load_bus[load_on],
+                  case.load["pl"][load_on] + 1j*case.load["ql"][load_on])
+        iload = np.zeros(self.nbus, dtype=complex)
+        np.add.at(iload, self.load_bus[load_on],
+                  case.load["ip"][load_on] + 1j*case.load["iq"][load_on])
+        return sgen/self.sbase, sload/self.sbase, iload/self.sbase
+
+    def generators_in_service(self):
+        """Mask of the machines in service at energized buses."""
+        return ((self.case.generator["stat"] != 0) &
+                (self.case.bus["ide"][self.gen_bus] != ISOLATED))
+
+    def bus_types(self):
+        """Bus types, PV buses without machines in service become PQ."""
+        ide = self.case.bus["ide"].copy()
+        has_gen = np.zeros(self.nbus, dtype=bool)
+        has_gen[self.gen_bus[self.generators_in_service()]] = True
+        ide[(ide == PV) & ~has_gen] = PQ
+        return ide
+
+
+def dsbus_dv(ybus, v):
+    """Partial derivatives of the bus injections w.r.t. voltage.
+    Args:
+        ybus: sparse bus admittance matrix
+        v: complex bus voltages
+    Output:
+        (dS/dVm, dS/dVa) sparse matrices
+    """
+    ibus = ybus*v
+    diag_v = sparse.diags(v)
+    diag_i = sparse.diags(ibus)
+    diag_vnorm = sparse.diags(v/np.abs(v))
+    ds_dvm = (diag_v*np.conj(ybus*diag_vnorm) +
+              np.conj(diag_i)*diag_vnorm)
+    ds_dva = 1j*diag_v*np.conj(diag_i - ybus*diag_v)
+    return ds_dvm, ds_dva
+
+
+def newton_raphson(ybus, sbus, iload, v0, pv, pq, tol=1e-4, max_iter=20):
+    """Solve the power flow equations with Newton-Raphson.
+    Args:
+        ybus: sparse bus admittance matrix
+        sbus: specified constant power injections in pu
+        iload: constant current load in pu at 1 pu voltage
+        v0: complex initial voltages
+        pv: indices of PV buses
+        pq: indices of PQ buses
+        tol: mismatch tolerance in pu
+        max_iter: maximum number of iterations
+    Output:
+        (v, converged, iterations, mismatch)
+    """
+    v = v0.copy()
+    vm = np.abs(v)
+    va = np.angle(v)
+    pvpq = np.concatenate([pv, pq])
+    npvpq = len(pvpq)
+
+    def mismatch(v):
+        mis = v*np.conj(ybus*v) - sbus + iload*np.abs(v)
+        return np.concatenate([mis[pvpq].real, mis[pq].imag])
+
+    f = mismatch(v)
+    norm = np.max(np.abs(f)) if len(f) else 0.0
+    iterations = 0
+    while norm > tol and iterations < max_iter:
+        iterations += 1
+        ds_dvm, ds_dva = dsbus_dv(ybus, v)
+        ds_dvm = ds_dvm + sparse.diags(iload)
+        j11 = ds_dva[pvpq, :][:, pvpq].real
+        j12 = ds_dvm[pvpq, :][:, pq].real
+        j21 = ds_dva[pq, :][:, pvpq].imag
+        j22 = ds_dvm[pq, :][:, pq].imag
+        jac = sparse.bmat([[j11, j12], [j21, j22]], format="csc")
+        dx = spsolve(jac, -f)
+        va[pvpq] += dx[:npvpq]
+        vm[pq] += dx[npvpq:]
+        v = vm*np.exp(1j*va)
+        f = mismatch(v)
+        norm = np.max(np.abs(f)) if len(f) else 0.0
+        if not np.isfinite(norm):
+            break
+    return v, norm <= tol, iterations, norm
+
+
+def share(total, groups, weights, size):
+    """Split group totals between members in proportion to weights.
+    Args:
+        total: array with one value per group, or one row per group and
+            one column per snapshot
+        groups: group index of each member
+        weights: weight of each member
+        size: number of groups
+    Output:
+        array with the share of each member
+    """
+    weight_sum = np.zeros(size)
+    count = np.zeros(size)
+    np.add.at(weight_sum, groups, weights)
+    np.add.at(count, groups, 1.0)
+    ratio = np.where(weight_sum[groups] > 0,
+                     weights/np.where(weight_sum[groups] > 0,
+                                      weight_sum[groups], 1.0),
+                     1.0/np.maximum(count[groups], 1.0))
+    if np.ndim(total) == 2:
+        # One column per snapshot
+        ratio = ratio[:, None]
+    return total[groups]*ratio
+
+
+def area_totals(positions, values, count):
+    """Sum values per area.
+    Args:
+        positions: area position of every value, -1 outside the areas
+        values: array with one row per position
+        count: number of areas
+    Output:
+        array with one row per area
+    """
+    values = np.asarray(values)
+    inside = positions >= 0
+    total = np.zeros((count,) + values.shape[1:])
+    np.add.at(total, positions[inside], values[inside])
+    return total
+
+
+def area_interchange(case, network, pf, pt, load_p):
+    """Net area interchange on tie lines and loads in MW like PSS/E.
+
+    A tie line counts for both of its areas with the flow at its metered
+    end, so the losses of the line are carried by the area at the other
+    end and the interchanges of all areas sum to zero. The metered end is
+    the from bus of branches with MET 1 and of transformers with NMETR 2.
+    Args:
+        case: RawCase
+        network: Network of the case
+        pf, pt: active power at the from and to ends of the branches and
+            transformers in MW, optionally one column per snapshot
+        load_p: actual active power of the loads in MW
+    Output:
+        interchange of every area of case.area
+    """
+    count = len(case.area)
+    bus_area = case.area_index(case.bus["area"])
+    from_metered = np.concatenate([case.branch["met"] <= 1,
+                                   case.transformer["nmetr"] == 2])
+    if np.ndim(pf) > 1:
+        from_metered = from_metered[:, None]
+    # Flow from the from area to the to area at the metered end
+    metered = np.where(from_metered, pf, -pt)
+    area_f = bus_area[network.f]
+    area_t = bus_area[network.t]
+    tie = area_f != area_t
+    pint = (area_totals(np.where(tie, area_f, -1), metered, count) -
+            area_totals(np.where(tie, area_t, -1), metered, count))
+    load_area = case.area_index(case.load["area"])
+    owner = bus_area[network.load_bus]
+    foreign = load_area != owner
+    pint += (area_totals(np.where(foreign, owner, -1), load_p, count) -
+             area_totals(np.where(foreign, load_area, -1), load_p, count))
+    return pint
+
+
+class PowerFlowResult(object):
+    """Results of a power flow solution.
+
+    Attributes:
+        solved: PSS/E style solution flag, 0 converged, 1 iteration limit
+            exceeded, 2 blown up
+        iterations: total number of Newton-Raphson iterations
+        mismatch: largest mismatch in MVA
+        vm, va: bus voltage magnitudes in pu and angles in degrees
+        pgen, qgen: machine outputs in MW and Mvar
+        pf, qf, pt, qt: flows at the from and to ends of the branches and
+            transformers in MW and Mvar
+        loading: percent current loading of rate A, B and C, one row each
+        area_gen, area_load, area_pint: area generation, load and net
+            interchange in MW
+    """
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    @property
+    def converged(self):
+        """True if the power flow converged."""
+        return self.solved == 0
+
+
+class PowerFlow(object):
+    """Power flow solver working on a RawCase in place.
+
+    The solved voltages and machine outputs are written back to the case,
+    similar to the working case in PSS/E.
+
+    Args:
+        case: RawCase to solve
+        tol: mismatch tolerance in MVA
+        max_iter: maximum Newton-Raphson iterations per solution
+        q_limits: apply generator reactive power limits
+        taps: adjust voltage controlling transformer taps
+        area_interchange: control area interchange, tie lines and loads
+        max_adjust: maximum number of adjustment rounds
+    """
+
+    def __init__(self, case, tol=0.1, max_iter=20, q_limits=True, taps=True,
+                 area_interchange=True, max_adjust=20, network=None):
+        self.case = case
+        self.network = network if network is not None else Network(case)
+        self.tol = tol
+        self.max_iter = max_iter
+        self.q_limits = q_limits
+        self.taps = taps
+        self.area_interchange = area_interchange
+        self.max_adjust = max_adjust
+
+    def initial_voltage(self, ide):
+        """Complex start voltages from the case and generator setpoints."""
+        case = self.case
+        net = self.network
+        vm = case.bus["vm"].copy()
+        gen_on = net.generators_in_service()
+        regulated = (ide[net.gen_bus] == PV) | (ide[net.gen_bus] == REF)
+        vm[net.gen_bus[gen_on & regulated]] = case.generator["vs"][
+            gen_on & regulated]
+        return vm*np.exp(1j*np.radians(case.bus["va"]))
+
+    def solve(self, v0=None):
+        """Solve the power flow of the case.
+        Args:
+            v0: optional complex start voltages, default is the case
+        Output:
+            PowerFlowResult
+        """
+        case = self.case
+        net = self.network
+        ide = net.bus_types()
+        gen_on = net.generators_in_service()
+        vset = np.ones(net.nbus)
+        vset[net.gen_bus[gen_on]] = case.generator["vs"][gen_on]
+        v = self.initial_voltage(ide) if v0 is None else v0.copy()
+        if v0 is not None:
+            regulated = (ide == PV) | (ide == REF)
+            v[regulated] = vset[regulated]*np.exp(1j*np.angle(v[regulated]))
+
+        qmax = np.zeros(net.nbus)
+        qmin = np.zeros(net.nbus)
+        np.add.at(qmax, net.gen_bus[gen_on], case.generator["qt"][gen_on])
+        np.add.at(qmin, net.gen_bus[gen_on], case.generator["qb"][gen_on])
+        qmax /= net.sbase
+        qmin /= net.sbase
+
+        sgen, sload, iload = net.injections()
+        # Generator buses that were switched to PQ: +1 at QMAX, -1 at QMIN
+        at_limit = np.zeros(net.nbus, dtype=int)
+        area_adjust = np.zeros(net.nbus)
+        tol = self.tol/net.sbase
+        iterations = 0
+        solved = 1
+        for _ in range(self.max_adjust + 1):
+            pv = np.flatnonzero((ide == PV) & (at_limit == 0))
+            pq = np.flatnonzero((ide == PQ) |
+                                ((ide == PV) & (at_limit != 0)))
+            qfix = np.where(at_limit > 0, qmax,
+                            np.where(at_limit < 0, qmin, sgen.imag))
+            sbus = sgen.real + area_adjust + 1j*qfix - sload
+            v, converged, its, norm = newton_raphson(
+                net.ybus, sbus, iload, v, pv, pq, tol, self.max_iter)
+            iterations += its
+            if not converged:
+                solved = 1 if np.isfinite(norm) else 2
+                break
+            solved = 0
+            changed = False
+            if self.q_limits:
+                changed |= self._check_q_limits(v, ide, iload, sload, qmax,
+                                                qmin, vset, at_limit)
+            if self.taps:
+                changed |= self._adjust_taps(v)
+            if self.area_interchange:
+                changed |= self._adjust_interchange(v, ide, area_adjust)
+            if not changed:
+                break
+
+        return self._results(v, ide, sgen, sload, iload, area_adjust,
+                             solved, iterations, norm*net.sbase)
+
+    def _check_q_limits(self, v, ide, iload, sload, qmax, qmin, vset,
+                        at_limit):
+        """Switch PV buses violating reactive limits to PQ and back."""
+        net = self.network
+        vm = np.abs(v)
+        qgen = (v*np.conj(net.ybus*v)).imag + sload.imag + iload.imag*vm
+        pv = (ide == PV) & (at_limit == 0)
+        over = pv & (qgen > qmax + 1e-6)
+        under = pv & (qgen < qmin - 1e-6)
+        # Release buses whose voltage is back on the controllable side
+        release = (((at_limit > 0) & (vm > vset)) |
+                   ((at_limit < 0) & (vm < vset)))
+        at_limit[over] = 1
+        at_limit[under] = -1
+        at_limit[release] = 0
+        return bool(over.any() or under.any() or release.any())
+
+    def _adjust_taps(self, v):
+        """Step transformer taps to keep controlled voltages in band."""
+        case = self.case
+        trafo = case.transformer
+        if not len(trafo):
+            return False
+        vm = np.abs(v)
+        control = (trafo["cod1"] == 1) & (trafo["cont1"] != 0) & (
+            trafo["stat"] != 0)
+        if not control.any():
+            return False
+        cont = case.bus_index(np.abs(trafo["cont1"][control]))
+        vcont = vm[cont]
+        vmax = trafo["vma1"][control]
+        vmin = trafo["vmi1"][control]
+        outside = (vcont > vmax) | (vcont < vmin)
+        if not outside.any():
+            return False
+        target = np.clip(vcont, vmin, vmax)
+        windv = trafo["windv1"][control]
+        # Positive control bus: raising the ratio lowers its voltage
+        direct = trafo["cont1"][control] > 0
+        new = np.where(direct, windv*vcont/target, windv*target/vcont)
+        rmax = trafo["rma1"][control]
+        rmin = trafo["rmi1"][control]
+        steps = np.maximum(trafo["ntp1"][control] - 1, 1)
+        step = (rmax - rmin)/steps
+        new = rmin + np.round((new - rmin)/step)*step
+        new = np.clip(new, rmin, rmax)
+        moved = outside & (np.abs(new - windv) > 1e-9)
+        if not moved.any():
+            return False
+        positions = np.flatnonzero(control)[moved]
+        case.transformer["windv1"][positions] = new[moved]
+        self.network.build()
+        return True
+
+    def area_interchange_mw(self, v):
+        """Net area interchange on tie lines and loads in MW."""
+        case = self.case
+        net = self.network
+        sf = v[net.f]*np.conj(net.yf*v)*net.sbase
+        st = v[net.t]*np.conj(net.yt*v)*net.sbase
+        load_p, _ = case.load_actual(np.abs(v))
+        return area_interchange(case, net, sf.real, st.real, load_p)
+
+    def _adjust_interchange(self, v, ide, area_adjust):
+        """Move area swing generation to meet the desired interchange."""
+        case = self.case
+        if not len(case.area):
+            return False
+        pint = self.area_interchange_mw(v)
+        error = case.area["pdes"] - pint
+        isw = case.area["isw"]
+        valid = isw > 0
+        swing = np.zeros(len(isw), dtype=int)
+        swing[valid] = case.bus_index(isw[valid])
+        # The swing bus has to exist and be a generator bus
+        valid &= (case.bus["number"][swing] == isw) & (ide[swing] == PV)
+        move = valid & (np.abs(error) > case.area["ptol"])
+        if not move.any():
+            return False
+        np.add.at(area_adjust, swing[move], error[move]/self.network.sbase)
+        return True
+
+    def _results(self, v, ide, sgen, sload, iload, area_adjust, solved,
+                 iterations, mismatch):
+        """Write the solution back to the case and collect results."""
+        case = self.case
+        net = self.network
+        vm = np.abs(v)
+        gen = case.generator
+        gen_on = net.generators_in_service()
+
+        # Bus generation from the solved injections
+        scalc = v*np.conj(net.ybus*v) + sload + iload*vm
+        pbus = (sgen.real + area_adjust)*net.sbase
+        pbus[ide == REF] = scalc.real[ide == REF]*net.sbase
+        qbus = scalc.imag*net.sbase
+
+        if solved == 0:
+            case.bus["vm"] = vm
+            case.bus["va"] = np.degrees(np.angle(v))
+            regulating = gen_on & (ide[net.gen_bus] != PQ)
+            groups = net.gen_bus[regulating]
+            case.generator["qg"][regulating] = share(
+                qbus, groups, (gen["qt"] - gen["qb"])[regulating], net.nbus)
+            adjusted = regulating & ((ide[net.gen_bus] == REF) |
+                                     (area_adjust[net.gen_bus] != 0))
+            groups = net.gen_bus[adjusted]
+            case.generator["pg"][adjusted] = share(
+                pbus, groups, gen["mbase"][adjusted], net.nbus)
+
+        sf = v[net.f]*np.conj(net.yf*v)*net.sbase
+        st = v[net.t]*np.conj(net.yt*v)*net.sbase
+        current = np.maximum(np.abs(sf)/vm[net.f], np.abs(st)/vm[net.t])
+        rates = net.rates
+        loading = np.where(rates > 0,
+                           100.0*current/np.where(rates > 0, rates, 1.0), 0.0)
+
+        count = len(case.area)
+        bus_area = case.area_index(case.bus["area"])
+        area_gen = area_totals(bus_area[net.gen_bus[gen_on]],
+                               gen["pg"][gen_on], count)
+        load_p, _ = case.load_actual(vm)
+        area_load = area_totals(case.area_index(case.load["area"]), load_p,
+                                count)
+
+        return PowerFlowResult(
+            solved=solved, iterations=iterations, mismatch=mismatch,
+            vm=vm, va=np.degrees(np.angle(v)), v=v,
+            pgen=gen["pg"].copy(), qgen=gen["qg"].copy(),
+            pf=sf.real, qf=sf.imag, pt=st.real, qt=st.imag,
+            loading=loading, area_gen=area_gen, area_load=area_load,
+            area_pint=self.area_interchange_mw(v))
+
+
+def solve(case, **options):
+    """Solve the power flow of a case, see PowerFlow for the options.
+    Args:
+        case: RawCase, updated with the solution
+    Output:
+        PowerFlowResult
+    """
+    return PowerFlow(case, **options).solve()
+
+
+class BatchPowerFlow(object):
+    """Solve many snapshots of a case, e.g. the 24 hours of a day, together.
+
+    The snapshots share the network of the case and differ in the load and
+    generator setpoints and the desired area interchanges. They are solved
+    in chunks: all snapshots of a chunk are iterated simultaneously, with
+    the mismatches evaluated as arrays over the chunk and one sparse block
+    diagonal Jacobian per iteration. With chain every chunk is warm started
+    from the last snapshot of the previous chunk (voltages, tap positions,
+    switched generator limits and area swing adjustments), so chunk=1
+    chains every hour to the previous one. Without chain every chunk starts
+    from the same point, the start voltages and the taps of the case, and
+    the results do not depend on the chunks.
+
+    Args:
+        case: RawCase with the network, it is not modified
+        tol, max_iter, q_limits, taps, area_interchange, max_adjust: see
+            PowerFlow
+        chunk: number of snapshots iterated together
+        chain: warm start every chunk from the previous one
+    """
+
+    def __init__(self, case, tol=0.1, max_iter=20, q_limits=True, taps=True,
+                 area_interchange=True, max_adjust=20, chunk=24,
+                 network=None, chain=True):
+        self.case = case
+        self.network = network if network is not None else Network(case)
+        self.tol = tol
+        self.max_iter = max_iter
+        self.q_limits = q_limits
+        self.taps = taps
+        self.area_interchange = area_interchange
+        self.max_adjust = max_adjust
+        self.chunk = chunk
+        self.chain = chain
+
+        net = self.network
+        nbus = net.nbus
+        gen = case.generator
+        self.ide = net.bus_types()
+        self.gen_on = net.generators_in_service()
+        self.vset = np.ones(nbus)
+        self.vset[net.gen_bus[self.gen_on]] = gen["vs"][self.gen_on]
+        self.qmax = np.zeros(nbus)
+        self.qmin = np.zeros(nbus)
+        np.add.at(self.qmax, net.gen_bus[self.gen_on], gen["qt"][self.gen_on])
+        np.add.at(self.qmin, net.gen_bus[self.gen_on], gen["qb"][self.gen_on])
+        self.qmax /= net.sbase
+        self.qmin /= net.sbase
+
+        # Branch admittances are fixed, transformers depend on the taps
+        elements = element_admittances(case)
+        self.nbranch = len(case.branch)
+        self.on = elements["status"]
+        self.static = [elements[key][:self.nbranch]
+                       for key in ("yff", "yft", "ytf", "ytt")]
+        self.shunt = net.shunts()
+
+        # Scatter matrices summing Y-bus entries into bus currents and the
+        # branch terms into from and to currents
+        nentry = len(self._rows())
+        self.scatter = sparse.csr_matrix(
+            (np.ones(nentry), (self._rows(), np.arange(nentry))),
+            shape=(nbus, nentry))
+
+    def _rows(self):
+        """Y-bus row of every two-port entry followed by the shunts."""
+        net = self.network
+        return np.concatenate([net.f, net.f, net.t, net.t,
+                               np.arange(net.nbus)])
+
+    def _cols(self):
+        """Y-bus column of every two-port entry followed by the shunts."""
+        net = self.network
+        return np.concatenate([net.f, net.t, net.f, net.t,
+                               np.arange(net.nbus)])
+
+    def _stack(self, elements, shunt):
+        """Y-bus entry values from element admittances."""
+        parts = [np.where(self.on[:, None], elements[key], 0.0)
+                 for key in ("yff", "yft", "ytf", "ytt")]
+        return np.concatenate(parts + [shunt])
+
+    def _entries(self, windv1):
+        """Element admittances and Y-bus entries for a set of tap ratios.
+        Args:
+            windv1: (transformer, snapshot) array of ratios
+        Output:
+            (elements, entries) with one column per snapshot
+        """
+        nsnap = windv1.shape[1]
+        trafo = transformer_admittances(self.case, windv1)
+        elements = {}
+        for key, static, values in zip(("yff", "yft", "ytf", "ytt"),
+                                       self.static, trafo):
+            elements[key] = np.concatenate(
+                [np.repeat(static[:, None], nsnap, axis=1), values])
+        shunt = np.repeat(self.shunt[:, None], nsnap, axis=1)
+        return elements, self._stack(elements, shunt)
+
+    def _currents(self, entries, v):
+        """Bus current injections of every snapshot."""
+        return self.scatter*(entries*v[self._cols()])
+
+    def _jacobian(self, entries, v, current, iload, fixed_p, fixed_q):
+        """Block diagonal Jacobian of a set of snapshots.
+
+        Rows of fixed quantities (angle of the swing bus, magnitude of
+        voltage controlled buses) are replaced by identity rows, so all
+        snapshots share the structure of the full polar formulation.
+        """
+        nbus = self.network.nbus
+        rows = self._rows()
+        cols = self._cols()
+        nsnap = v.shape[1]
+        vr = v[rows]
+        vc = v[cols]
+        conj_y = np.conj(entries)
+        dva = -1j*vr*conj_y*np.conj(vc)
+        dvm = vr*conj_y*np.conj(vc/np.abs(vc))
+        diag = np.arange(nbus)
+        dva_diag = 1j*v*np.conj(current)
+        dvm_diag = np.conj(current)*v/np.abs(v) + iload[:, None]
+
+        block_rows = np.concatenate([rows, diag, rows, diag,
+                                     nbus + rows, nbus + diag,
+                                     nbus + rows, nbus + diag])
+        block_cols = np.concatenate([cols, diag, nbus + cols, nbus + diag,
+                                     cols, diag, nbus + cols, nbus + diag])
+        data = np.concatenate([dva.real, dva_diag.real,
+                               dvm.real, dvm_diag.real,
+                               dva.imag, dva_diag.imag,
+                               dvm.imag, dvm_diag.imag])
+        fixed = np.concatenate([fixed_p, fixed_q])
+        data[fixed[block_rows]] = 0.0
+        identity = np.concatenate([diag, nbus + diag])
+        block_rows = np.concatenate([block_rows, identity])
+        block_cols = np.concatenate([block_cols, identity])
+        data = np.concatenate([data, fixed.astype(float)])
+
+        size = 2*nbus
+        offset = size*np.arange(nsnap)
+        return sparse.csc_matrix(
+            (data.T.ravel(),
+             ((block_rows[None, :] + offset[:, None]).ravel(),
+              (block_cols[None, :] + offset[:, None]).ravel())),
+            shape=(size*nsnap, size*nsnap))
+
+    def solve(self, pload, qload, pgen, pdes=None, v0=None):
+        """Solve a stack of snapshots.
+        Args:
+            pload, qload: (snapshot, load) constant power of the loads in MW
+                and Mvar
+            pgen: (snapshot, machine) scheduled machine output in MW
+            pdes: optional (snapshot, area) desired area interchange in MW,
+                default is the case
+            v0: complex voltages the first chunk starts from, or all chunks
+                without chain, default is the case
+        Output:
+            BatchPowerFlowResult
+        """
+        case = self.case
+        net = self.network
+        pload = np.atleast_2d(pload)
+        qload = np.atleast_2d(qload)
+        pgen = np.atleast_2d(pgen)
+        nsnap = pload.shape[0]
+        if pdes is None:
+            pdes = np.repeat(case.area["pdes"][None, :], nsnap, axis=0)
+        pdes = np.atleast_2d(pdes)
+        if v0 is None:
+            v0 = PowerFlow(case, network=net).initial_voltage(self.ide)
+
+        state = {"v": np.asarray(v0, dtype=complex),
+                 "windv1": case.transformer["windv1"].copy(),
+                 "at_limit": np.zeros(net.nbus, dtype=int),
+                 "adjust": np.zeros(net.nbus)}
+        first = state
+        results = []
+        for start in range(0, nsnap, self.chunk):
+            if not self.chain:
+                state = dict((key, value.copy())
+                             for key, value in first.items())
+            chunk = slice(start, start + self.chunk)
+            results.append(self._solve_chunk(
+                pload[chunk], qload[chunk], pgen[chunk], pdes[chunk], state))
+        return BatchPowerFlowResult.concatenate(results)
+
+    def _solve_chunk(self, pload, qload, pgen, pdes, state):
+        """Solve the snapshots of one chunk, see solve."""
+        case = self.case
+        net = self.network
+        nbus = net.nbus
+        nsnap = pload.shape[0]
+        ide = self.ide
+        regulated = (ide == PV) | (ide == REF)
+        sbase = net.sbase
+        tol = self.tol/sbase
+
+        # Specified injections, one column per snapshot
+        gen_on = self.gen_on
+        sgen_p = np.zeros((nbus, nsnap))
+        np.add.at(sgen_p, net.gen_bus[gen_on], pgen.T[gen_on]/sbase)
+        sgen_q = np.zeros(nbus)
+        np.add.at(sgen_q, net.gen_bus[gen_on],
+                  case.generator["qg"][gen_on]/sbase)
+        load_on = case.load["status"] != 0
+        sload = np.zeros((nbus, nsnap), dtype=complex)
+        np.add.at(sload, net.load_bus[load_on],
+                  (pload.T[load_on] + 1j*qload.T[load_on])/sbase)
+        iload = np.zeros(nbus, dtype=complex)
+        np.add.at(iload, net.load_bus[load_on],
+                  (case.load["ip"][load_on] +
+                   1j*case.load["iq"][load_on])/sbase)
+
+        # Warm start from the last snapshot of the previous chunk
+        v = np.repeat(state["v"][:, None], nsnap, axis=1)
+        v[regulated] = (self.vset[regulated, None] *
+                        np.exp(1j*np.angle(v[regulated])))
+        windv1 = np.repeat(state["windv1"][:, None], nsnap, axis=1)
+        at_limit = np.repeat(state["at_limit"][:, None], nsnap, axis=1)
+        adjust = np.repeat(state["adjust"][:, None], nsnap, axis=1)
+
+        elements, entries = self._entries(windv1)
+        iterations = np.zeros(nsnap, dtype=int)
+        solved = np.zeros(nsnap, dtype=int)
+        norm = np.zeros(nsnap)
+        # Snapshots still to be iterated
+        active = np.ones(nsnap, dtype=bool)
+        for _ in range(self.max_adjust + 1):
+            self._newton(entries, v, sgen_p, sgen_q, sload, iload, adjust,
+                         at_limit, tol, active, iterations, solved, norm)
+            changed = np.zeros(nsnap, dtype=bool)
+            ok = solved == 0
+            if self.q_limits:
+                changed |= self._q_limits(entries, v, sload, iload, at_limit,
+                                          ok)
+            if self.taps:
+                moved = self._taps(v, windv1, ok)
+                if moved.any():
+                    elements, entries = self._entries(windv1)
+                changed |= moved
+            if self.area_interchange:
+                changed |= self._interchange(elements, v, pload, adjust,
+                                             pdes, ok)
+            active = changed & ok
+            if not active.any():
+                break
+
+        state["v"] = v[:, -1].copy()
+        state["windv1"] = windv1[:, -1].copy()
+        state["at_limit"] = at_limit[:, -1].copy()
+        state["adjust"] = adjust[:, -1].copy()
+        return self._results(elements, entries, v, windv1, pload, pgen,
+                             sgen_p, sload, iload, adjust, solved,
+                             iterations, norm*sbase)
+
+    def _mismatch(self, entries, v, sbus, iload, fixed_p, fixed_q):
+        """Mismatch vector of a set of snapshots, one column each."""
+        current = self._currents(entries, v)
+        mis = v*np.conj(current) - sbus + iload[:, None]*np.abs(v)
+        f = np.concatenate([np.where(fixed_p, 0.0, mis.real),
+                            np.where(fixed_q, 0.0, mis.imag)])
+        return f, current
+
+    def _newton(self, entries, v, sgen_p, sgen_q, sload, iload, adjust,
+                at_limit, tol, active, iterations, solved, norm):
+        """Newton-Raphson iterations on the active snapshots, in place."""
+        ide = self.ide
+        nbus = self.network.nbus
+        index = np.flatnonzero(active)
+        if not len(index):
+            return
+        # Isolated buses and the swing bus are fixed, as are the voltage
+        # magnitudes of PV buses within their limits
+        fixed = ((ide == REF) | (ide == ISOLATED))[:, None]
+        fixed_p = np.repeat(fixed, len(index), axis=1)
+        fixed_q = fixed | ((ide == PV)[:, None] & (at_limit[:, index] == 0))
+        qfix = np.where(at_limit[:, index] > 0, self.qmax[:, None],
+                        np.where(at_limit[:, index] < 0, self.qmin[:, None],
+                                 sgen_q[:, None]))
+        sbus = sgen_p[:, index] + adjust[:, index] + 1j*qfix - sload[:, index]
+        vi = v[:, index]
+        ent = entries[:, index]
+        f, current = self._mismatch(ent, vi, sbus, iload, fixed_p, fixed_q)
+        err = np.max(np.abs(f), axis=0)
+        count = 0
+        while count < self.max_iter:
+            todo = err > tol
+            if not todo.any():
+                break
+            count += 1
+            sel = np.flatnonzero(todo)
+            jac = self._jacobian(ent[:, sel], vi[:, sel], current[:, sel],
+                                 iload, fixed_p[:, sel], fixed_q[:, sel])
+            dx = spsolve(jac, -f[:, sel].T.ravel())
+            dx = dx.reshape(len(sel), 2*nbus).T
+            # The identity rows keep the fixed quantities only up to the
+            # round off of the solver
+            dx[np.concatenate([fixed_p[:, sel], fixed_q[:, sel]])] = 0.0
+            va = np.angle(vi[:, sel]) + dx[:nbus]
+            vm = np.abs(vi[:, sel]) + dx[nbus:]
+            vi[:, sel] = vm*np.exp(1j*va)
+            iterations[index[sel]] += 1
+            f_sel, current_sel = self._mismatch(
+                ent[:, sel], vi[:, sel], sbus[:, sel], iload,
+                fixed_p[:, sel], fixed_q[:, sel])
+            f[:, sel] = f_sel
+            current[:, sel] = current_sel
+            err[sel] = np.max(np.abs(f_sel), axis=0)
+            # Stop iterating snapshots that blew up
+            err[~np.isfinite(err)] = np.inf
+            if np.isinf(err).all():
+                break
+        v[:, index] = vi
+        norm[index] = err
+        solved[index] = np.where(err <= tol, 0,
+                                 np.where(np.isfinite(err), 1, 2))
+
+    def _q_limits(self, entries, v, sload, iload, at_limit, ok):
+        """Switch PV buses at reactive limits, see PowerFlow."""
+        ide = self.ide
+        vm = np.abs(v)
+        current = self._currents(entries, v)
+        qgen = ((v*np.conj(current)).imag + sload.imag +
+                iload.imag[:, None]*vm)
+        pv = (ide == PV)[:, None] & (at_limit == 0) & ok
+        over = pv & (qgen > self.qmax[:, None] + 1e-6)
+        under = pv & (qgen < self.qmin[:, None] - 1e-6)
+        release = ok & (((at_limit > 0) & (vm > self.vset[:, None])) |
+                        ((at_limit < 0) & (vm < self.vset[:, None])))
+        at_limit[over] = 1
+        at_limit[under] = -1
+        at_limit[release] = 0
+        return (over | under | release).any(axis=0)
+
+    def _taps(self, v, windv1, ok):
+        """Step taps of voltage controlling transformers, see PowerFlow."""
+        case = self.case
+        trafo = case.transformer
+        moved = np.zeros(v.shape[1], dtype=bool)
+        control = (trafo["cod1"] == 1) & (trafo["cont1"] != 0) & (
+            trafo["stat"] != 0)
+        if not control.any():
+            return moved
+        cont = case.bus_index(np.abs(trafo["cont1"][control]))
+        vcont = np.abs(v[cont])
+        vmax = trafo["vma1"][control][:, None]
+        vmin = trafo["vmi1"][control][:, None]
+        outside = ((vcont > vmax) | (vcont < vmin)) & ok
+        if not outside.any():
+            return moved
+        target = np.clip(vcont, vmin, vmax)
+        windv = windv1[control]
+        direct = (trafo["cont1"][control] > 0)[:, None]
+        new = np.where(direct, windv*vcont/target, windv*target/vcont)
+        rmax = trafo["rma1"][control][:, None]
+        rmin = trafo["rmi1"][control][:, None]
+        step = (rmax - rmin)/np.maximum(
+            trafo["ntp1"][control] - 1, 1)[:, None]
+        new = np.clip(rmin + np.round((new - rmin)/step)*step, rmin, rmax)
+        change = outside & (np.abs(new - windv) > 1e-9)
+        windv[change] = new[change]
+        windv1[control] = windv
+        return change.any(axis=0)
+
+    def _flows(self, elements, v):
+        """Complex flows at the from and to ends in pu."""
+        net = self.network
+        on = self.on[:, None]
+        vf = v[net.f]
+        vt = v[net.t]
+        i_from = elements["yff"]*vf + elements["yft"]*vt
+        i_to = elements["ytf"]*vf + elements["ytt"]*vt
+        return (np.where(on, vf*np.conj(i_from), 0.0),
+                np.where(on, vt*np.conj(i_to), 0.0))
+
+    def _pint(self, elements, v, pload):
+        """Net area interchange in MW, one column per snapshot."""
+        net = self.network
+        sf, st = self._flows(elements, v)
+        return area_interchange(self.case, net, sf.real*net.sbase,
+                                st.real*net.sbase,
+                                self._load_actual(np.abs(v), pload))
+
+    def _load_actual(self, vm, pload):
+        """Actual active power of the loads, one column per snapshot."""
+        load = self.case.load
+        vload = vm[self.network.load_bus]
+        active = (pload.T + load["ip"][:, None]*vload +
+                  load["yp"][:, None]*vload**2)
+        return np.where((load["status"] != 0)[:, None], active, 0.0)
+
+    def _interchange(self, elements, v, pload, adjust, pdes, ok):
+        """Move area swing generation to the desired interchange."""
+        case = self.case
+        nsnap = v.shape[1]
+        changed = np.zeros(nsnap, dtype=bool)
+        if not len(case.area):
+            return changed
+        error = pdes.T - self._pint(elements, v, pload)
+        isw = case.area["isw"]
+        valid = isw > 0
+        swing = np.zeros(len(isw), dtype=int)
+        swing[valid] = case.bus_index(isw[valid])
+        valid &= (case.bus["number"][swing] == isw) & (self.ide[swing] == PV)
+        move = (valid[:, None] & ok &
+                (np.abs(error) > case.area["ptol"][:, None]))
+        if not move.any():
+            return changed
+        delta = np.where(move, error, 0.0)/self.network.sbase
+        np.add.at(adjust, swing[valid], delta[valid])
+        return move.any(axis=0)
+
+    def _results(self, elements, entries, v, windv1, pload, pgen, sgen_p,
+                 sload, iload, adjust, solved, iterations, mismatch):
+        """Collect the results of a chunk, one row per snapshot."""
+        case = self.case
+        net = self.network
+        sbase = net.sbase
+        gen = case.generator
+        ide = self.ide
+        gen_on = self.gen_on
+        vm = np.abs(v)
+
+        current = self._currents(entries, v)
+        scalc = v*np.conj(current) + sload + iload[:, None]*vm
+        pbus = (sgen_p + adjust)*sbase
+        pbus[ide == REF] = scalc.real[ide == REF]*sbase
+        qbus = scalc.imag*sbase
+
+        pg = pgen.T.astype(float)
+        qg = np.repeat(gen["qg"][:, None], v.shape[1], axis=1)
+        regulating = gen_on & (ide[net.gen_bus] != PQ)
+        qg[regulating] = share(qbus, net.gen_bus[regulating],
+                               (gen["qt"] - gen["qb"])[regulating], net.nbus)
+        adjusted = regulating[:, None] & (
+            (ide[net.gen_bus] == REF)[:, None] | (adjust[net.gen_bus] != 0))
+        shared = share(pbus, net.gen_bus[regulating],
+                       gen["mbase"][regulating], net.nbus)
+        pg[regulating] = np.where(adjusted[regulating], shared,
+                                  pg[regulating])
+
+        sf, st = self._flows(elements, v)
+        sf = sf*sbase
+        st = st*sbase
+        current_mva = np.maximum(np.abs(sf)/vm[net.f], np.abs(st)/vm[net.t])
+        rates = self.network.rates[:, :, None]
+        loading = np.where(rates > 0,
+                           100.0*current_mva[None]/np.where(rates > 0,
+                                                            rates, 1.0), 0.0)
+
+        count = len(case.area)
+        bus_area = case.area_index(case.bus["area"])
+        area_gen = area_totals(bus_area[net.gen_bus[gen_on]], pg[gen_on],
+                               count)
+        area_load = area_totals(case.area_index(case.load["area"]),
+                                self._load_actual(vm, pload), count)
+
+        return BatchPowerFlowResult(
+            solved=solved, iterations=iterations, mismatch=mismatch,
+            v=v.T, vm=vm.T, va=np.degrees(np.angle(v)).T,
+            pgen=pg.T, qgen=qg.T, windv1=windv1.T,
+            pf=sf.real.T, qf=sf.imag.T, pt=st.real.T, qt=st.imag.T,
+            loading=loading.transpose(2, 0, 1), area_gen=area_gen.T,
+            area_load=area_load.T,
+            area_pint=self._pint(elements, v, pload).T)
+
+
+class BatchPowerFlowResult(PowerFlowResult):
+    """Results of BatchPowerFlow, the attributes of PowerFlowResult with
+    one row per snapshot, plus the transformer ratios windv1."""
+
+    FIELDS = ["solved", "iterations", "mismatch", "v", "vm", "va", "pgen",
+              "qgen", "windv1", "pf", "qf", "pt", "qt", "loading",
+              "area_gen", "area_load", "area_pint"]
+
+    @property
+    def converged(self):
+        """True for every snapshot that converged."""
+        return self.solved == 0
+
+    def __len__(self):
+        return len(self.solved)
+
+    def snapshot(self, i):
+        """Results of one snapshot.
+        Args:
+            i: snapshot index
+        Output:
+            PowerFlowResult
+        """
+        return PowerFlowResult(
+            **dict((field, getattr(self, field)[i]) for field in self.FIELDS))
+
+    @classmethod
+    def concatenate(cls, results):
+        """Join the results of consecutive chunks."""
+        return cls(**dict(
+            (field, np.concatenate([getattr(r, field) for r in results]))
+            for field in cls.FIELDS))
@@ -0,0 +1,500 @@
+"""Delta-compressed archive of the hourly raw files.
+
+A year of raw files is 17520 files of about 39 kB, nearly all of it the
+unchanged base case. RawArchive keeps the base case once and every raw
+file as a frame holding only the fields that differ from the base case:
+
+- the fields patched by rawcase.RawTemplate (bus voltages and angles, load
+  and machine P and Q, transformer ratios and interchanges) as integer
+  differences in the last printed digit, e.g. 1e-5 pu for voltages
+- other changed fields as positions and values
+- the header and tail lines when they differ
+
+A frame is written only when the base case with the differences formats
+to exactly the bytes of the file, otherwise the whole file is stored. The
+frames are compressed with zstd when the zstandard module is installed,
+and with gzip otherwise.
+
+The archive is a folder with the gzip compressed base case base.raw.gz,
+the frames appended to frames.bin and index.bin, a fixed size record per
+frame with the date, hour, before or after the power flow, offset and
+size. A frame is committed by appending its record after the frame, so an
+interrupted add is ignored and overwritten by the next one. A raw file
+added again replaces the stored one. Only one process may add at a time.
+
+    python -m nordic44.rawarchive archive add PSSE_Resources/N44_2016*
+    python -m nordic44.rawarchive archive extract 2016-01-01 5 after h5.raw
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import struct
+import argparse
+from datetime import date, datetime
+import numpy as np
+from nordic44.rawcase import (RawCase, RawTemplate, STATE_SECTIONS,
+                              PATCHED_FIELDS)
+
+KINDS = ["before", "after"]
+
+# Frame kinds and codecs of the index
+DELTA = 0
+FULL = 1
+GZIP = 0
+ZSTD = 1
+
+INDEX_DTYPE = np.dtype([("date", "<i4"), ("hour", "<i2"), ("kind", "u1"),
+                        ("frame", "u1"), ("codec", "u1"), ("offset", "<i8"),
+                        ("size", "<i4"), ("length", "<i4")])
+
+# Printed decimals of the patched fields, e.g. 5 for %7.5f
+DECIMALS = dict(((section, name), int(fmt.split(".")[1][:-1]))
+                for section, _, fields in PATCHED_FIELDS
+                for name, _, fmt in fields)
+
+_RAW_NAME = re.compile(r"^h(\d+)_(before|after)_PF\.raw$")
+
+
+def _compress(data):
+    """(codec, compressed data), zstd when available."""
+    try:
+        import zstandard
+    except ImportError:
+        return GZIP, gzip.compress(data, mtime=0)
+    return ZSTD, zstandard.ZstdCompressor(level=10).compress(data)
+
+
+def _decompress(codec, data):
+    """Decompress a frame."""
+    if codec == ZSTD:
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _pack(meta, arrays):
+    """Bytes of a json header and arrays, laid out like compiled.py."""
+    meta = dict(meta, arrays=[])
+    blobs = []
+    offset = 0
+    for key, array in arrays:
+        blob = np.ascontiguousarray(array).tobytes()
+        meta["arrays"].append(
+            [key, np.lib.format.dtype_to_descr(array.dtype),
+             list(array.shape), offset])
+        blobs.append(blob)
+        offset += len(blob)
+    head = json.dumps(meta).encode("utf-8")
+    return struct.pack("<Q", len(head)) + head + b"".join(blobs)
+
+
+def _unpack(data):
+    """json header and arrays of _pack."""
+    size, = struct.unpack("<Q", data[:8])
+    meta = json.loads(data[8:8+size].decode("utf-8"))
+    arrays = dict()
+    for key, descr, shape, offset in meta.pop("arrays"):
+        dtype = np.lib.format.descr_to_dtype(descr)
+        arrays[key] = np.frombuffer(
+            data, dtype=dtype, count=int(np.prod(shape)),
+            offset=8 + size + offset).reshape(shape)
+    return meta, arrays
+
+
+def encode_delta(base, case):
+    """Differences of a case to the base case.
+    Args:
+        base: RawCase of the base case
+        case: RawCase of the same network
+    Output:
+        bytes, None if the sections do not have the same records
+    """
+    meta = {"header": None, "tail": None}
+    if case.header != base.header:
+        meta["header"] = case.header
+    if case.tail != base.tail:
+        meta["tail"] = case.tail
+    arrays = []
+    for section in STATE_SECTIONS:
+        new = getattr(case, section)
+        old = getattr(base, section)
+        if new.dtype != old.dtype or len(new) != len(old):
+            return None
+        for name in new.dtype.names:
+            key = section + "/" + name
+            decimals = DECIMALS.get((section, name))
+            if decimals is not None:
+                scale = 10.0**decimals
+                steps = np.round(new[name]*scale)
+                diff = steps - np.round(old[name]*scale)
+                if diff.any():
+                    arrays.append((key, diff.astype("<i8")))
+                # Values printed as -0.000
+                negative = np.flatnonzero((steps == 0) &
+                                          np.signbit(new[name]))
+                if len(negative):
+                    arrays.append((key + "-", negative.astype("<i4")))
+                continue
+            changed = np.flatnonzero(new[name] != old[name])
+            if len(changed):
+                arrays.append((key + "#", changed.astype("<i4")))
+                arrays.append((key, new[name][changed]))
+    return _pack(meta, arrays)
+
+
+def decode_delta(base, data, name=""):
+    """Case from the base case and the differences of encode_delta."""
+    meta, arrays = _unpack(data)
+    sections = dict((section, getattr(base, section).copy())
+                    for section in STATE_SECTIONS)
+    for key, values in arrays.items():
+        if key.endswith("#") or key.endswith("-"):
+            continue
+        section, field = key.split("/")
+        column = sections[section][field]
+        if key + "#" in arrays:
+            column[arrays[key + "#"]] = values
+        else:
+            scale = 10.0**DECIMALS[(section, field)]
+            column[:] = (np.round(column*scale) + values)/scale
+    # Values printed as -0.000 after the differences are added
+    for key, values in arrays.items():
+        if key.endswith("-"):
+            section, field = key[:-1].split("/")
+            sections[section][field][values] = -0.0
+    return RawCase.from_sections(meta["header"] or base.header, sections,
+                                 meta["tail"] or base.tail, name)
+
+
+def snapshot_name(hour, kind):
+    """Name of the raw file of an hour, e.g. h5_after_PF."""
+    return "h" + str(hour) + "_" + kind + "_PF"
+
+
+class RawArchive(object):
+    """Hourly raw files stored as differences to a base case.
+
+    Args:
+        directory: Folder of the archive, created when missing
+        base: Raw file of the base case of a new archive, default the N44
+            base case
+    """
+
+    def __init__(self, directory, base=None):
+        self.directory = directory
+        self.base_fname = os.path.join(directory, "base.raw.gz")
+        self.frames_fname = os.path.join(directory, "frames.bin")
+        self.index_fname = os.path.join(directory, "index.bin")
+        if not os.path.exists(self.base_fname):
+            if base is None:
+                from nordic44.compiled import BASECASE
+                base = BASECASE
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            with open(base, "rb") as raw:
+                content = raw.read()
+            tmp = self.base_fname + ".tmp"
+            with open(tmp, "wb") as out:
+                out.write(gzip.compress(content, mtime=0))
+            os.replace(tmp, self.base_fname)
+        self._base = None
+        self._template = None
+
+    def base(self):
+        """RawCase of the base case."""
+        if self._base is None:
+            with gzip.open(self.base_fname, "rb") as raw:
+                lines = raw.read().decode("utf-8").splitlines()
+            self._base = RawCase(lines, "base")
+        return self._base
+
+    def template(self):
+        """RawTemplate formatting the frames."""
+        if self._template is None:
+            self._template = RawTemplate(self.base())
+        return self._template
+
+    def index(self):
+        """Records of the committed frames, see INDEX_DTYPE."""
+        if not os.path.exists(self.index_fname):
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        with open(self.index_fname, "rb") as index:
+            data = index.read()
+        count = len(data)//INDEX_DTYPE.itemsize
+        return np.frombuffer(data, dtype=INDEX_DTYPE, count=count)
+
+    def latest(self, index=None):
+        """Positions in the index of the last frame of every raw file,
+        ordered by date, hour and kind."""
+        if index is None:
+            index = self.index()
+        keys = np.stack([index["date"], index["hour"], index["kind"]])
+        # The last of equal keys in the stable sort by key is the newest
+        order = np.lexsort(keys[::-1])
+        sorted_keys = keys[:, order]
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = (sorted_keys[:, 1:] != sorted_keys[:, :-1]).any(axis=0)
+        return order[last]
+
+    def keys(self):
+        """(date, hour, kind) of the stored raw files."""
+        index = self.index()
+        return [(date.fromordinal(int(record["date"])), int(record["hour"]),
+                 KINDS[record["kind"]])
+                for record in index[self.latest(index)]]
+
+    def __len__(self):
+        return len(self.latest())
+
+    def add(self, day, hour, kind, content):
+        """Add the content of a raw file.
+        Args:
+            day: Date of the file
+            hour: Hour of the file
+            kind: before or after the power flow
+            content: bytes of the raw file
+        Output:
+            delta or full, how the file was stored
+        """
+        frame, data = FULL, content
+        try:
+            lines = content.decode("utf-8").splitlines()
+            case = RawCase(lines, snapshot_name(hour, kind))
+            data = encode_delta(self.base(), case)
+            if (data is not None and self.template().render(
+                    decode_delta(self.base(), data)) == content):
+                frame = DELTA
+            else:
+                data = content
+        except (ValueError, IndexError, KeyError, UnicodeDecodeError):
+            data = content
+        codec, data = _compress(data)
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record["date"] = _ordinal(day)
+        record["hour"] = hour
+        record["kind"] = KINDS.index(kind)
+        record["frame"] = frame
+        record["codec"] = codec
+        record["size"] = len(data)
+        record["length"] = len(content)
+        self._append(record, data)
+        return "delta" if frame == DELTA else "full"
+
+    def add_file(self, day, hour, kind, fname):
+        """Add a raw file, see add."""
+        with open(fname, "rb") as raw:
+            return self.add(day, hour, kind, raw.read())
+
+    def add_day(self, folder, day=None):
+        """Add the hN_before_PF.raw and hN_after_PF.raw files of a day.
+        Args:
+            folder: Folder of the raw files, e.g. PSSE_Resources/N44_20160101
+            day: Date of the files, by default from the folder name
+        Output:
+            number of added files
+        """
+        if day is None:
+            day = datetime.strptime(os.path.basename(
+                os.path.normpath(folder))[-8:], "%Y%m%d").date()
+        added = 0
+        for fname in sorted(os.listdir(folder)):
+            match = _RAW_NAME.match(fname)
+            if match:
+                self.add_file(day, int(match.group(1)), match.group(2),
+                              os.path.join(folder, fname))
+                added += 1
+        return added
+
+    def _append(self, record, data):
+        """Append a frame and commit it with its index record."""
+        index = self.index()
+        end = int((index["offset"] + index["size"]).max()) if len(index) else 0
+        record["offset"] = end
+        mode = "r+b" if os.path.exists(self.frames_fname) else "wb"
+        with open(self.frames_fname, mode) as frames:
+            # Drop the frame of an interrupted add
+            frames.seek(end)
+            frames.truncate()
+            frames.write(data)
+        with open(self.index_fname, "ab") as out:
+            out.truncate(len(index)*INDEX_DTYPE.itemsize)
+            out.write(record.tobytes())
+
+    def _find(self, day, hour, kind):
+        """Index record of a raw file."""
+        index = self.index()
+        found = np.flatnonzero((index["date"] == _ordinal(day)) &
+                               (index["hour"] == hour) &
+                               (index["kind"] == KINDS.index(kind)))
+        if not len(found):
+            raise KeyError("No raw file for " + str(day) + " hour " +
+                           str(hour) + " " + kind)
+        return index[found[-1]]
+
+    def _frame(self, frames, record):
+        """Decompressed data of a frame from the open frames file."""
+        frames.seek(int(record["offset"]))
+        return _decompress(record["codec"], frames.read(int(record["size"])))
+
+    def _content(self, record, data):
+        """Bytes of the raw file of a frame."""
+        if record["frame"] == FULL:
+            return data
+        return self.template().render(decode_delta(self.base(), data))
+
+    def _case(self, record, data, name):
+        """RawCase of a frame."""
+        if record["frame"] == FULL:
+            return RawCase(data.decode("utf-8").splitlines(), name)
+        return decode_delta(self.base(), data, name)
+
+    def read(self, day, hour, kind):
+        """Bytes of a stored raw file.
+        Args:
+            day: Date of the file
+            hour: Hour of the file
+            kind: before or after the power flow
+        """
+        record = self._find(day, hour, kind)
+        with open(self.frames_fname, "rb") as frames:
+            return self._content(record, self._frame(frames, record))
+
+    def case(self, day, hour, kind):
+        """RawCase of a stored raw file, without formatting the file."""
+        record = self._find(day, hour, kind)
+        with open(self.frames_fname, "rb") as frames:
+            return self._case(record, self._frame(frames, record),
+                              snapshot_name(hour, kind))
+
+    def extract(self, day, hour, kind, fname):
+        """Write a stored raw file."""
+        content = self.read(day, hour, kind)
+        with open(fname, "wb") as raw:
+            raw.write(content)
+
+    def extract_day(self, day, folder):
+        """Write the stored raw files of a day into a folder.
+        Output:
+            list of the written files
+        """
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        written = []
+        for _, hour, kind, content in self.iter_snapshots(day, day):
+            fname = os.path.join(folder, snapshot_name(hour, kind) + ".raw")
+            with open(fname, "wb") as raw:
+                raw.write(content)
+            written.append(fname)
+        return written
+
+    def iter_snapshots(self, start_date=None, end_date=None, kind=None,
+                       cases=False):
+        """Stream the stored raw files in date, hour and kind order.
+
+        The frames file is opened once and the frames are read one at a
+        time, so a year is streamed in constant memory.
+        Args:
+            start_date, end_date: Dates of the files, default all
+            kind: before or after to give only those
+            cases: Give RawCase objects instead of the file content
+        Output:
+            generator of (date, hour, kind, bytes or RawCase)
+        """
+        index = self.index()
+        records = index[self.latest(index)]
+        if start_date is not None:
+            records = records[records["date"] >= _ordinal(start_date)]
+        if end_date is not None:
+            records = records[records["date"] <= _ordinal(end_date)]
+        if kind is not None:
+            records = records[records["kind"] == KINDS.index(kind)]
+        if not len(records):
+            return
+        with open(self.frames_fname, "rb") as frames:
+            for record in records:
+                data = self._frame(frames, record)
+                hour = int(record["hour"])
+                name = KINDS[record["kind"]]
+                yield (date.fromordinal(int(record["date"])), hour, name,
+                       self._case(record, data, snapshot_name(hour, name))
+                       if cases else self._content(record, data))
+
+    def __iter__(self):
+        return self.iter_snapshots()
+
+    def stats(self):
+        """Sizes of the archive.
+        Output:
+            dictionary with the number of files, delta frames, bytes of the
+            raw files and bytes stored
+        """
+        index = self.index()
+        records = index[self.latest(index)]
+        stored = sum(os.path.getsize(fname) for fname in
+                     [self.base_fname, self.frames_fname, self.index_fname]
+                     if os.path.exists(fname))
+        return {"files": len(records),
+                "delta": int((records["frame"] == DELTA).sum()),
+                "raw_bytes": int(records["length"].sum()),
+                "stored_bytes": stored}
+
+
+def _ordinal(day):
+    """Ordinal of a date or datetime."""
+    if isinstance(day, datetime):
+        day = day.date()
+    return day.toordinal()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Delta-compressed archive of hourly raw files")
+    parser.add_argument("archive", help="folder of the archive")
+    commands = parser.add_subparsers(dest="command")
+    add = commands.add_parser("add", help="add the raw files of day folders")
+    add.add_argument("folders", nargs="+",
+                     help="day folders named N44_YYYYMMDD")
+    add.add_argument("--base", help="base case of a new archive")
+    extract = commands.add_parser("extract", help="write a raw file")
+    extract.add_argument("date", help="YYYY-MM-DD")
+    extract.add_argument("hour", type=int)
+    extract.add_argument("kind", choices=KINDS)
+    extract.add_argument("out", help="name of the raw file")
+    day = commands.add_parser("extract-day",
+                              help="write the raw files of a day")
+    day.add_argument("date", help="YYYY-MM-DD")
+    day.add_argument("out", help="folder of the raw files")
+    commands.add_parser("stats", help="print the sizes of the archive")
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        archive = RawArchive(args.archive, args.base)
+        for folder in args.folders:
+            print("%s: %d files" % (folder, archive.add_day(folder)))
+        args.command = "stats"
+    archive = RawArchive(args.archive)
+    if args.command == "extract":
+        archive.extract(_parse_date(args.date), args.hour, args.kind,
+                        args.out)
+    elif args.command == "extract-day":
+        for fname in archive.extract_day(_parse_date(args.date), args.out):
+            print(fname)
+    elif args.command == "stats":
+        stats = archive.stats()
+        print("%d files, %d as deltas, %.1f MB in %.2f MB (%.0fx)" % (
+            stats["files"], stats["delta"], stats["raw_bytes"]/1e6,
+            stats["stored_bytes"]/1e6,
+            stats["raw_bytes"]/max(stats["stored_bytes"], 1)))
+    else:
+        parser.print_help()
+
+
+def _parse_date(text):
+    """Date of YYYY-MM-DD."""
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
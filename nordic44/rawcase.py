@@ -0,0 +1,704 @@
+"""Native reader for PSS/E RAW version 33 case files.
+
+The case is read into NumPy structured arrays, one per data section, so that
+post-processing of solved snapshots does not require a PSS/E session.
+"""
+import os
+import re
+import copy
+import numpy as np
+
+# Record layouts of the sections we keep as arrays. The order of the fields
+# follows the PSS/E v33 POM, trailing fields missing in a record are filled
+# with the defaults given here.
+BUS_FIELDS = [
+    ("number", "i4", 0), ("name", "U12", ""), ("basekv", "f8", 0.0),
+    ("ide", "i4", 1), ("area", "i4", 1), ("zone", "i4", 1),
+    ("owner", "i4", 1), ("vm", "f8", 1.0), ("va", "f8", 0.0),
+    ("nvhi", "f8", 1.1), ("nvlo", "f8", 0.9), ("evhi", "f8", 1.1),
+    ("evlo", "f8", 0.9)]
+
+LOAD_FIELDS = [
+    ("bus", "i4", 0), ("id", "U2", "1"), ("status", "i4", 1),
+    ("area", "i4", 1), ("zone", "i4", 1), ("pl", "f8", 0.0),
+    ("ql", "f8", 0.0), ("ip", "f8", 0.0), ("iq", "f8", 0.0),
+    ("yp", "f8", 0.0), ("yq", "f8", 0.0), ("owner", "i4", 1),
+    ("scale", "i4", 1), ("intrpt", "i4", 0)]
+
+FIXED_SHUNT_FIELDS = [
+    ("bus", "i4", 0), ("id", "U2", "1"), ("status", "i4", 1),
+    ("gl", "f8", 0.0), ("bl", "f8", 0.0)]
+
+GENERATOR_FIELDS = [
+    ("bus", "i4", 0), ("id", "U2", "1"), ("pg", "f8", 0.0),
+    ("qg", "f8", 0.0), ("qt", "f8", 9999.0), ("qb", "f8", -9999.0),
+    ("vs", "f8", 1.0), ("ireg", "i4", 0), ("mbase", "f8", 100.0),
+    ("zr", "f8", 0.0), ("zx", "f8", 1.0), ("rt", "f8", 0.0),
+    ("xt", "f8", 0.0), ("gtap", "f8", 1.0), ("stat", "i4", 1),
+    ("rmpct", "f8", 100.0), ("pt", "f8", 9999.0), ("pb", "f8", -9999.0),
+    ("o1", "i4", 1), ("f1", "f8", 1.0), ("o2", "i4", 0), ("f2", "f8", 1.0),
+    ("o3", "i4", 0), ("f3", "f8", 1.0), ("o4", "i4", 0), ("f4", "f8", 1.0),
+    ("wmod", "i4", 0), ("wpf", "f8", 1.0)]
+
+BRANCH_FIELDS = [
+    ("i", "i4", 0), ("j", "i4", 0), ("ckt", "U2", "1"), ("r", "f8", 0.0),
+    ("x", "f8", 0.0), ("b", "f8", 0.0), ("ratea", "f8", 0.0),
+    ("rateb", "f8", 0.0), ("ratec", "f8", 0.0), ("gi", "f8", 0.0),
+    ("bi", "f8", 0.0), ("gj", "f8", 0.0), ("bj", "f8", 0.0),
+    ("st", "i4", 1), ("met", "i4", 1), ("len", "f8", 0.0),
+    ("o1", "i4", 1), ("f1", "f8", 1.0), ("o2", "i4", 0), ("f2", "f8", 1.0),
+    ("o3", "i4", 0), ("f3", "f8", 1.0), ("o4", "i4", 0), ("f4", "f8", 1.0)]
+
+# Two-winding transformers, the four records of the PSS/E data are
+# flattened into one row.
+TRANSFORMER_FIELDS = [
+    # Record 1
+    ("i", "i4", 0), ("j", "i4", 0), ("k", "i4", 0), ("ckt", "U2", "1"),
+    ("cw", "i4", 1), ("cz", "i4", 1), ("cm", "i4", 1), ("mag1", "f8", 0.0),
+    ("mag2", "f8", 0.0), ("nmetr", "i4", 2), ("name", "U12", ""),
+    ("stat", "i4", 1), ("o1", "i4", 1), ("f1", "f8", 1.0), ("o2", "i4", 0),
+    ("f2", "f8", 1.0), ("o3", "i4", 0), ("f3", "f8", 1.0), ("o4", "i4", 0),
+    ("f4", "f8", 1.0), ("vecgrp", "U12", ""),
+    # Record 2
+    ("r1_2", "f8", 0.0), ("x1_2", "f8", 0.0), ("sbase1_2", "f8", 0.0),
+    # Record 3
+    ("windv1", "f8", 1.0), ("nomv1", "f8", 0.0), ("ang1", "f8", 0.0),
+    ("rata1", "f8", 0.0), ("ratb1", "f8", 0.0), ("ratc1", "f8", 0.0),
+    ("cod1", "i4", 0), ("cont1", "i4", 0), ("rma1", "f8", 1.1),
+    ("rmi1", "f8", 0.9), ("vma1", "f8", 1.1), ("vmi1", "f8", 0.9),
+    ("ntp1", "i4", 33), ("tab1", "i4", 0), ("cr1", "f8", 0.0),
+    ("cx1", "f8", 0.0), ("cnxa1", "f8", 0.0),
+    # Record 4
+    ("windv2", "f8", 1.0), ("nomv2", "f8", 0.0)]
+
+# Number of fields in each of the four transformer records
+TRANSFORMER_RECORDS = [21, 3, 17, 2]
+
+AREA_FIELDS = [
+    ("number", "i4", 0), ("isw", "i4", 0), ("pdes", "f8", 0.0),
+    ("ptol", "f8", 10.0), ("name", "U12", "")]
+
+# Sections of a RawCase changed by the mapping and the power flow, these are
+# the ones copied by RawCase.snapshot
+STATE_SECTIONS = ["bus", "load", "fixed_shunt", "generator", "branch",
+                  "transformer", "area"]
+
+_QUOTED = re.compile(r"'[^']*'")
+
+
+def _dtype(fields):
+    """Create the numpy dtype of a record layout."""
+    return np.dtype([(name, kind) for name, kind, _ in fields])
+
+
+def split_record(line):
+    """Split a RAW data record into its fields.
+    Args:
+        line: one line of the raw file
+    Output:
+        list of stripped string fields, quotes removed
+    """
+    if "/" in line:
+        line = line[:_comment_start(line)]
+    if "'" in line and any("," in q for q in _QUOTED.findall(line)):
+        return _split_quoted(line)
+    return [field.strip().strip("'").strip() for field in line.split(",")]
+
+
+def _comment_start(line):
+    """Index of the first '/' outside quotes."""
+    quoted = False
+    for pos, char in enumerate(line):
+        if char == "'":
+            quoted = not quoted
+        elif char == "/" and not quoted:
+            return pos
+    return len(line)
+
+
+def _split_quoted(line):
+    """Slow path for records with commas inside quoted names."""
+    fields = []
+    current = []
+    quoted = False
+    for char in line:
+        if char == "'":
+            quoted = not quoted
+        elif char == "," and not quoted:
+            fields.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    fields.append("".join(current).strip())
+    return fields
+
+
+def _is_end(line):
+    """Check if line is a section terminator (a single zero)."""
+    return line.split("/", 1)[0].strip() in ("0", "Q")
+
+
+def _convert(fields, layout):
+    """Convert a list of string fields to a tuple following layout."""
+    values = []
+    for pos, (_, kind, default) in enumerate(layout):
+        if pos >= len(fields) or fields[pos] == "":
+            values.append(default)
+        elif kind == "i4":
+            values.append(int(fields[pos]))
+        elif kind == "f8":
+            values.append(float(fields[pos]))
+        else:
+            values.append(fields[pos])
+    return tuple(values)
+
+
+def _to_array(rows, fields):
+    """Create a structured array from converted rows."""
+    return np.array(rows, dtype=_dtype(fields))
+
+
+class RawCase(object):
+    """PSS/E case read from a RAW v33 file.
+
+    The bus, load, fixed shunt, generator, branch, two-winding transformer
+    and area sections are stored as numpy structured arrays named after the
+    PSS/E record fields. The remaining sections are kept as text in tail.
+
+    Args:
+        lines: the lines of the raw file
+        name: name of the case
+    """
+
+    def __init__(self, lines, name=""):
+        self.name = name
+        self._read_header(lines[0:3])
+
+        pos = 3
+        pos, self.bus = self._read_section(lines, pos, BUS_FIELDS)
+        pos, self.load = self._read_section(lines, pos, LOAD_FIELDS)
+        pos, self.fixed_shunt = self._read_section(lines, pos,
+                                                   FIXED_SHUNT_FIELDS)
+        pos, self.generator = self._read_section(lines, pos,
+                                                 GENERATOR_FIELDS)
+        pos, self.branch = self._read_section(lines, pos, BRANCH_FIELDS)
+        pos, self.transformer = self._read_transformers(lines, pos)
+        pos, self.area = self._read_section(lines, pos, AREA_FIELDS)
+        self.tail = lines[pos:]
+
+    @classmethod
+    def from_sections(cls, header, sections, tail, name=""):
+        """Case from arrays that are already parsed, e.g. a compiled case.
+        Args:
+            header: the three header lines of the raw file
+            sections: dictionary from section name to its array, see
+                STATE_SECTIONS
+            tail: lines of the sections kept as text
+            name: name of the case
+        """
+        case = cls.__new__(cls)
+        case.name = name
+        case._read_header(list(header))
+        for section in STATE_SECTIONS:
+            setattr(case, section, sections[section])
+        case.tail = list(tail)
+        return case
+
+    def _read_header(self, header):
+        """Case identification from the three header lines."""
+        first = split_record(header[0])
+        self.ic = int(first[0])
+        self.sbase = float(first[1])
+        self.rev = int(first[2]) if len(first) > 2 and first[2] else 33
+        self.frequency = (float(first[5])
+                          if len(first) > 5 and first[5] else 50.0)
+        self.header = header
+
+    @staticmethod
+    def _read_section(lines, pos, layout):
+        """Read one record per line until the section terminator."""
+        rows = []
+        while pos < len(lines) and not _is_end(lines[pos]):
+            rows.append(_convert(split_record(lines[pos]), layout))
+            pos += 1
+        return pos + 1, _to_array(rows, layout)
+
+    @staticmethod
+    def _read_transformers(lines, pos):
+        """Read the two-winding transformers, three-winding ones are not
+        supported."""
+        rows = []
+        while pos < len(lines) and not _is_end(lines[pos]):
+            first = split_record(lines[pos])
+            if first[2] not in ("", "0"):
+                # Dropping them would lose them in the written raw files
+                raise ValueError(
+                    "Three-winding transformer %s-%s-%s circuit %s in line "
+                    "%d is not supported" % (first[0], first[1], first[2],
+                                             first[3], pos + 1))
+            fields = []
+            for offset, size in enumerate(TRANSFORMER_RECORDS):
+                record = split_record(lines[pos + offset])
+                fields.extend((record + [""] * size)[:size])
+            rows.append(_convert(fields, TRANSFORMER_FIELDS))
+            pos += 4
+        return pos + 1, _to_array(rows, TRANSFORMER_FIELDS)
+
+    def snapshot(self):
+        """Copy of the state of the case in memory.
+        Output:
+            dictionary from section name to a copy of its array, see
+            STATE_SECTIONS
+        """
+        return dict((section, getattr(self, section).copy())
+                    for section in STATE_SECTIONS)
+
+    def restore(self, state):
+        """Bring the case back to a snapshot.
+
+        The arrays are overwritten in place, so networks built on the case
+        keep working.
+        Args:
+            state: dictionary from snapshot
+        """
+        for section, array in state.items():
+            getattr(self, section)[...] = array
+
+    def with_state(self, state, name=None):
+        """Case sharing the header and tail of this one with the sections
+        of a snapshot, e.g. for writing the snapshot to a raw file.
+        Args:
+            state: dictionary from snapshot
+            name: name of the new case, default the name of this one
+        """
+        other = copy.copy(self)
+        for section, array in state.items():
+            setattr(other, section, array)
+        if name is not None:
+            other.name = name
+        return other
+
+    def bus_index(self, numbers):
+        """Positions of bus numbers in the bus array.
+        Args:
+            numbers: array like of bus numbers
+        Output:
+            integer array with the index of each bus
+        """
+        order = np.argsort(self.bus["number"])
+        found = np.searchsorted(self.bus["number"], numbers, sorter=order)
+        return order[found]
+
+    def area_index(self, numbers):
+        """Positions of area numbers in the area array.
+        Args:
+            numbers: array like of area numbers
+        Output:
+            integer array with the index of each area, -1 if it is missing
+        """
+        areas = self.area["number"]
+        if not len(areas):
+            return np.full(np.shape(numbers), -1, dtype=int)
+        order = np.argsort(areas)
+        found = np.searchsorted(areas, numbers, sorter=order)
+        found = order[np.minimum(found, len(areas) - 1)]
+        return np.where(areas[found] == numbers, found, -1)
+
+    def load_actual(self, vm=None):
+        """Actual P and Q of all loads (PSS/E TOTALACT).
+        Args:
+            vm: bus voltage magnitudes to use instead of the case ones
+        Output:
+            (P, Q) arrays in MW and Mvar
+        """
+        if vm is None:
+            vm = self.bus["vm"]
+        vm = vm[self.bus_index(self.load["bus"])]
+        on = self.load["status"] != 0
+        active = (self.load["pl"] + self.load["ip"]*vm +
+                  self.load["yp"]*vm**2)
+        reactive = (self.load["ql"] + self.load["iq"]*vm -
+                    self.load["yq"]*vm**2)
+        return np.where(on, active, 0.0), np.where(on, reactive, 0.0)
+
+    def transformer_ratios(self):
+        """Off-nominal turns ratios of the two-winding transformers.
+        Output:
+            (RATIO, RATIO2) arrays in pu
+        """
+        trafo = self.transformer
+        basekv = self.bus["basekv"]
+        ratios = []
+        for windv, nomv, bus in (("windv1", "nomv1", "i"),
+                                 ("windv2", "nomv2", "j")):
+            base = basekv[self.bus_index(trafo[bus])]
+            nominal = np.where(trafo[nomv] == 0.0, base, trafo[nomv])
+            ratio = np.select(
+                [trafo["cw"] == 2, trafo["cw"] == 3],
+                [trafo[windv]/base, trafo[windv]*nominal/base],
+                trafo[windv])
+            ratios.append(ratio)
+        return ratios[0], ratios[1]
+
+
+def read_raw(fname):
+    """Read a PSS/E RAW v33 file.
+    Args:
+        fname: path to the raw file
+    Output:
+        RawCase
+    """
+    with open(fname, "r") as raw:
+        lines = raw.read().splitlines()
+    name = os.path.splitext(os.path.basename(fname))[0]
+    return RawCase(lines, name)
+
+
+class Reader():
+    '''Reads raw files without PSS/E, same interface as readraw.Reader.'''
+
+    def __init__(self, raw_file_dir):
+        assert os.path.isdir(raw_file_dir) or os.path.isfile(raw_file_dir)
+
+        self.raw_file_dir = raw_file_dir
+        self.rawfilelist = []
+        self.buses = {}
+        self.machines = {}
+        self.loads = {}
+        self.trafos = {}
+        self.case_name = ''
+        self.case = None
+
+    def get_list_of_raw_files(self):
+        '''
+        Creates a list of available raw files
+        '''
+        if os.path.isdir(self.raw_file_dir):
+            for root, dirs, files in os.walk(self.raw_file_dir):
+                for name in files:
+                    if name.endswith(".raw"):
+                        self.rawfilelist.append(os.path.join(root, name))
+        else:
+            self.rawfilelist.append(self.raw_file_dir)
+        return self.rawfilelist
+
+    def open_raw(self, filepath):
+        '''
+        Parses a raw file
+        '''
+        self.case = read_raw(filepath)
+        self.case_name = self.case.name
+
+    def read_raw(self):
+        '''Fill the buses, machines, loads and trafos dictionaries.'''
+        case = self.case
+        self.buses = {}
+        self.machines = {}
+        self.loads = {}
+        self.trafos = {}
+
+        for bus, voltage, angle in zip(case.bus["number"].tolist(),
+                                       case.bus["vm"].tolist(),
+                                       case.bus["va"].tolist()):
+            self.buses[bus] = {'voltage': voltage, 'angle': angle}
+
+        for bus, mid, active, reactive in zip(case.generator["bus"].tolist(),
+                                              case.generator["id"].tolist(),
+                                              case.generator["pg"].tolist(),
+                                              case.generator["qg"].tolist()):
+            self.machines[str(bus) + '_' + mid] = {
+                'bus': bus, 'P': active, 'Q': reactive}
+
+        load_p, load_q = case.load_actual()
+        for bus, lid, active, reactive in zip(case.load["bus"].tolist(),
+                                              case.load["id"].tolist(),
+                                              load_p.tolist(),
+                                              load_q.tolist()):
+            self.loads[str(bus) + '_' + lid] = {
+                'bus': bus, 'P': active, 'Q': reactive}
+
+        ratio1, ratio2 = case.transformer_ratios()
+        for f_bus, to_bus, t1, t2 in zip(case.transformer["i"].tolist(),
+                                         case.transformer["j"].tolist(),
+                                         ratio1.tolist(), ratio2.tolist()):
+            self.trafos[str(f_bus) + '_' + str(to_bus)] = {
+                'fromBus': f_bus, 'toBus': to_bus, 't1': t1, 't2': t2}
+
+
+def _efmt(value):
+    """Format a number the way PSS/E writes impedances, e.g. 2.25000E-1."""
+    mantissa, exponent = ("%.5E" % value).split("E")
+    return "%11s" % (mantissa + "E%+d" % int(exponent))
+
+
+def _owners(row, count):
+    """Format the owner and fraction pairs after the first one."""
+    text = ""
+    for pos in range(2, count + 1):
+        owner = row["o%d" % pos]
+        if owner:
+            text += ",%4d,%6.4f" % (owner, row["f%d" % pos])
+    return text
+
+
+def format_bus(row):
+    """Format a bus record."""
+    return ("%6d,'%-12s',%9.4f,%d,%4d,%4d,%4d,%7.5f,%9.4f,%7.5f,%7.5f,"
+            "%7.5f,%7.5f" % tuple(row.tolist()))
+
+
+def format_load(row):
+    """Format a load record."""
+    return ("%6d,'%-2s',%d,%4d,%4d,%10.3f,%10.3f,%10.3f,%10.3f,%10.3f,"
+            "%10.3f,%4d,%d,%d" % tuple(row.tolist()))
+
+
+def format_fixed_shunt(row):
+    """Format a fixed shunt record."""
+    return "%6d,'%-2s',%d,%10.3f,%10.3f" % tuple(row.tolist())
+
+
+def format_generator(row):
+    """Format a generator record."""
+    text = ("%6d,'%-2s',%10.3f,%10.3f,%10.3f,%10.3f,%7.5f,%6d,%10.3f,"
+            "%s,%s,%s,%s,%7.5f,%d,%7.1f,%10.3f,%10.3f,%4d,%6.4f" % (
+                row["bus"], row["id"], row["pg"], row["qg"], row["qt"],
+                row["qb"], row["vs"], row["ireg"], row["mbase"],
+                _efmt(row["zr"]), _efmt(row["zx"]), _efmt(row["rt"]),
+                _efmt(row["xt"]), row["gtap"], row["stat"], row["rmpct"],
+                row["pt"], row["pb"], row["o1"], row["f1"]))
+    text += _owners(row, 4)
+    if row["wmod"]:
+        text += ",%d,%6.4f" % (row["wmod"], row["wpf"])
+    return text
+
+
+def format_branch(row):
+    """Format a branch record."""
+    return ("%6d,%6d,'%-2s',%s,%s,%10.5f,%8.2f,%8.2f,%8.2f,%9.5f,%9.5f,"
+            "%9.5f,%9.5f,%d,%d,%7.2f,%4d,%6.4f" % (
+                row["i"], row["j"], row["ckt"], _efmt(row["r"]),
+                _efmt(row["x"]), row["b"], row["ratea"], row["rateb"],
+                row["ratec"], row["gi"], row["bi"], row["gj"], row["bj"],
+                row["st"], row["met"], row["len"], row["o1"], row["f1"]) +
+            _owners(row, 4))
+
+
+def format_transformer(row):
+    """Format the four records of a two-winding transformer."""
+    return [
+        "%6d,%6d,%6d,'%-2s',%d,%d,%d,%s,%s,%d,'%-12s',%d,%4d,%6.4f,%4d,"
+        "%6.4f,%4d,%6.4f,%4d,%6.4f,'%-12s'" % (
+            row["i"], row["j"], row["k"], row["ckt"], row["cw"], row["cz"],
+            row["cm"], _efmt(row["mag1"]), _efmt(row["mag2"]), row["nmetr"],
+            row["name"], row["stat"], row["o1"], row["f1"], row["o2"],
+            row["f2"], row["o3"], row["f3"], row["o4"], row["f4"],
+            row["vecgrp"]),
+        "%s,%s,%9.2f" % (_efmt(row["r1_2"]), _efmt(row["x1_2"]),
+                         row["sbase1_2"]),
+        "%7.5f,%8.3f,%8.3f,%9.2f,%9.2f,%9.2f,%2d,%7d,%8.5f,%8.5f,%8.5f,"
+        "%8.5f,%4d,%2d,%8.5f,%8.5f,%7.3f" % (
+            row["windv1"], row["nomv1"], row["ang1"], row["rata1"],
+            row["ratb1"], row["ratc1"], row["cod1"], row["cont1"],
+            row["rma1"], row["rmi1"], row["vma1"], row["vmi1"], row["ntp1"],
+            row["tab1"], row["cr1"], row["cx1"], row["cnxa1"]),
+        "%7.5f,%8.3f" % (row["windv2"], row["nomv2"])]
+
+
+def format_area(row):
+    """Format an area record."""
+    return "%4d,%6d,%10.3f,%10.3f,'%-12s'" % tuple(row.tolist())
+
+
+SECTION_ENDS = [
+    "0 / END OF BUS DATA, BEGIN LOAD DATA",
+    "0 / END OF LOAD DATA, BEGIN FIXED SHUNT DATA",
+    "0 / END OF FIXED SHUNT DATA, BEGIN GENERATOR DATA",
+    "0 / END OF GENERATOR DATA, BEGIN BRANCH DATA",
+    "0 / END OF BRANCH DATA, BEGIN TRANSFORMER DATA",
+    "0 / END OF TRANSFORMER DATA, BEGIN AREA DATA",
+    "0 / END OF AREA DATA, BEGIN TWO-TERMINAL DC DATA"]
+
+
+def format_case(case):
+    """Format a case as the lines of a RAW v33 file.
+    Args:
+        case: RawCase
+    Output:
+        list of lines
+    """
+    lines = list(case.header)
+    sections = [(case.bus, format_bus), (case.load, format_load),
+                (case.fixed_shunt, format_fixed_shunt),
+                (case.generator, format_generator),
+                (case.branch, format_branch)]
+    for (array, formatter), end in zip(sections, SECTION_ENDS):
+        lines.extend(formatter(row) for row in array)
+        lines.append(end)
+    for row in case.transformer:
+        lines.extend(format_transformer(row))
+    lines.append(SECTION_ENDS[5])
+    lines.extend(format_area(row) for row in case.area)
+    lines.append(SECTION_ENDS[6])
+    lines.extend(case.tail)
+    return lines
+
+
+def write_raw(case, fname):
+    """Write a case to a PSS/E RAW v33 file.
+    Args:
+        case: RawCase
+        fname: path of the raw file
+    """
+    with open(fname, "w") as raw:
+        raw.write("\n".join(format_case(case)) + "\n")
+
+
+# Fields changed by the mapping and the power flow, patched in place by
+# RawTemplate: section, line of the field within the record, position of
+# the field in that line and its format as in the format functions above
+PATCHED_FIELDS = [
+    ("bus", 0, [("vm", 7, "%7.5f"), ("va", 8, "%9.4f")]),
+    ("load", 0, [("pl", 5, "%10.3f"), ("ql", 6, "%10.3f")]),
+    ("generator", 0, [("pg", 2, "%10.3f"), ("qg", 3, "%10.3f")]),
+    ("transformer", 2, [("windv1", 0, "%7.5f")]),
+    ("area", 0, [("pdes", 2, "%10.3f")])]
+
+_PATCHED_NAMES = dict((section, [name for name, _, _ in fields])
+                      for section, _, fields in PATCHED_FIELDS)
+
+
+def _field_spans(line):
+    """(start, end) of the comma separated fields of a formatted record."""
+    spans = []
+    start = 0
+    quoted = False
+    for pos, char in enumerate(line):
+        if char == "'":
+            quoted = not quoted
+        elif char == "," and not quoted:
+            spans.append((start, pos))
+            start = pos + 1
+    spans.append((start, len(line)))
+    return spans
+
+
+class RawTemplate(object):
+    """Writer of RAW v33 files patching a formatted case.
+
+    The case is formatted once with format_case into a byte buffer, and the
+    byte offset of every field in PATCHED_FIELDS is kept. Writing a case
+    then only formats the values that changed since the last write into
+    their slots and writes the buffer with one call, the file is the same
+    as the one of write_raw. When other fields differ from the template, or
+    a value does not fit the width of its slot, the template is formatted
+    again from the case.
+
+    Args:
+        case: RawCase the template is formatted from
+        encoding: Encoding of the raw files
+    """
+
+    def __init__(self, case, encoding="utf-8"):
+        self.encoding = encoding
+        self.reset(case)
+
+    def reset(self, case):
+        """Format the template from a case."""
+        lines = format_case(case)
+        newline = os.linesep.encode(self.encoding)
+        encoded = [line.encode(self.encoding) for line in lines]
+        starts = np.cumsum([0] + [len(line) + len(newline)
+                                  for line in encoded])
+        self.buffer = bytearray(newline.join(encoded) + newline)
+        self.header = list(case.header)
+        self.tail = list(case.tail)
+        self.base = dict((section, getattr(case, section).copy())
+                         for section in STATE_SECTIONS)
+        self.fixed = dict((section, self._fixed(section, array))
+                          for section, array in self.base.items())
+
+        # First line of every section, sections are closed by one line
+        first = dict()
+        pos = len(case.header)
+        for section in STATE_SECTIONS:
+            first[section] = pos
+            size = 4 if section == "transformer" else 1
+            pos += size*len(getattr(case, section)) + 1
+
+        self.slots = []
+        for section, offset, fields in PATCHED_FIELDS:
+            size = 4 if section == "transformer" else 1
+            rows = first[section] + offset + size*np.arange(
+                len(getattr(case, section)))
+            for name, position, fmt in fields:
+                offsets = []
+                widths = []
+                for row in rows.tolist():
+                    start, end = _field_spans(lines[row])[position]
+                    offsets.append(starts[row] + len(
+                        lines[row][:start].encode(self.encoding)))
+                    widths.append(len(
+                        lines[row][start:end].encode(self.encoding)))
+                self.slots.append((section, name, fmt, offsets, widths))
+
+    @staticmethod
+    def _fixed(section, array):
+        """dtype and bytes of a section without its patched fields."""
+        array = array.copy()
+        for name in _PATCHED_NAMES.get(section, []):
+            array[name] = 0
+        return array.dtype, array.tobytes()
+
+    def matches(self, case):
+        """If a case differs from the template only in patched fields."""
+        if case.header != self.header or case.tail != self.tail:
+            return False
+        for section in STATE_SECTIONS:
+            if (self._fixed(section, getattr(case, section)) !=
+                    self.fixed[section]):
+                return False
+        return True
+
+    def patch(self, case):
+        """Format the changed values of a case into the template.
+        Output:
+            False if a value does not fit its slot
+        """
+        for section, name, fmt, offsets, widths in self.slots:
+            values = getattr(case, section)[name]
+            current = self.base[section][name]
+            # 0.0 and -0.0 are equal but printed differently
+            changed = np.flatnonzero(
+                (values != current) |
+                (np.signbit(values) != np.signbit(current))).tolist()
+            if not changed:
+                continue
+            new = values.tolist()
+            for k in changed:
+                text = (fmt % new[k]).encode(self.encoding)
+                if len(text) != widths[k]:
+                    return False
+                self.buffer[offsets[k]:offsets[k] + widths[k]] = text
+                current[k] = new[k]
+        return True
+
+    def render(self, case):
+        """Content of the raw file of a case.
+        Output:
+            bytes as written by write
+        """
+        if not (self.matches(case) and self.patch(case)):
+            self.reset(case)
+        return bytes(self.buffer)
+
+    def write(self, case, fname):
+        """Write a case to a raw file, see write_raw.
+        Args:
+            case: RawCase
+            fname: path of the raw file
+        """
+        if not (self.matches(case) and self.patch(case)):
+            self.reset(case)
+        with open(fname, "wb") as raw:
+            raw.write(self.buffer)
@@ -0,0 +1,168 @@
+"""Area scaling of loads and generation like PSS/E scal_2.
+
+N44.scale_areas scales all loads and machines of every area to the Nord
+Pool consumption and production, in PSS/E with bsys and scal_2 once per
+area and hour. AreaScaling does the same for all areas and any number of
+hours at once. The load and machine positions of every area are taken
+from the case once:
+
+- the scalable loads take up the difference between the new consumption
+  and the non scalable loads, in proportion to their P, and share the new
+  reactive consumption in proportion to their new P
+- the machines in service share the new production in proportion to their
+  output, or to PMAX when the area has no output. Machines reaching PMIN
+  or PMAX are held there and the rest of the production is shared again
+  by the others.
+
+Production that cannot be placed because all machines of an area are at
+their limits is reported per hour and area.
+"""
+import numpy as np
+
+
+class AreaScaling(object):
+    """Scaling of the loads and machines of areas of a case.
+
+    Args:
+        case: RawCase with the loads and machines
+        numbers: area numbers, the order of the columns of scale
+    """
+
+    def __init__(self, case, numbers):
+        self.case = case
+        self.numbers = np.asarray(numbers)
+        load = case.load
+        gen = case.generator
+
+        # Area position of every load and machine, -1 outside the areas
+        self.load_area = self._positions(load["area"])
+        in_service = (self.load_area >= 0) & (load["status"] != 0)
+        scalable = load["scale"] != 0
+        self.scalable = np.flatnonzero(in_service & scalable)
+        self.fixed = np.flatnonzero(in_service & ~scalable)
+        gen_area = self._positions(
+            case.bus["area"][case.bus_index(gen["bus"])])
+        self.machines = np.flatnonzero((gen_area >= 0) & (gen["stat"] != 0))
+        self.machine_area = gen_area[self.machines]
+        self.pmax = gen["pt"][self.machines]
+        self.pmin = gen["pb"][self.machines]
+
+        # Sums over the loads and machines of every area as matrix products
+        self.fixed_sum = self._summation(self.load_area[self.fixed])
+        self.scalable_sum = self._summation(self.load_area[self.scalable])
+        self.machine_sum = self._summation(self.machine_area)
+
+    def _summation(self, positions):
+        """(element, area) matrix summing elements by area position."""
+        matrix = np.zeros((len(positions), len(self.numbers)))
+        matrix[np.arange(len(positions)), positions] = 1.0
+        return matrix
+
+    def _positions(self, areas):
+        """Position of every area number in numbers, -1 if missing."""
+        order = np.argsort(self.numbers)
+        found = np.searchsorted(self.numbers, areas, sorter=order)
+        found = np.minimum(found, len(self.numbers) - 1)
+        positions = order[found]
+        return np.where(self.numbers[positions] == areas, positions, -1)
+
+    def scale_loads(self, con, qcon, pload=None, qload=None):
+        """New load P and Q.
+        Args:
+            con: (hour, area) consumption in MW
+            qcon: (hour, area) reactive consumption in Mvar
+            pload, qload: (hour, load) P and Q before scaling, default the
+                case loads for every hour
+        Output:
+            (pload, qload) (hour, load) arrays
+        """
+        con = np.atleast_2d(np.asarray(con, dtype=float))
+        qcon = np.atleast_2d(np.asarray(qcon, dtype=float))
+        hours = con.shape[0]
+        load = self.case.load
+        if pload is None:
+            pload = np.repeat(load["pl"][None, :], hours, axis=0)
+        if qload is None:
+            qload = np.repeat(load["ql"][None, :], hours, axis=0)
+        pload = np.array(pload, dtype=float, ndmin=2)
+        qload = np.array(qload, dtype=float, ndmin=2)
+
+        target_p = con - pload[:, self.fixed].dot(self.fixed_sum)
+        target_q = qcon - qload[:, self.fixed].dot(self.fixed_sum)
+
+        area = self.load_area[self.scalable]
+        old_p = pload[:, self.scalable]
+        total_p = old_p.dot(self.scalable_sum)
+        count = self.scalable_sum.sum(axis=0)
+        # In proportion to P, shared equally when the area has no load
+        new_p = np.where(
+            total_p[:, area] != 0,
+            old_p*target_p[:, area]/np.where(total_p != 0, total_p,
+                                             1.0)[:, area],
+            target_p[:, area]/np.maximum(count, 1)[area])
+        new_total = new_p.dot(self.scalable_sum)
+        new_q = np.where(
+            new_total[:, area] != 0,
+            target_q[:, area]*new_p/np.where(new_total != 0, new_total,
+                                             1.0)[:, area],
+            qload[:, self.scalable])
+        pload[:, self.scalable] = new_p
+        qload[:, self.scalable] = new_q
+        return pload, qload
+
+    def scale_machines(self, prod, pgen=None):
+        """New machine outputs.
+        Args:
+            prod: (hour, area) production in MW
+            pgen: (hour, machine) outputs before scaling, default the case
+                outputs for every hour
+        Output:
+            (pgen, unplaced), pgen (hour, machine) and unplaced the (hour,
+            area) production in MW that could not be placed within the
+            machine limits
+        """
+        prod = np.atleast_2d(np.asarray(prod, dtype=float))
+        hours = prod.shape[0]
+        gen = self.case.generator
+        if pgen is None:
+            pgen = np.repeat(gen["pg"][None, :], hours, axis=0)
+        pgen = np.array(pgen, dtype=float, ndmin=2)
+
+        area = self.machine_area
+        output = pgen[:, self.machines]
+        pmax = np.broadcast_to(self.pmax, output.shape)
+        free = np.ones(output.shape, dtype=bool)
+        remaining = prod.copy()
+        active = np.ones(prod.shape, dtype=bool)
+        for _ in range(len(self.machines)):
+            # Shares of the free machines by output, by PMAX without output
+            weights = np.where(free, output, 0.0)
+            total = weights.dot(self.machine_sum)
+            by_pmax = total <= 0
+            weights = np.where(by_pmax[:, area], np.where(free, pmax, 0.0),
+                               weights)
+            total = weights.dot(self.machine_sum)
+            active &= total > 0
+            share = active[:, area] & free
+            wanted = remaining[:, area]*weights/np.where(
+                total > 0, total, 1.0)[:, area]
+            clamped = np.clip(wanted, self.pmin, self.pmax)
+            output = np.where(share, clamped, output)
+            limited = share & (clamped != wanted)
+            remaining -= np.where(limited, clamped, 0.0).dot(self.machine_sum)
+            free &= ~limited
+            active &= limited.dot(self.machine_sum) > 0
+            if not active.any():
+                break
+        pgen[:, self.machines] = output
+        return pgen, prod - output.dot(self.machine_sum)
+
+    def scale(self, prod, con, qcon, pload=None, qload=None, pgen=None):
+        """Scale loads and machines of all areas, see scale_loads and
+        scale_machines.
+        Output:
+            (pload, qload, pgen, unplaced)
+        """
+        pload, qload = self.scale_loads(con, qcon, pload, qload)
+        pgen, unplaced = self.scale_machines(prod, pgen)
+        return pload, qload, pgen, unplaced
@@ -0,0 +1,251 @@
+"""Memory-mapped store of solved hourly snapshots.
+
+Every quantity is kept in one file of float64 values with a row per
+snapshot, e.g. voltage.f8 holds (hour, bus) and branch_pf.f8 holds
+(hour, branch). index.json lists the element names of every group and
+hours.txt the snapshot names, one per line. A snapshot is appended by
+adding a row to every file and its name last, so the rows without a name
+of an interrupted append are ignored and overwritten later.
+
+Readers get the arrays as read-only memory maps, a time series like the
+voltage of bus 3000 over a year is a column view without copying.
+"""
+import os
+import json
+from collections import OrderedDict
+import numpy as np
+
+DTYPE = "<f8"
+
+# Element groups and the quantities stored for them
+GROUPS = OrderedDict([
+    ("buses", ["voltage", "angle"]),
+    ("machines", ["machine_p", "machine_q"]),
+    ("loads", ["load_p", "load_q"]),
+    ("trafos", ["t1", "t2"]),
+    ("branches", ["branch_pf", "branch_qf", "branch_pt", "branch_qt"])])
+
+
+def case_elements(case):
+    """Element names of a RawCase by group.
+
+    Machines and loads are named bus_id, transformers frombus_tobus like
+    the records, and branches frombus_tobus_ckt with the branches before
+    the transformers like the power flow.
+    """
+    def names(*columns):
+        return ["_".join(str(value).strip() for value in row)
+                for row in zip(*[column.tolist() for column in columns])]
+    branch = case.branch
+    trafo = case.transformer
+    return OrderedDict([
+        ("buses", names(case.bus["number"])),
+        ("machines", names(case.generator["bus"], case.generator["id"])),
+        ("loads", names(case.load["bus"], case.load["id"])),
+        ("trafos", names(trafo["i"], trafo["j"])),
+        ("branches", names(branch["i"], branch["j"], branch["ckt"]) +
+         names(trafo["i"], trafo["j"], trafo["ckt"]))])
+
+
+def case_values(case, result=None):
+    """Values of a solved RawCase by quantity.
+    Args:
+        case: RawCase holding the solution
+        result: PowerFlowResult of the solution, without it the branch
+            flows are calculated from the case voltages
+    """
+    load_p, load_q = case.load_actual()
+    t1, t2 = case.transformer_ratios()
+    if result is None:
+        # I know there should be no imports here,
+        # but PSS/E users do not need scipy
+        from nordic44.powerflow import Network
+        net = Network(case)
+        v = case.bus["vm"]*np.exp(1j*np.radians(case.bus["va"]))
+        sf = v[net.f]*np.conj(net.yf*v)*net.sbase
+        st = v[net.t]*np.conj(net.yt*v)*net.sbase
+        flows = sf.real, sf.imag, st.real, st.imag
+    else:
+        flows = result.pf, result.qf, result.pt, result.qt
+    return {"voltage": case.bus["vm"], "angle": case.bus["va"],
+            "machine_p": case.generator["pg"],
+            "machine_q": case.generator["qg"],
+            "load_p": load_p, "load_q": load_q, "t1": t1, "t2": t2,
+            "branch_pf": flows[0], "branch_qf": flows[1],
+            "branch_pt": flows[2], "branch_qt": flows[3]}
+
+
+class SnapshotStore(object):
+    """Hourly snapshots of one network in memory-mapped arrays.
+
+    Args:
+        directory: Folder of the store, created when missing
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.index_fname = os.path.join(directory, "index.json")
+        self.hours_fname = os.path.join(directory, "hours.txt")
+        self.groups = None
+        self.positions = dict()
+        self.maps = dict()
+        if os.path.exists(self.index_fname):
+            with open(self.index_fname) as index:
+                self._set_groups(json.load(index)["groups"])
+
+    def _set_groups(self, groups):
+        """Keep the element names and their positions."""
+        self.groups = OrderedDict((group, groups[group]) for group in GROUPS)
+        self.positions = dict(
+            (group, dict((name, i) for i, name in enumerate(names)))
+            for group, names in self.groups.items())
+
+    def create(self, groups):
+        """Set the element names of an empty store.
+        Args:
+            groups: dictionary from group to element names, see
+                case_elements
+        """
+        groups = dict((group, [str(name) for name in groups[group]])
+                      for group in GROUPS)
+        if self.groups is not None:
+            if groups != dict(self.groups):
+                raise ValueError("The store " + self.directory +
+                                 " holds another network")
+            return
+        with open(self.index_fname, "w") as index:
+            json.dump({"dtype": DTYPE, "groups": groups}, index, indent=1)
+        self._set_groups(groups)
+
+    def quantity_fname(self, quantity):
+        """File of a quantity."""
+        return os.path.join(self.directory, quantity + ".f8")
+
+    def width(self, quantity):
+        """Number of elements of a quantity."""
+        for group, quantities in GROUPS.items():
+            if quantity in quantities:
+                return len(self.groups[group])
+        raise KeyError(quantity)
+
+    def names(self):
+        """Names of the stored snapshots."""
+        if not os.path.exists(self.hours_fname):
+            return []
+        with open(self.hours_fname) as hours:
+            names = hours.read().split("\n")[:-1]
+        # Rows without a name are from an interrupted append
+        rows = min([os.path.getsize(self.quantity_fname(quantity)) //
+                    (8*self.width(quantity))
+                    if os.path.exists(self.quantity_fname(quantity)) else 0
+                    for quantities in GROUPS.values()
+                    for quantity in quantities if self.width(quantity)] +
+                   [len(names)])
+        return names[:rows]
+
+    def __len__(self):
+        return len(self.names())
+
+    def extend(self, names, values):
+        """Append snapshots.
+        Args:
+            names: snapshot names, e.g. N44_20160101_h0
+            values: dictionary from quantity to (snapshot, element) arrays
+        """
+        if self.groups is None:
+            raise ValueError("Create the store before adding snapshots")
+        names = [str(name) for name in names]
+        kept = self.names()
+        count = len(kept)
+        for quantities in GROUPS.values():
+            for quantity in quantities:
+                width = self.width(quantity)
+                rows = np.asarray(values[quantity], dtype=DTYPE).reshape(
+                    len(names), width)
+                with open(self.quantity_fname(quantity), "ab") as out:
+                    out.truncate(count*8*width)
+                    out.write(rows.tobytes())
+        # Binary, so the lines end with \n on all platforms and the kept
+        # names fill exactly the truncated length
+        with open(self.hours_fname, "ab") as hours:
+            hours.truncate(sum(len(name.encode("utf-8")) + 1
+                               for name in kept))
+            hours.write("".join(name + "\n" for name in names).encode(
+                "utf-8"))
+        self.maps = dict()
+
+    def append(self, name, values):
+        """Append one snapshot, values as for extend with 1-D arrays."""
+        self.extend([name], values)
+
+    def append_case(self, name, case, result=None):
+        """Append a solved RawCase, the store is created for its elements
+        when empty.
+        Args:
+            name: snapshot name
+            case: RawCase holding the solution
+            result: PowerFlowResult of the solution, see case_values
+        """
+        self.create(case_elements(case))
+        self.append(name, case_values(case, result))
+
+    def array(self, quantity):
+        """All snapshots of a quantity.
+        Output:
+            read-only (snapshot, element) memory map
+        """
+        count = len(self)
+        cached = self.maps.get(quantity)
+        if cached is None or cached.shape[0] != count:
+            width = self.width(quantity)
+            if count == 0 or width == 0:
+                cached = np.zeros((count, width), dtype=DTYPE)
+            else:
+                cached = np.memmap(self.quantity_fname(quantity),
+                                   dtype=DTYPE, mode="r",
+                                   shape=(count, width))
+            self.maps[quantity] = cached
+        return cached
+
+    def element(self, quantity, name):
+        """Position of an element of a quantity."""
+        for group, quantities in GROUPS.items():
+            if quantity in quantities:
+                return self.positions[group][str(name)]
+        raise KeyError(quantity)
+
+    def series(self, quantity, name):
+        """Time series of one element, e.g. series("voltage", 3000).
+        Output:
+            view into the memory map
+        """
+        return self.array(quantity)[:, self.element(quantity, name)]
+
+    def hour(self, snapshot):
+        """Position of a snapshot given by position or name."""
+        if isinstance(snapshot, str):
+            return self.names().index(snapshot)
+        return snapshot
+
+    def values(self, snapshot):
+        """Values of one snapshot by quantity, views into the memory maps.
+        Args:
+            snapshot: position or name
+        """
+        i = self.hour(snapshot)
+        return dict((quantity, self.array(quantity)[i])
+                    for quantities in GROUPS.values()
+                    for quantity in quantities)
+
+    def snapshot(self, snapshot):
+        """One snapshot as a torecord.Snapshot for RecordWriter.
+        Args:
+            snapshot: position or name
+        """
+        from nordic44.torecord import Snapshot
+        i = self.hour(snapshot)
+        values = self.values(i)
+        return Snapshot(self.names()[i], *[values[field]
+                                           for field in Snapshot._fields[1:]])
@@ -1,5 +1,17 @@
 """Module containing the record class"""
 import os
+from collections import namedtuple
+import numpy as np
+
+# Values of one snapshot, arrays in the element order of a RecordWriter
+Snapshot = namedtuple("Snapshot", "name, voltage, angle, machine_p, "
+                      "machine_q, load_p, load_q, t1, t2")
+
+# Title, comment and parameter prefixes of the record sections
+SECTIONS = [("Voltages", "// Bus number %s\n", ("V", "A")),
+            ("Machines", "// Machine %s\n", ("P", "Q")),
+            ("Loads", "// Load %s\n", ("PL", "QL")),
+            ("Trafos", "// 2WindingTrafo %s\n", ("t1_", "t2_"))]
 
 class Record():
     '''Class defining how Modelica record file is created.'''
@@ -24,6 +36,30 @@ class Record():
         self.record_file.write('record PF_results\n //Power flow results for the snapshot %s\n \n' % self.case_name +
                                'extends Modelica.Icons.Record; \n')
 
+    @classmethod
+    def from_store(cls, workdir, store, snapshot):
+        """Record of one snapshot of a snapshots.SnapshotStore.
+        Args:
+            workdir: Folder of the record file
+            store: SnapshotStore
+            snapshot: position or name of the snapshot
+        """
+        values = store.snapshot(snapshot)
+        groups = store.groups
+
+        def elements(names, keys, first, second):
+            return dict((name, {keys[0]: a, keys[1]: b}) for name, a, b in
+                        zip(names, first.tolist(), second.tolist()))
+        return cls(workdir, values.name,
+                   elements(groups["buses"], ('voltage', 'angle'),
+                            values.voltage, values.angle),
+                   elements(groups["machines"], ('P', 'Q'),
+                            values.machine_p, values.machine_q),
+                   elements(groups["loads"], ('P', 'Q'),
+                            values.load_p, values.load_q),
+                   elements(groups["trafos"], ('t1', 't2'),
+                            values.t1, values.t2))
+
     def write_voltages(self):
         """Method for writing voltages."""
 
@@ -59,7 +95,7 @@ class Record():
             self.record_file.write('// 2WindingTrafo %s\n' % trafo)
             self.record_file.write('   parameter Real t1_%s = %f; \n' % (trafo, self.trafos[trafo]['t1']))
             self.record_file.write('   parameter Real t2_%s = %f; \n' % (trafo, self.trafos[trafo]['t2']))
-        self.record_file.write(r'end Trafos;\n')
+        self.record_file.write('end Trafos;\n')
 
     def close_record(self):
         """Close the file"""
@@ -69,3 +105,257 @@ class Record():
         self.record_file.write('Trafos trafos;\n')
         self.record_file.write('end PF_results;')
         self.record_file.close()
+
+
+def _section_template(title, comment, prefixes, names):
+    """Text of a section with a %f field per parameter."""
+    lines = ['record %s\n' % title]
+    for name in names:
+        name = str(name).replace('%', '%%')
+        lines.append(comment % name)
+        for prefix in prefixes:
+            lines.append('   parameter Real %s%s = %%f; \n' % (prefix, name))
+    lines.append('end %s;\n' % title)
+    return ''.join(lines)
+
+
+def _array_section_template(title, prefixes, names, aliases, rows=None):
+    """Text of a section with one array per quantity and an array of the
+    element names.
+
+    The values of an array are a single %s field. With rows the arrays are
+    tables with a row per snapshot and the aliases are their columns.
+    """
+    count = len(names)
+    shape = '%d' % count if rows is None else '%d, %d' % (rows, count)
+    lines = ['record %s\n' % title,
+             '   constant String names[%d] = {%s};\n'
+             % (count, ', '.join('"%s"' % str(name).replace('%', '%%')
+                                  for name in names))]
+    for prefix in prefixes:
+        lines.append('   parameter Real %s[%s] = %%s;\n'
+                     % (prefix.rstrip('_'), shape))
+    if aliases:
+        for prefix in prefixes:
+            array = prefix.rstrip('_')
+            for i, name in enumerate(names, 1):
+                name = str(name).replace('%', '%%')
+                if rows is None:
+                    lines.append('   parameter Real %s%s = %s[%d];\n'
+                                 % (prefix, name, array, i))
+                else:
+                    lines.append('   parameter Real %s%s[%d] = %s[:, %d];\n'
+                                 % (prefix, name, rows, array, i))
+    lines.append('end %s;\n' % title)
+    return ''.join(lines)
+
+
+def _array_template(count):
+    """Format of an array of count values."""
+    return '{' + ', '.join(['%f']*count) + '}'
+
+
+class RecordWriter(object):
+    """Bulk writer of records for snapshots of one network.
+
+    The text of the four sections is compiled once for the element names,
+    so a snapshot is rendered with a single format operation and written
+    with a single write. The default output is the one of Record, with one
+    scalar parameter per value.
+
+    With arrays every quantity is one Real array, e.g. V[44], next to a
+    String array with the element names, which is much less for a Modelica
+    tool to parse. The scalar names of Record, e.g. V3000, are then
+    declared as aliases of the array elements unless aliases is False.
+    Args:
+        buses: bus numbers
+        machines: machine names, bus_id
+        loads: load names, bus_id
+        trafos: transformer names, frombus_tobus
+        arrays: Write array parameters
+        aliases: Declare the scalar names in array form
+    """
+
+    def __init__(self, buses, machines, loads, trafos, arrays=False,
+                 aliases=True):
+        self.buses = list(buses)
+        self.machines = list(machines)
+        self.loads = list(loads)
+        self.trafos = list(trafos)
+        self.arrays = arrays
+        self.aliases = aliases
+        groups = [self.buses, self.machines, self.loads, self.trafos]
+        # Format of every quantity in array form, in Snapshot order
+        self.array_templates = [_array_template(len(names))
+                                for names in groups for _ in range(2)]
+        if arrays:
+            self.template = ''.join(
+                _array_section_template(title, prefixes, names, aliases)
+                for (title, _, prefixes), names in zip(SECTIONS, groups))
+        else:
+            self.template = ''.join(
+                _section_template(title, comment, prefixes, names)
+                for (title, comment, prefixes), names in zip(SECTIONS,
+                                                             groups))
+
+    @classmethod
+    def for_case(cls, case, **options):
+        """Writer for the elements of a RawCase, options as for the
+        constructor."""
+        return cls(case.bus["number"].tolist(),
+                   _names(case.generator["bus"], case.generator["id"]),
+                   _names(case.load["bus"], case.load["id"]),
+                   _names(case.transformer["i"], case.transformer["j"]),
+                   **options)
+
+    @classmethod
+    def for_reader(cls, reader, **options):
+        """Writer for the dictionaries of a Reader, options as for the
+        constructor."""
+        return cls(reader.buses, reader.machines, reader.loads,
+                   reader.trafos, **options)
+
+    @classmethod
+    def for_store(cls, store, **options):
+        """Writer for the elements of a snapshots.SnapshotStore, render
+        store.snapshot(i) with it. Options as for the constructor."""
+        groups = store.groups
+        return cls(groups["buses"], groups["machines"], groups["loads"],
+                   groups["trafos"], **options)
+
+    @staticmethod
+    def snapshot(case):
+        """Values of a RawCase as a Snapshot."""
+        load_p, load_q = case.load_actual()
+        t1, t2 = case.transformer_ratios()
+        return Snapshot(case.name, case.bus["vm"], case.bus["va"],
+                        case.generator["pg"], case.generator["qg"],
+                        load_p, load_q, t1, t2)
+
+    def snapshot_from_reader(self, reader):
+        """Values of the dictionaries of a Reader as a Snapshot."""
+        def column(values, names, key):
+            return [values[name][key] for name in names]
+        return Snapshot(reader.case_name,
+                        column(reader.buses, self.buses, 'voltage'),
+                        column(reader.buses, self.buses, 'angle'),
+                        column(reader.machines, self.machines, 'P'),
+                        column(reader.machines, self.machines, 'Q'),
+                        column(reader.loads, self.loads, 'P'),
+                        column(reader.loads, self.loads, 'Q'),
+                        column(reader.trafos, self.trafos, 't1'),
+                        column(reader.trafos, self.trafos, 't2'))
+
+    def render(self, snapshot, record='PF_results'):
+        """Text of the record of a snapshot.
+        Args:
+            snapshot: Snapshot
+            record: Name of the record
+        """
+        if self.arrays:
+            body = self.template % tuple(
+                template % tuple(np.asarray(values, dtype=float).tolist())
+                for template, values in zip(self.array_templates,
+                                            snapshot[1:]))
+        else:
+            values = np.concatenate([
+                np.column_stack((snapshot.voltage, snapshot.angle)).ravel(),
+                np.column_stack((snapshot.machine_p,
+                                 snapshot.machine_q)).ravel(),
+                np.column_stack((snapshot.load_p, snapshot.load_q)).ravel(),
+                np.column_stack((snapshot.t1, snapshot.t2)).ravel()])
+            body = self.template % tuple(values.tolist())
+        return ''.join([
+            'record %s\n //Power flow results for the snapshot %s\n \n'
+            % (record, snapshot.name),
+            'extends Modelica.Icons.Record; \n',
+            body,
+            'Voltages voltages;\nMachines machines;\nLoads loads;\n'
+            'Trafos trafos;\nend %s;' % record])
+
+    def render_table(self, snapshots, record='PF_table'):
+        """Text of a record holding all snapshots as 2-D arrays.
+
+        Every quantity has a row per snapshot, e.g. V[24, 44], and hours
+        holds the snapshot names. With aliases the scalar names are the
+        columns, e.g. V3000[24].
+        Args:
+            snapshots: iterable of Snapshot
+            record: Name of the record
+        """
+        snapshots = list(snapshots)
+        count = len(snapshots)
+        groups = [self.buses, self.machines, self.loads, self.trafos]
+        template = ''.join(
+            _array_section_template(title, prefixes, names, self.aliases,
+                                    rows=count)
+            for (title, _, prefixes), names in zip(SECTIONS, groups))
+        arrays = []
+        for column, row in enumerate(self.array_templates, 1):
+            table = np.array([snapshot[column] for snapshot in snapshots],
+                             dtype=float)
+            arrays.append('{' + ',\n      '.join(
+                row % tuple(values) for values in table.tolist()) + '}')
+        first = snapshots[0].name if snapshots else ''
+        last = snapshots[-1].name if snapshots else ''
+        return ''.join([
+            'record %s\n //Power flow results for the snapshots %s to %s'
+            '\n \n' % (record, first, last),
+            'extends Modelica.Icons.Record; \n',
+            'constant String hours[%d] = {%s};\n'
+            % (count, ', '.join('"%s"' % snapshot.name
+                                 for snapshot in snapshots)),
+            template % tuple(arrays),
+            'Voltages voltages;\nMachines machines;\nLoads loads;\n'
+            'Trafos trafos;\nend %s;' % record])
+
+    def write(self, workdir, snapshots):
+        """Write every snapshot to workdir/<name>.mo.
+        Args:
+            workdir: Folder of the records, created when missing
+            snapshots: iterable of Snapshot
+        Output:
+            number of records written
+        """
+        if not os.access(workdir, os.F_OK):
+            os.mkdir(workdir)
+        count = 0
+        for snapshot in snapshots:
+            with open(os.path.join(workdir, '%s.mo' % snapshot.name),
+                      'w') as record_file:
+                record_file.write(self.render(snapshot))
+            count += 1
+        return count
+
+    def write_package(self, fname, package, snapshots):
+        """Write all snapshots as records of one Modelica package.
+
+        Each record is named after its snapshot, e.g. h0_after_PF.
+        Args:
+            fname: Name of the .mo file
+            package: Name of the package
+            snapshots: iterable of Snapshot
+        """
+        with open(fname, 'w') as package_file:
+            package_file.write('package %s\n' % package)
+            package_file.writelines(
+                self.render(snapshot, snapshot.name) + '\n'
+                for snapshot in snapshots)
+            package_file.write('end %s;\n' % package)
+
+    def write_table(self, fname, snapshots, record='PF_table'):
+        """Write all snapshots as one record of 2-D arrays, see
+        render_table.
+        Args:
+            fname: Name of the .mo file
+            snapshots: iterable of Snapshot
+            record: Name of the record
+        """
+        with open(fname, 'w') as record_file:
+            record_file.write(self.render_table(snapshots, record))
+
+
+def _names(first, second):
+    """Element names like 3000_1 from two columns."""
+    return [str(a) + '_' + str(b)
+            for a, b in zip(first.tolist(), second.tolist())]
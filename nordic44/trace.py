@@ -0,0 +1,247 @@
+"""Per-stage timing of the data set generation.
+
+The stages of data_from_nordpool and update_raw_files are wrapped in
+spans. While tracing is off, span returns one shared object doing nothing
+and count returns at once, so the hooks cost a function call. With
+enable every span writes one json line to the trace file when it ends:
+
+    {"stage": "solve", "date": "2016-01-01", "hour": 3, "wall": 0.012,
+     "cpu": 0.011, "iterations": 4, "mismatch": 0.02}
+
+wall and cpu are the wall clock and process times in seconds. Fields set
+with context, like the date, are added to all spans inside it, and
+counters like the bytes written are added to the innermost open span.
+
+The summary of a trace shows where a run spent its time:
+
+    python -m nordic44.trace trace.jsonl
+    python -m nordic44.trace trace.jsonl --by date
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict
+
+_TRACER = None
+
+
+class Tracer(object):
+    """Writer of a json lines trace file.
+
+    Args:
+        fname: Name of the trace file, lines are appended
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.out = open(fname, "a")
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def stack(self):
+        """Open spans and contexts of the current thread."""
+        if not hasattr(self.local, "stack"):
+            self.local.stack = [dict()]
+        return self.local.stack
+
+    def emit(self, record):
+        """Write one record as a line."""
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            self.out.write(line)
+            self.out.flush()
+
+    def close(self):
+        """Close the trace file."""
+        self.out.close()
+
+
+class _Null(object):
+    """Span and context while tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NULL = _Null()
+
+
+class _Context(object):
+    """Fields added to all spans inside it."""
+
+    def __init__(self, tracer, fields):
+        self.tracer = tracer
+        self.fields = fields
+
+    def __enter__(self):
+        stack = self.tracer.stack()
+        inherited = dict(stack[-1])
+        inherited.update(self.fields)
+        stack.append(inherited)
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.stack().pop()
+        return False
+
+    def set(self, **fields):
+        self.tracer.stack()[-1].update(fields)
+
+
+class _Span(_Context):
+    """Timed stage, written to the trace when it ends."""
+
+    def __enter__(self):
+        _Context.__enter__(self)
+        self.tracer.stack()[-1]["_counters"] = dict()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        fields = self.tracer.stack().pop()
+        counters = fields.pop("_counters")
+        record = OrderedDict([("stage", self.stage)])
+        record.update(fields)
+        record["wall"] = wall
+        record["cpu"] = cpu
+        record.update(counters)
+        if kind is not None:
+            record["error"] = kind.__name__
+        self.tracer.emit(record)
+        return False
+
+
+def enable(fname):
+    """Start writing spans to a trace file.
+    Args:
+        fname: Name of the json lines file, lines are appended
+    Output:
+        Tracer
+    """
+    global _TRACER
+    disable()
+    _TRACER = Tracer(fname)
+    return _TRACER
+
+
+def disable():
+    """Stop tracing and close the trace file."""
+    global _TRACER
+    if _TRACER is not None:
+        _TRACER.close()
+        _TRACER = None
+
+
+def enabled():
+    """If spans are written."""
+    return _TRACER is not None
+
+
+def span(stage, **fields):
+    """Context manager timing a stage.
+    Args:
+        stage: Name of the stage, e.g. fetch, map, solve or raw
+        fields: Fields of the record, e.g. hour=3
+    """
+    if _TRACER is None:
+        return _NULL
+    timed = _Span(_TRACER, fields)
+    timed.stage = stage
+    return timed
+
+
+def context(**fields):
+    """Context manager adding fields, e.g. the date, to the spans inside
+    it."""
+    if _TRACER is None:
+        return _NULL
+    return _Context(_TRACER, fields)
+
+
+def count(name, value=1):
+    """Add to a counter of the innermost open span, e.g. bytes."""
+    if _TRACER is None:
+        return
+    counters = _TRACER.stack()[-1].get("_counters")
+    if counters is not None:
+        counters[name] = counters.get(name, 0) + value
+
+
+def read_trace(fname):
+    """Records of a trace file, damaged lines are skipped."""
+    records = []
+    with open(fname) as trace:
+        for line in trace:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+    return records
+
+
+def summarize(records, by=None):
+    """Totals of the records per stage.
+    Args:
+        records: list of records, see read_trace
+        by: Field to group by as well, e.g. date or hour
+    Output:
+        list of (stage, group, totals) with count, wall, cpu, bytes,
+        iterations and the largest mismatch
+    """
+    groups = OrderedDict()
+    for record in records:
+        key = (record["stage"], record.get(by) if by else None)
+        totals = groups.setdefault(key, {"count": 0, "wall": 0.0,
+                                         "cpu": 0.0, "bytes": 0,
+                                         "iterations": 0, "mismatch": None})
+        totals["count"] += 1
+        totals["wall"] += record.get("wall", 0.0)
+        totals["cpu"] += record.get("cpu", 0.0)
+        totals["bytes"] += record.get("bytes", 0)
+        totals["iterations"] += record.get("iterations", 0)
+        if record.get("mismatch") is not None:
+            totals["mismatch"] = max(totals["mismatch"] or 0.0,
+                                     record["mismatch"])
+    return [(stage, group, totals)
+            for (stage, group), totals in groups.items()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Summarize a trace of the data set generation")
+    parser.add_argument("trace", help="json lines trace file")
+    parser.add_argument("--by", help="also group by a field, e.g. date")
+    args = parser.parse_args(argv)
+
+    rows = summarize(read_trace(args.trace), args.by)
+    # Spans are nested in the day spans, which give the total when present
+    days = [totals["wall"] for stage, _, totals in rows if stage == "day"]
+    total = (sum(days) if days else
+             sum(totals["wall"] for _, _, totals in rows)) or 1.0
+    header = "%-14s %-12s %7s %10s %10s %6s %10s %8s %10s" % (
+        "stage", args.by or "", "count", "wall [s]", "cpu [s]", "share",
+        "MB", "iter", "mismatch")
+    print(header)
+    print("-"*len(header))
+    for stage, group, totals in sorted(rows, key=lambda row: -row[2]["wall"]):
+        print("%-14s %-12s %7d %10.3f %10.3f %5.1f%% %10.2f %8d %10s" % (
+            stage, "" if group is None else group, totals["count"],
+            totals["wall"], totals["cpu"], 100*totals["wall"]/total,
+            totals["bytes"]/1e6, totals["iterations"],
+            "" if totals["mismatch"] is None else
+            "%.4f" % totals["mismatch"]))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
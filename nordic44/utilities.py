@@ -1,61 +1,318 @@
 """Read data from Nordpool and store it in various formats."""
 import os
+import traceback
+from collections import namedtuple
 from datetime import timedelta
-from nordic44.nordpool import NordPool
+from nordic44 import trace
+from nordic44.nordpool import NordPool, FtpFetcher
+from nordic44.manifest import (RunManifest, day_entry, pending_hours,
+                               finish_entry)
+
+# Ftp session of a pool worker
+_FETCHER = None
+
+# Outcome of one date in data_from_nordpool, error is None on success.
+# status is done, partial (some hours did not converge), skipped or failed
+DayResult = namedtuple("DayResult", "date, error, status")
+
+RECORD_FORMATS = ["scalar", "array", "table"]
+
 
 def data_from_nordpool(start_date, user, passwd, out_dir=None, end_date=None,
-                       records=False, psse=True):
-    """The main function."""
+                       records=False, psse=True, backend="psse", batch=False,
+                       workers=None, cache_dir=None, offline=False,
+                       record_format="scalar", snapshot_dir=None,
+                       only_failed=False, trace_file=None, raw_archive=None):
+    """The main function.
+
+    The run is recorded in manifest.json in out_dir, see
+    nordic44.manifest. Running again into the same out_dir skips the days
+    that are done with unchanged market data and settings and processes
+    the other days again. With only_failed only the hours that did not
+    converge and the days that failed are processed again. Like in a full
+    run, a processed hour starts from the solution of the hour before it,
+    read from its raw file when that hour is not processed again.
+
+    With snapshot_dir every solved hour is appended to the
+    snapshots.SnapshotStore in that folder, named like N44_20160101_h0.
+    The days are then processed in order, so it cannot be combined with
+    workers.
+
+    Records are written with scalar parameters like Record, with array
+    parameters, or as one table record of all hours per day, see
+    torecord.RecordWriter.
+
+    With the native backend every day is warm started from the last
+    solution of the previous day. Without batch the hours of a day build
+    on each other, every hour is mapped on the solved case of the previous
+    one. batch solves the hours of a day together, all mapped on the base
+    case and started from the same voltages, see N44.update_raw_files, so
+    its results differ from the sequential ones.
+
+    All days share one ftp session and every weekly file is downloaded
+    once, the files of all days concurrently before the first day. With
+    cache_dir the files are kept on disk for later runs, in offline mode
+    the data only comes from that cache.
+
+    With workers the days are farmed out to a pool of that many processes.
+    Every day then runs with its own power flow session and with its own
+    output directory as working directory, days are not warm started from
+    each other, and a failing day is reported without stopping the others.
+
+    With trace_file the time, iterations and bytes written of every stage
+    of every day and hour are appended to that json lines file, see
+    nordic44.trace, also by the workers.
+
+    With raw_archive the raw files of every processed day are also added
+    to the rawarchive.RawArchive in that folder, which stores them as
+    differences to the base case.
+    Output:
+        list of DayResult in date order
+    """
+    if record_format not in RECORD_FORMATS:
+        raise ValueError("Unknown record format " + str(record_format))
+    if snapshot_dir and workers:
+        raise ValueError("A snapshot store is filled by one process, "
+                         "do not use it with workers")
     if not end_date:
         end_date = start_date
 
     cwd = os.getcwd()
     if not out_dir:
         out_dir = cwd
-    
-    # I know there should be no imports here,
-    # but it is a simple hack to run under linux
-    if psse:
+    out_dir = os.path.abspath(out_dir)
+
+    raw_dir = os.path.join(out_dir, "PSSE_Resources")
+    if not os.path.isdir(raw_dir):
+        os.makedirs(raw_dir)
+    record_dir = os.path.join(out_dir, "Records")
+    if psse and records and not os.path.isdir(record_dir):
+        os.mkdir(record_dir)
+    manifest = RunManifest(os.path.join(out_dir, "manifest.json"))
+
+    dates = [start_date + timedelta(i)
+             for i in range((end_date-start_date).days + 1)]
+    options = dict(user=user, passwd=passwd, raw_dir=raw_dir,
+                   record_dir=record_dir, records=records, psse=psse,
+                   backend=backend, batch=batch, record_format=record_format,
+                   only_failed=only_failed)
+    if trace_file:
+        trace_file = os.path.abspath(trace_file)
+        trace.enable(trace_file)
+    archive = None
+    if raw_archive and psse:
+        from nordic44.rawarchive import RawArchive
+        archive = RawArchive(raw_archive)
+
+    results = []
+    if workers:
+        from concurrent.futures import ProcessPoolExecutor
+        try:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=_pool_init,
+                                     initargs=(user, passwd, cache_dir,
+                                               offline, trace_file)) as pool:
+                futures = [pool.submit(_pool_day, date,
+                                       dict(options,
+                                            previous=manifest.day(date)))
+                           for date in dates]
+                for date, future in zip(dates, futures):
+                    try:
+                        entry, error = future.result()
+                    except Exception:
+                        # e.g. BrokenProcessPool after a worker died, the
+                        # days of the pool are failed, not the whole run
+                        entry, error = None, traceback.format_exc()
+                    if error:
+                        print("Failed " + date.strftime("%Y-%m-%d") + "\n" +
+                              error)
+                    elif entry is not None:
+                        _archive_day(archive, raw_dir, date)
+                    results.append(_record_day(manifest, date, entry, error))
+        finally:
+            trace.disable()
+        return results
+
+    store = None
+    if snapshot_dir and psse:
+        from nordic44.snapshots import SnapshotStore
+        store = SnapshotStore(snapshot_dir)
+    fetcher = FtpFetcher(user, passwd, cache_dir=cache_dir, offline=offline)
+    last_voltage = None
+    try:
+        with trace.span("prefetch"):
+            fetcher.prefetch(dates)
+        for date in dates:
+            try:
+                with trace.context(date=date.strftime("%Y-%m-%d")), \
+                        trace.span("day"):
+                    entry, voltage = process_day(date, v0=last_voltage,
+                                                 fetcher=fetcher, store=store,
+                                                 previous=manifest.day(date),
+                                                 **options)
+            except Exception:
+                _record_day(manifest, date, None, traceback.format_exc())
+                raise
+            if voltage is not None:
+                last_voltage = voltage
+            if entry is not None:
+                _archive_day(archive, raw_dir, date)
+            results.append(_record_day(manifest, date, entry, None))
+    finally:
+        fetcher.close()
+        trace.disable()
+    return results
+
+
+def _archive_day(archive, raw_dir, date):
+    """Add the raw files of a day to the raw archive, if any."""
+    if archive is None:
+        return
+    with trace.context(date=date.strftime("%Y-%m-%d")), \
+            trace.span("archive"):
+        archive.add_day(os.path.join(raw_dir,
+                                     "N44_" + date.strftime("%Y%m%d")),
+                        date)
+
+
+def _record_day(manifest, date, entry, error):
+    """Write the outcome of a day to the manifest.
+    Output:
+        DayResult
+    """
+    previous = manifest.day(date)
+    if error:
+        entry = dict(previous or dict(), status="failed", error=error)
+    elif entry is None:
+        return DayResult(date, None, "skipped")
+    manifest.update(date, entry)
+    return DayResult(date, error, entry["status"])
+
+
+def process_day(date, user, passwd, raw_dir, record_dir, records=False,
+                psse=True, backend="psse", batch=False, v0=None,
+                isolate=False, fetcher=None, record_format="scalar",
+                store=None, previous=None, only_failed=False):
+    """Fetch, map and store the data of one day.
+    Args:
+        date: The date to process
+        user, passwd: Nordpool ftp login
+        raw_dir: Folder of the daily excel and raw folders
+        record_dir: Folder of the daily record folders
+        records, psse, backend, batch, record_format: see
+            data_from_nordpool
+        v0: Start voltages of the first hour for the native backend
+        isolate: Run with the daily folder as working directory, so files
+            written to the working directory do not clash between days
+        fetcher: FtpFetcher shared between days
+        store: SnapshotStore receiving the solved hours
+        previous: Manifest entry of an earlier run of the day, see
+            manifest.pending_hours for what is processed again
+        only_failed: Only solve the hours that failed in previous
+    Output:
+        (manifest entry, last solved voltages of the native backend or
+        None), the entry is None if the day was skipped
+    """
+    dir_str = "N44_" + date.strftime("%Y%m%d")
+    tmp_raw = os.path.join(raw_dir, dir_str)
+    if not os.path.isdir(tmp_raw):
+        os.makedirs(tmp_raw)
+    cwd = os.getcwd()
+    if isolate:
+        os.chdir(tmp_raw)
+    try:
+        nord = NordPool(date)
+        with trace.span("fetch"):
+            nord.read_data_from_ftp(user, passwd, fetcher)
+        settings = dict(psse=psse, backend=backend, batch=batch,
+                        records=records, record_format=record_format)
+        entry = day_entry(nord.data, settings)
+        hours = pending_hours(previous, entry, only_failed)
+        if not hours:
+            return None, None
+        retry = len(hours) < 24
+        if not retry:
+            with trace.span("excel_input"):
+                nord.write_data_to_excel(tmp_raw)
+
+        if not psse:
+            return finish_entry(entry, previous, dict()), None
+
+        # Solutions of earlier runs of the hours must not survive a failure
+        for hour in hours:
+            fname = os.path.join(tmp_raw, "h" + str(hour) + "_after_PF.raw")
+            if os.path.exists(fname):
+                os.remove(fname)
+
+        # I know there should be no imports here,
+        # but it is a simple hack to run under linux
         from nordic44.n44 import N44
-        raw_dir = os.path.join(out_dir, "PSSE_Resources")
-        os.mkdir(raw_dir)
+        n44 = N44(nord.data)
+        n44.update_raw_files(
+            out_dir=tmp_raw, backend=backend, batch=batch,
+            v0=v0, store=store, prefix=dir_str + "_",
+            start_dir=tmp_raw if retry else None,
+            hours=hours, raw_files="deferred",
+            excel_name="PSSE_in_out_retry.xlsx" if retry else
+            "PSSE_in_out.xlsx")
         if records:
-            from nordic44.readraw import Reader
-            from nordic44.torecord import Record
-            record_dir = os.path.join(out_dir, "Records")
-            os.mkdir(record_dir)
-                    
-    for i in range((end_date-start_date).days + 1):
-        date = start_date + timedelta(i)
-        date_str = date.strftime("%Y%m%d")
+            with trace.span("records"):
+                _write_records(tmp_raw, os.path.join(record_dir, dir_str),
+                               dir_str, record_format)
+        entry = finish_entry(entry, previous, n44.flags)
+        return entry, None if retry else n44.last_voltage
+    finally:
+        os.chdir(cwd)
 
-        dir_str = "N44_" + date_str
 
-        nord = NordPool(date)
+def _write_records(raw_dir, day_dir, name, record_format):
+    """Write the records of the raw files of a day.
+    Args:
+        raw_dir: Folder of the raw files of the day
+        day_dir: Folder of the records of the day
+        name: Name of the table record, N44_YYYYMMDD
+        record_format: see data_from_nordpool
+    """
+    from nordic44.rawcase import Reader, read_raw
+    from nordic44.torecord import RecordWriter
+    lista = Reader(raw_dir).get_list_of_raw_files()
+    if not lista:
+        return
+    cases = [read_raw(raw) for raw in lista]
+    writer = RecordWriter.for_case(cases[0],
+                                   arrays=record_format != "scalar")
+    if record_format == "table":
+        # The solved hours in hour order
+        solved = sorted(
+            (case for case in cases if case.name.endswith("_after_PF")),
+            key=lambda case: int(case.name[1:].split("_")[0]))
+        if not os.path.isdir(day_dir):
+            os.mkdir(day_dir)
+        writer.write_table(os.path.join(day_dir, name + ".mo"),
+                           (writer.snapshot(case) for case in solved), name)
+    else:
+        writer.write(day_dir, (writer.snapshot(case) for case in cases))
+
+
+def _pool_init(user, passwd, cache_dir, offline, trace_file=None):
+    """Give a pool worker its own ftp session and trace."""
+    global _FETCHER
+    _FETCHER = FtpFetcher(user, passwd, cache_dir=cache_dir, offline=offline)
+    if trace_file:
+        trace.enable(trace_file)
+
 
-        nord.read_data_from_ftp(user, passwd)
-        
-        tmp_raw = os.path.join(raw_dir, dir_str)
-        os.mkdir(tmp_raw)
-        nord.write_data_to_excel(tmp_raw)
-
-        if psse:
-            n44 = N44(nord.data)
-
-            n44.update_raw_files(out_dir=tmp_raw)
-            if records:
-                reader = Reader(tmp_raw)
-                lista = reader.get_list_of_raw_files()
-                tmp_record_dir = os.path.join(record_dir, dir_str)
-                for raw in lista:
-                    reader.open_raw(raw)
-                    reader.read_raw()
-                    record = Record(tmp_record_dir,
-                                    reader.case_name,
-                                    reader.buses, reader.machines,
-                                    reader.loads, reader.trafos)
-                    record.write_voltages()
-                    record.write_machines()
-                    record.write_loads()
-                    record.write_trafos()
-                    record.close_record()
\ No newline at end of file
+def _pool_day(date, options):
+    """Process a day in a pool worker.
+    Output:
+        (manifest entry or None if skipped, None) on success, otherwise
+        (None, the traceback as text)
+    """
+    try:
+        with trace.context(date=date.strftime("%Y-%m-%d")), \
+                trace.span("day"):
+            entry, _ = process_day(date, isolate=True, fetcher=_FETCHER,
+                                   **options)
+    except Exception:
+        return None, traceback.format_exc()
+    return entry, None
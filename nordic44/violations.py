@@ -0,0 +1,123 @@
+"""Limit violation checks on solved snapshots.
+
+The checks of update_raw_files work on the quantities of
+backend.limit_data, keyed by the PSS/E names PU, PGEN, PMAX, PMIN, QGEN,
+QMAX, QMIN, MVA, MBASE and PCTCORPRATEA/B/C. check_limits runs them on all
+elements and all hours at once, with a row per hour in every array, and
+returns one table row per violation. store_limits collects the same
+quantities from a snapshots.SnapshotStore, so stored runs can be checked
+without PSS/E.
+"""
+import numpy as np
+
+# One row per violation. margin is the distance to the limit, zero or
+# negative for a violation
+VIOLATION_FIELDS = [("hour", "i4"), ("element", "U32"), ("quantity", "U16"),
+                    ("value", "f8"), ("limit", "f8"), ("margin", "f8")]
+
+# Quantity, limit, element group, upper limit, violated at the limit
+CHECKS = [("PU", "VMIN", "buses", False, False),
+          ("PU", "VMAX", "buses", True, False),
+          ("PGEN", "PMIN", "machines", False, True),
+          ("PGEN", "PMAX", "machines", True, True),
+          ("QGEN", "QMIN", "machines", False, True),
+          ("QGEN", "QMAX", "machines", True, True),
+          ("MVA", "MBASE", "machines", True, True),
+          ("PCTCORPRATEA", "RATEA", "branches", True, True),
+          ("PCTCORPRATEB", "RATEB", "branches", True, True),
+          ("PCTCORPRATEC", "RATEC", "branches", True, True)]
+
+
+def check_limits(data, names=None, hours=None, vmin=0.95, vmax=1.05,
+                 max_loading=100.0):
+    """Find the limit violations of solved snapshots.
+
+    Bus voltages outside [vmin, vmax] are violations, machine outputs and
+    MVA loadings and branch loadings are violations when they reach their
+    limit.
+    Args:
+        data: dictionary like backend.limit_data, the quantities are
+            (hour, element) arrays or 1-D arrays for a single hour, the
+            machine limits may be 1-D for all hours
+        names: dictionary from buses, machines and branches to element
+            names, default the element positions
+        hours: hour of every row, default 0, 1, ...
+        vmin, vmax: Bus voltage limits in pu
+        max_loading: Branch loading limit in percent of the rates
+    Output:
+        numpy record array with VIOLATION_FIELDS, ordered by hour
+    """
+    names = names or dict()
+    limits = dict(data)
+    limits["VMIN"] = vmin
+    limits["VMAX"] = vmax
+    for rate in "ABC":
+        limits["RATE" + rate] = max_loading
+    parts = []
+    for quantity, limit, group, upper, inclusive in CHECKS:
+        if quantity not in data:
+            continue
+        values = np.atleast_2d(np.asarray(data[quantity], dtype=float))
+        bound = np.broadcast_to(np.asarray(limits[limit], dtype=float),
+                                values.shape)
+        margin = bound - values if upper else values - bound
+        hit = margin <= 0 if inclusive else margin < 0
+        row, column = np.nonzero(hit)
+        part = np.zeros(len(row), dtype=VIOLATION_FIELDS)
+        part["hour"] = row if hours is None else np.asarray(hours)[row]
+        elements = names.get(group)
+        if elements is None:
+            part["element"] = column
+        else:
+            part["element"] = np.asarray(elements, dtype=str)[column]
+        part["quantity"] = quantity
+        part["value"] = values[row, column]
+        part["limit"] = bound[row, column]
+        part["margin"] = margin[row, column]
+        parts.append(part)
+    table = np.concatenate(parts) if parts else np.zeros(
+        0, dtype=VIOLATION_FIELDS)
+    return table[np.argsort(table["hour"], kind="stable")].view(np.recarray)
+
+
+def store_limits(store, case, hours=None):
+    """Quantities of check_limits for the snapshots of a store.
+    Args:
+        store: snapshots.SnapshotStore
+        case: RawCase of the network with the machine limits and the
+            branch rates, e.g. the base case
+        hours: positions of the snapshots, default all
+    Output:
+        (data, names) for check_limits
+    """
+    # I know there should be no imports here,
+    # but PSS/E users do not need scipy
+    from nordic44.powerflow import element_admittances
+    select = slice(None) if hours is None else hours
+
+    def rows(quantity):
+        return np.asarray(store.array(quantity)[select])
+
+    gen = case.generator
+    vm = rows("voltage")
+    pgen = rows("machine_p")
+    qgen = rows("machine_q")
+    position = dict((name, i) for i, name in
+                    enumerate(store.groups["buses"]))
+    elements = element_admittances(case)
+    f = np.array([position[str(bus)] for bus in elements["from"].tolist()],
+                 dtype=int)
+    t = np.array([position[str(bus)] for bus in elements["to"].tolist()],
+                 dtype=int)
+    current = np.maximum(
+        np.hypot(rows("branch_pf"), rows("branch_qf"))/vm[:, f],
+        np.hypot(rows("branch_pt"), rows("branch_qt"))/vm[:, t])
+    data = {"PU": vm, "PGEN": pgen, "PMAX": gen["pt"], "PMIN": gen["pb"],
+            "QGEN": qgen, "QMAX": gen["qt"], "QMIN": gen["qb"],
+            "MVA": np.hypot(pgen, qgen), "MBASE": gen["mbase"]}
+    for rate, rates in zip("ABC", elements["rates"]):
+        data["PCTCORPRATE" + rate] = np.where(
+            rates > 0, 100.0*current/np.where(rates > 0, rates, 1.0), 0.0)
+    names = dict((group, store.groups[group])
+                 for group in ("buses", "machines", "branches"))
+    return data, names
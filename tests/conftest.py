@@ -0,0 +1,124 @@
+"""Stand-in Nordpool ftp server for the tests, see pyftpdlib."""
+import os
+import time
+import threading
+import pytest
+
+pytest.importorskip("pyftpdlib")
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+from nordic44.nordpool import FILE_PREFIX, fix_digit
+
+USER = "user"
+PASSWD = "secret"
+
+# Market areas of the weekly files of each country
+AREAS = {"Norway": ["NO1", "NO2", "NO3", "NO4", "NO5"],
+         "Sweden": ["SE1", "SE2", "SE3", "SE4"],
+         "Finland": ["FI"]}
+AREAS_ORDER = [area for country in ("Norway", "Sweden", "Finland")
+               for area in AREAS[country]]
+
+
+def hour_value(code, area, weekday, hour):
+    """Value of an hour in the files written by write_week, telling the
+    code, area, weekday and hour apart."""
+    return (["PS", "FB", "UT"].index(code)*100000 +
+            (AREAS_ORDER.index(area) + 1)*1000 + weekday*100 + hour)
+
+
+def write_week(root, country, year, week, folders=None):
+    """Write a synthetic weekly operating data file.
+    Args:
+        root: Folder served by the ftp server
+        country: Norway, Sweden or Finland
+        year, week: ISO year and week of the file
+        folders: Folders below Operating_data, default the country
+    Output:
+        name of the written file
+    """
+    fname = (FILE_PREFIX[country] + fix_digit(str(year)[2:]) +
+             fix_digit(str(week)) + ".sdv")
+    directory = os.path.join(root, "Operating_data",
+                             *(folders or [country]))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    lines = ["# Synthetic operating data",
+             "# Code;Type;Country;Date;Weekday;Week;Area;Hours;Sum"]
+    for weekday in range(1, 8):
+        for code in ("PS", "FB", "UT"):
+            for area in AREAS[country]:
+                values = [hour_value(code, area, weekday, hour)
+                          for hour in range(24)]
+                lines.append(";".join(
+                    [code, code[0], country[:2].upper(), "", str(weekday),
+                     str(week), area] + [str(value) for value in values] +
+                    [str(sum(values)), ""]))
+    with open(os.path.join(directory, fname), "w", newline="") as out:
+        out.write("\r\n".join(lines) + "\r\n")
+    return fname
+
+
+class Server(object):
+    """Threaded ftp server on localhost serving a folder.
+
+    Args:
+        root: Folder served, holding Operating_data
+        latency: Seconds every command waits before it is handled
+
+    The files downloaded are kept in retrieved, as paths below
+    Operating_data.
+    """
+
+    def __init__(self, root, latency=0.0):
+        authorizer = DummyAuthorizer()
+        authorizer.add_user(USER, PASSWD, root, perm="elr")
+        self.retrieved = []
+        self.latency = latency
+        server = self
+
+        class Handler(FTPHandler):
+            def process_command(self, cmd, *args, **kwargs):
+                if server.latency:
+                    time.sleep(server.latency)
+                if cmd == "RETR":
+                    # pyftpdlib passes the file system path
+                    server.retrieved.append(os.path.relpath(
+                        args[0], os.path.join(root, "Operating_data")
+                    ).replace(os.sep, "/"))
+                return FTPHandler.process_command(self, cmd, *args,
+                                                  **kwargs)
+
+        Handler.authorizer = authorizer
+        self.server = ThreadedFTPServer(("127.0.0.1", 0), Handler)
+        self.host, self.port = self.server.address[:2]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={"timeout": 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.close_all()
+        self.thread.join(5)
+
+
+@pytest.fixture
+def ftp_server(tmp_path):
+    """Start stand-in servers with start(latency=0.0), the files are
+    written to root with write_week."""
+    servers = []
+
+    class Factory(object):
+        root = str(tmp_path / "ftp")
+
+        def start(self, latency=0.0):
+            if not os.path.isdir(self.root):
+                os.makedirs(self.root)
+            servers.append(Server(self.root, latency))
+            return servers[-1]
+
+    yield Factory()
+    for server in servers:
+        server.close()
@@ -0,0 +1,86 @@
+"""Concurrent download of the weekly files against a stand-in ftp server
+with latency, see conftest."""
+import time
+import asyncio
+import ftplib
+from datetime import date, timedelta
+from conftest import USER, PASSWD, write_week
+from nordic44.asyncftp import fetch_weeks
+from nordic44.nordpool import FtpFetcher, week_file, split_weekdays
+
+COUNTRIES = ("Norway", "Sweden", "Finland")
+
+
+def week_files(weeks):
+    """(key, file name, folders) of the files of the first weeks of 2016,
+    written to root by the caller."""
+    files = []
+    for week in range(1, weeks + 1):
+        for country in COUNTRIES:
+            fname, folders = week_file(country, date(2016, 1, 4) +
+                                       timedelta(7*(week - 1)))
+            files.append(("/".join(folders + [fname]), fname, folders))
+    return files
+
+
+def as_lists(days):
+    """Weekday rows of split_weekdays with the values as lists."""
+    return dict((weekday, [(code, area, list(values))
+                           for code, area, values in rows])
+                for weekday, rows in days.items())
+
+
+def serve_weeks(ftp_server, weeks, latency=0.0):
+    for week in range(1, weeks + 1):
+        for country in COUNTRIES:
+            write_week(ftp_server.root, country, 2016, week)
+    return ftp_server.start(latency), week_files(weeks)
+
+
+def test_concurrent_download_hides_the_latency(ftp_server):
+    server, files = serve_weeks(ftp_server, 4, latency=0.02)
+
+    start = time.time()
+    fetcher = FtpFetcher(USER, PASSWD, host=server.host, port=server.port)
+    try:
+        sequential = dict(
+            (key, as_lists(split_weekdays(fetcher.fetch(fname, folders))))
+            for key, fname, folders in files)
+    finally:
+        fetcher.close()
+    sequential_time = time.time() - start
+
+    start = time.time()
+    results, errors = fetch_weeks(files, server.host, USER, PASSWD,
+                                  port=server.port, parallel=4)
+    concurrent_time = time.time() - start
+
+    assert not errors
+    assert dict((key, as_lists(days))
+                for key, (days, _) in results.items()) == sequential
+    # Every command waits for the latency, four sessions wait together
+    print("sequential %.2f s, concurrent %.2f s" % (sequential_time,
+                                                    concurrent_time))
+    assert concurrent_time < 0.5*sequential_time
+
+
+def test_missing_file_is_reported(ftp_server):
+    server, files = serve_weeks(ftp_server, 1)
+    files.append(("Norway/pono1699.sdv", "pono1699.sdv", ["Norway"]))
+    results, errors = fetch_weeks(files, server.host, USER, PASSWD,
+                                  port=server.port, parallel=2, backoff=0.01)
+    assert sorted(results) == sorted(key for key, _, _ in files[:-1])
+    assert list(errors) == ["Norway/pono1699.sdv"]
+    assert isinstance(errors["Norway/pono1699.sdv"], ftplib.error_perm)
+
+
+def test_inside_a_running_event_loop(ftp_server):
+    server, files = serve_weeks(ftp_server, 1)
+
+    async def notebook_cell():
+        return fetch_weeks(files, server.host, USER, PASSWD,
+                           port=server.port)
+
+    results, errors = asyncio.run(notebook_cell())
+    assert not errors
+    assert sorted(results) == sorted(key for key, _, _ in files)
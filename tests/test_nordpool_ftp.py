@@ -0,0 +1,114 @@
+"""FtpFetcher against a stand-in ftp server, see conftest."""
+import ftplib
+from datetime import date
+import pytest
+from conftest import USER, PASSWD, write_week, hour_value
+from nordic44.nordpool import FtpFetcher, NordPool, week_file
+
+
+def fetcher_for(server, **options):
+    return FtpFetcher(USER, PASSWD, host=server.host, port=server.port,
+                      **options)
+
+
+def write_weeks(root, weeks):
+    """Weekly files of all countries, weeks as (ISO year, week)."""
+    for country in ("Norway", "Sweden", "Finland"):
+        for year, week in weeks:
+            folders = [country] + ([str(year)] if year < 2016 else [])
+            write_week(root, country, year, week, folders)
+
+
+def assert_day(nord, day):
+    """The data of a NordPool object is the one of its weekday."""
+    weekday = day.isoweekday()
+    values = nord.data["NO"]["PS"]["NO1"]
+    assert values[:24].tolist() == [hour_value("PS", "NO1", weekday, hour)
+                                    for hour in range(24)]
+    assert nord.data["FI"]["UT"]["FI"][5] == hour_value("UT", "FI",
+                                                        weekday, 5)
+
+
+def test_week_file_folder_of_iso_year():
+    # 28 Dec 2015 to 3 Jan 2016 are week 53 of 2015
+    for day in (date(2015, 12, 28), date(2015, 12, 31), date(2016, 1, 3)):
+        assert week_file("Norway", day) == ("pono1553.sdv",
+                                            ["Norway", "2015"])
+    assert week_file("Sweden", date(2016, 1, 4)) == ("pose1601.sdv",
+                                                     ["Sweden"])
+    # 29 Dec 2014 is in week 1 of 2015
+    assert week_file("Finland", date(2014, 12, 29)) == ("pofi1501.sdv",
+                                                        ["Finland", "2015"])
+
+
+def test_days_across_the_year_boundary(ftp_server):
+    write_weeks(ftp_server.root, [(2015, 53), (2016, 1)])
+    server = ftp_server.start()
+    fetcher = fetcher_for(server)
+    days = [date(2015, 12, 30), date(2015, 12, 31), date(2016, 1, 1),
+            date(2016, 1, 4)]
+    try:
+        for day in days:
+            nord = NordPool(day)
+            nord.read_data_from_ftp(USER, PASSWD, fetcher)
+            assert_day(nord, day)
+    finally:
+        fetcher.close()
+    # Every weekly file is downloaded once
+    assert sorted(server.retrieved) == [
+        "Finland/2015/pofi1553.sdv", "Finland/pofi1601.sdv",
+        "Norway/2015/pono1553.sdv", "Norway/pono1601.sdv",
+        "Sweden/2015/pose1553.sdv", "Sweden/pose1601.sdv"]
+
+
+def test_missing_file_keeps_the_session_usable(ftp_server):
+    write_week(ftp_server.root, "Norway", 2016, 1)
+    server = ftp_server.start()
+    fetcher = fetcher_for(server)
+    try:
+        with pytest.raises(ftplib.error_perm):
+            fetcher.rows("Sweden", date(2016, 1, 5))
+        rows = fetcher.rows("Norway", date(2016, 1, 5))
+    finally:
+        fetcher.close()
+    assert ("PS", "NO1", hour_value("PS", "NO1", 2, 0)) in [
+        (code, area, values[0]) for code, area, values in rows]
+
+
+def test_unfinished_download_keeps_the_session_usable(ftp_server):
+    write_weeks(ftp_server.root, [(2016, 1), (2016, 2)])
+    server = ftp_server.start()
+    fetcher = fetcher_for(server)
+    try:
+        lines = fetcher.retrieve("pono1601.sdv", ["Norway"])
+        next(lines)
+        lines.close()
+        content = list(fetcher.retrieve("pose1602.sdv", ["Sweden"]))
+    finally:
+        fetcher.close()
+    assert len(content) == 2 + 7*3*4
+
+
+def test_prefetch_and_cache(ftp_server, tmp_path):
+    write_weeks(ftp_server.root, [(2015, 53), (2016, 1)])
+    server = ftp_server.start()
+    cache_dir = str(tmp_path / "cache")
+    days = [date(2015, 12, 31), date(2016, 1, 2), date(2016, 1, 6)]
+    fetcher = fetcher_for(server, cache_dir=cache_dir)
+    try:
+        assert fetcher.prefetch(days) == 6
+        for day in days:
+            nord = NordPool(day)
+            nord.read_data_from_ftp(USER, PASSWD, fetcher)
+            assert_day(nord, day)
+    finally:
+        fetcher.close()
+    assert len(server.retrieved) == 6
+
+    # Offline everything comes from the cache
+    fetcher = fetcher_for(server, cache_dir=cache_dir, offline=True)
+    for day in days:
+        nord = NordPool(day)
+        nord.read_data_from_ftp(USER, PASSWD, fetcher)
+        assert_day(nord, day)
+    assert len(server.retrieved) == 6